@@ -0,0 +1,49 @@
+"""
+Run the benchmark suite from the repository root:
+
+    python -m code.benchmarks --output report.json
+    python -m code.benchmarks --quick --baseline report.json
+
+With a baseline the exit status is 1 when any measurement regressed.
+"""
+import argparse
+import sys
+from .cases import BENCHMARKS
+from .suite import GENERATIONS, REGRESSION_TOLERANCE, SIZES, compare_reports, load_report, run_benchmarks, save_report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m code.benchmarks', description="Benchmark the CA model.")
+    parser.add_argument('--cases', nargs='+', choices=list(BENCHMARKS), help="cases to run, all by default")
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES), help="grid sizes")
+    parser.add_argument('--generations', nargs='+', type=int, default=list(GENERATIONS), help="generation counts")
+    parser.add_argument('--repeats', type=int, default=3, help="repeats per measurement, the best is kept")
+    parser.add_argument('--quick', action='store_true', help="only sizes 51 and 101 and 5 generations")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="compare with this JSON report and flag regressions")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    sizes, generations = ((51, 101), (5,)) if args.quick else (args.sizes, args.generations)
+    report = run_benchmarks(args.cases, sizes, generations, args.repeats)
+    for case, exponent in report['scaling'].items():
+        if exponent is not None:
+            print(f"{case:45s} scales as work^{exponent:.2f}")
+    if args.output:
+        save_report(report, args.output)
+
+    if args.baseline:
+        comparison = compare_reports(report, load_report(args.baseline), args.tolerance)
+        for entry in comparison['improvements']:
+            print(f"faster  {entry['case']} size {entry['size']} generations {entry['generations']}: "
+                  f"x{1 / entry['ratio']:.2f}")
+        for entry in comparison['regressions']:
+            print(f"SLOWER  {entry['case']} size {entry['size']} generations {entry['generations']}: "
+                  f"x{entry['ratio']:.2f}")
+        return 1 if comparison['regressions'] else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
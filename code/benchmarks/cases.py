@@ -0,0 +1,230 @@
+import csv
+import os
+import random
+import subprocess
+import sys
+import numpy as np
+from ..functions.ca_model import (CELL_N, CELL_C, CELL_E, CELL_D, STEP_ENGINES, get_engine, origin_distance,
+                                  store_history, to_chars)
+from ..functions.analyze import find_clusters, simulate_and_find_metastasis
+from ..functions.clusters import ClusterTracker, count_clusters
+from ..functions.read_data import read_history, read_matrix
+
+# Units of the work a case reports, to turn its time into a throughput
+CELL_UPDATES = 'cell-updates'
+CELLS = 'cells'
+ROWS_READ = 'rows'
+IMPORTS = 'imports'
+# The repository root, from which the package is importable as code.functions
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def tumor_grid(size, seed=0):
+    """
+    Build a representative grid: a disc of radius size / 4 around the centre holding a
+    mix of cancer, effector and dead cells, like a tumor after a few hundred generations.
+
+    Args:
+        - size: The number of rows and columns.
+        - seed: Seed of the mix of cell types.
+
+    Returns: The grid as uint8 cell codes.
+    """
+    rng = np.random.default_rng(seed)
+    r, c = np.ogrid[:size, :size]
+    disc = (r - size // 2) ** 2 + (c - size // 2) ** 2 <= (size / 4) ** 2
+    cells = rng.choice(np.array([CELL_C, CELL_E, CELL_D], dtype=np.uint8), size=(size, size), p=[0.6, 0.25, 0.15])
+    return np.where(disc, cells, CELL_N).astype(np.uint8)
+
+
+def step_case(engine):
+    """Benchmark case of one metastasis step of an engine on a grid of the given size."""
+    step = get_engine(engine, metastasis=True)
+
+    def case(size, generations, workdir):
+        # Warm up, so that compiling a kernel is not part of the measurement
+        step(tumor_grid(11), 0.74, 0.2, 11, 11, (5, 5), {})
+        M = tumor_grid(size)
+        origin = (size // 2, size // 2)
+
+        def run():
+            state = {}
+            grid = M
+            for _ in range(generations):
+                grid = step(grid, 0.74, 0.2, size, size, origin, state)
+        return run, size * size * generations, CELL_UPDATES
+    return case
+
+
+def growth_step_case(engine):
+    """Benchmark case of the growth step, simulate_tumor_growth_one_step, of an engine."""
+    step = get_engine(engine)
+
+    def case(size, generations, workdir):
+        # Warm up, so that compiling a kernel is not part of the measurement
+        step(tumor_grid(11), 0, 0, {}, 0.74, 0.2, {})
+        M = tumor_grid(size)
+
+        def run():
+            state, history = {}, {}
+            grid = M
+            for g in range(generations):
+                grid = step(grid, g, 0, history, 0.74, 0.2, state)
+        return run, size * size * generations, CELL_UPDATES
+    return case
+
+
+def store_history_case(size, generations, workdir):
+    """Benchmark case of store_history, which counts every cell type and the radius."""
+    M = tumor_grid(size)
+
+    def run():
+        history = {}
+        for g in range(generations):
+            store_history(g, M, history)
+    return run, size * size * generations, CELLS
+
+
+def origin_distance_case(size, generations, workdir):
+    """Benchmark case of origin_distance."""
+    M = tumor_grid(size)
+    origin = (size // 2, size // 2)
+
+    def run():
+        for _ in range(generations):
+            origin_distance(M, origin)
+    return run, size * size * generations, CELLS
+
+
+def find_clusters_case(size, generations, workdir):
+    """Benchmark case of the depth-first find_clusters."""
+    M = tumor_grid(size)
+
+    def run():
+        for _ in range(generations):
+            find_clusters(M, size, size)
+    return run, size * size * generations, CELLS
+
+
+def count_clusters_case(size, generations, workdir):
+    """Benchmark case of the union-find count_clusters, for comparison with find_clusters."""
+    M = tumor_grid(size)
+
+    def run():
+        for _ in range(generations):
+            count_clusters(M)
+    return run, size * size * generations, CELLS
+
+
+def growing_grids(size, generations, seed=0):
+    """
+    Build a sequence of grids in which a tumor_grid changes a little every generation:
+    size // 10 cells at its rim turn cancerous and as many inside it turn effector.
+
+    Returns: A list of generations + 1 grids, the first being tumor_grid(size).
+    """
+    rng = np.random.default_rng(seed)
+    grids = [tumor_grid(size, seed)]
+    for _ in range(generations):
+        grid = grids[-1].copy()
+        angles = rng.random((2, size // 10)) * 2 * np.pi
+        radii = np.stack([size / 4 + rng.random(size // 10) * 2, rng.random(size // 10) * size / 4])
+        r = np.clip((size // 2 + radii * np.sin(angles)).astype(int), 0, size - 1)
+        c = np.clip((size // 2 + radii * np.cos(angles)).astype(int), 0, size - 1)
+        grid[r[0], c[0]] = CELL_C
+        grid[r[1], c[1]] = CELL_E
+        grids.append(grid)
+    return grids
+
+
+def cluster_sequence_case(tracked):
+    """
+    Benchmark case of counting the clusters of every grid of growing_grids, with a
+    ClusterTracker or by relabelling each grid with count_clusters.
+    """
+    def case(size, generations, workdir):
+        grids = growing_grids(size, generations)
+
+        def run():
+            if tracked:
+                tracker = ClusterTracker(grids[0])
+                for grid in grids[1:]:
+                    tracker.update(grid)
+            else:
+                for grid in grids:
+                    count_clusters(grid)
+        return run, size * size * (generations + 1), CELLS
+    return case
+
+def metastasis_case(engine):
+    """Benchmark case of a whole simulate_and_find_metastasis run with an engine."""
+    def case(size, generations, workdir):
+        def run():
+            random.seed(42)
+            simulate_and_find_metastasis(generations, size, size, 0.74, 0.2, engine)
+        return run, size * size * generations, CELL_UPDATES
+    return case
+
+
+def read_history_case(size, generations, workdir):
+    """Benchmark case of read_history on a CSV file of `size` runs of `generations` rows."""
+    path = os.path.join(workdir, f'history_{size}_{generations}.csv')
+    if not os.path.exists(path):
+        with open(path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=['Nc', 'Ne', 'Nd', 'R', 'dense'])
+            writer.writeheader()
+            for i in range(size * generations):
+                writer.writerow({'Nc': i % 997, 'Ne': i % 101, 'Nd': i % 53, 'R': i / 7, 'dense': i % 2 == 0})
+
+    def run():
+        read_history([], path)
+    return run, size * generations, ROWS_READ
+
+
+def read_matrix_case(size, generations, workdir):
+    """Benchmark case of read_matrix on a CSV file of `generations` grids of size x size."""
+    path = os.path.join(workdir, f'matrices_{size}_{generations}.csv')
+    if not os.path.exists(path):
+        row = to_chars(tumor_grid(size)).ravel()
+        with open(path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            for _ in range(generations):
+                writer.writerow(row)
+
+    def run():
+        read_matrix(size, size, generations, path)
+    return run, size * size * generations, CELLS
+
+
+def import_case(module):
+    """
+    Benchmark case of importing a module in a fresh interpreter, as every worker process does.
+
+    The time includes the start-up of the interpreter itself, measured by the 'import/sys'
+    case, and does not depend on the size or the generations.
+    """
+    def case(size, generations, workdir):
+        def run():
+            subprocess.run([sys.executable, '-c', f'import {module}'], cwd=ROOT, check=True)
+        return run, 1, IMPORTS
+    return case
+
+
+# Benchmark cases by name; every case maps (size, generations, workdir) to the function
+# to time, the amount of work it does and the unit of that work
+BENCHMARKS = {
+    **{f'growth/{engine}': growth_step_case(engine) for engine in STEP_ENGINES},
+    **{f'step/{engine}': step_case(engine) for engine in STEP_ENGINES},
+    'store_history': store_history_case,
+    'origin_distance': origin_distance_case,
+    'find_clusters': find_clusters_case,
+    'count_clusters': count_clusters_case,
+    'cluster_sequence/tracker': cluster_sequence_case(True),
+    'cluster_sequence/count_clusters': cluster_sequence_case(False),
+    'simulate_and_find_metastasis/loop': metastasis_case('loop'),
+    'simulate_and_find_metastasis/fast': metastasis_case('fast'),
+    'read_history': read_history_case,
+    'read_matrix': read_matrix_case,
+    **{f'import/{module}': import_case(module)
+       for module in ('sys', 'code.functions', 'code.functions.ca_model', 'code.functions.analyze')},
+}
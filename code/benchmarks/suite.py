@@ -0,0 +1,131 @@
+import contextlib
+import io
+import json
+import platform
+import tempfile
+import time
+import numpy as np
+from .cases import BENCHMARKS
+
+SIZES = (51, 101, 201, 501)
+GENERATIONS = (10, 40)
+# A case is a regression when it is this much slower than the baseline
+REGRESSION_TOLERANCE = 0.25
+
+
+def time_case(run, repeats):
+    """
+    Time a benchmark function, keeping the best of several repeats.
+
+    Args:
+        - run: The function to time.
+        - repeats: The number of repeats.
+
+    Returns: The shortest time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        # The readers print progress messages, which are not part of the benchmark
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scaling_exponent(work, seconds):
+    """
+    Fit the exponent b of seconds ~ work ** b on a log-log scale.
+
+    An exponent of 1 means linear scaling in the amount of work.
+
+    Args:
+        - work: The amount of work of each measurement.
+        - seconds: The time of each measurement.
+
+    Returns: The fitted exponent, or None with fewer than two distinct amounts of work.
+    """
+    work, seconds = np.asarray(work, dtype=float), np.asarray(seconds, dtype=float)
+    if len(np.unique(work)) < 2:
+        return None
+    return float(np.polyfit(np.log(work), np.log(seconds), 1)[0])
+
+
+def run_benchmarks(cases=None, sizes=SIZES, generations=GENERATIONS, repeats=3, log=print):
+    """
+    Run benchmark cases at every grid size and number of generations.
+
+    Args:
+        - cases: Names of the cases in BENCHMARKS to run, all by default.
+        - sizes: The grid sizes.
+        - generations: The numbers of generations.
+        - repeats: The number of repeats of each measurement; the best one is kept.
+        - log: Function to report progress with, or None.
+
+    Returns: A report dictionary with the environment, one result per measurement
+    (seconds and throughput) and the scaling exponents of every case per number of
+    generations, fitted over the grid sizes.
+    """
+    cases = list(BENCHMARKS) if cases is None else list(cases)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in cases:
+            for n_generations in generations:
+                for size in sizes:
+                    run, work, unit = BENCHMARKS[name](size, n_generations, workdir)
+                    seconds = time_case(run, repeats)
+                    results.append({'case': name, 'size': size, 'generations': n_generations, 'seconds': seconds,
+                                    'work': work, 'unit': unit, 'throughput': work / seconds})
+                    if log is not None:
+                        log(f"{name:40s} size {size:4d} generations {n_generations:4d}: "
+                            f"{seconds:10.5f} s, {work / seconds:12.4g} {unit}/s")
+
+    scaling = {}
+    for name in cases:
+        for n_generations in generations:
+            measured = [r for r in results if r['case'] == name and r['generations'] == n_generations]
+            scaling[f'{name}@{n_generations}'] = scaling_exponent([r['work'] for r in measured],
+                                                                  [r['seconds'] for r in measured])
+    environment = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                   'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'environment': environment, 'results': results, 'scaling': scaling}
+
+
+def save_report(report, path):
+    """Write a benchmark report to a JSON file."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+
+def load_report(path):
+    """Read a benchmark report written by save_report."""
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare_reports(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare a benchmark report with a baseline report.
+
+    Args:
+        - report: The new report.
+        - baseline: The baseline report, e.g. from before a change.
+        - tolerance: Relative slowdown allowed before a measurement counts as a regression.
+
+    Returns: A dictionary with lists of 'regressions' and 'improvements', each entry
+    giving the case, size, generations, both times and their ratio.
+    """
+    reference = {(r['case'], r['size'], r['generations']): r['seconds'] for r in baseline['results']}
+    comparison = {'regressions': [], 'improvements': []}
+    for result in report['results']:
+        key = (result['case'], result['size'], result['generations'])
+        if key not in reference:
+            continue
+        ratio = result['seconds'] / reference[key]
+        entry = {'case': key[0], 'size': key[1], 'generations': key[2], 'seconds': result['seconds'],
+                 'baseline': reference[key], 'ratio': ratio}
+        if ratio > 1 + tolerance:
+            comparison['regressions'].append(entry)
+        elif ratio < 1 / (1 + tolerance):
+            comparison['improvements'].append(entry)
+    return comparison
@@ -0,0 +1,58 @@
+"""
+Cellular automaton model of tumor growth and its analysis.
+
+The public API is available from the package, e.g. functions.simulate_tumor_growth, and
+every module is loaded on first use only: importing the package loads nothing else, and
+using the model does not load the plotting or cluster code.
+"""
+import importlib
+
+# Public names by the module defining them, see __getattr__
+_EXPORTS = {
+    'ca_model': ('initialize_grid', 'to_codes', 'to_chars', 'count_cells', 'get_engine', 'register_engine',
+                 'initial_state', 'simulate_tumor_growth', 'iter_simulation', 'simulate_tumor_growth_with_clusters',
+                 'simulate_tumor_growth_with_matrices'),
+    'analyze': ('find_clusters', 'delay_coordinates_reconstruction', 'false_nearest_neighbours',
+                'correlation_dimension', 'largest_lyapunov', 'plot_simulate_tumor_growth',
+                'animate_simulate_tumor_growth', 'simulate_and_find_metastasis', 'find_critical_k1',
+                'oscillation_analysis'),
+    'cache': ('ResultCache', 'cached_simulate_tumor_growth', 'cached_simulate_and_find_metastasis'),
+    'checkpoint': ('atomic_write',),
+    'clusters': ('label_clusters', 'count_clusters', 'ClusterTracker'),
+    'continuous': ('solve_dde', 'bifurcation_diagram', 'limit_cycle_amplitude'),
+    'counter_rng': ('CounterRNG',),
+    'ensemble': ('simulate_ensemble',),
+    'frames': ('write_png', 'FrameSequenceWriter', 'AnimationWriter'),
+    'geometry': ('get_geometry',),
+    'history': ('new_history', 'history_columns', 'ArrayHistory', 'RingHistory'),
+    'read_data': ('read_history', 'load_history', 'read_matrix'),
+    'stream': ('run_stream', 'HistoryCSVWriter', 'MatrixCSVWriter', 'ClusterCounter', 'Collector'),
+    'sweep': ('parameter_grid', 'run_sweep'),
+    'tiled': ('TiledGrid', 'simulate_tiled'),
+    'trajectory': ('Trajectory', 'TrajectoryWriter'),
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+# Modules with a self_check function, run by self_check
+SELF_CHECKED = ('ca_model', 'clusters', 'analyze')
+
+__all__ = sorted(_MODULES) + ['self_check']
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(f'.{_MODULES[name]}', __name__), name)
+        globals()[name] = value  # Later lookups no longer go through __getattr__
+        return value
+    if name in _EXPORTS:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+def self_check():
+    """Run the sanity checks of the modules in SELF_CHECKED, which imports them."""
+    for module in SELF_CHECKED:
+        importlib.import_module(f'.{module}', __name__).self_check()
@@ -1,7 +1,18 @@
-from functions.ca_model import *
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-
+import hashlib
+import random
+import numpy as np
+from . import instrument
+from .ca_model import (CELL_C, CELL_CODES, RANDOM_SEED, get_engine, initialize_grid, iter_simulation, sum_cell_type,
+                       to_codes)
+from .clusters import count_clusters, dilate
+# matplotlib, scipy and the frames, stream and sweep modules are imported by the functions
+# using them, so importing this module, e.g. in the worker processes of a sweep, does not load them
+
+# Results of oscillation_analysis, keyed on a hash of the data and the settings
+OSCILLATION_CACHE = {}
+OSCILLATION_CACHE_SIZE = 32
+
+@instrument.timed('find_clusters')
 def find_clusters(grid, ROWS, COLS):
     """
     Find clusters of 'C', cancer cells, in the given grid.
@@ -13,6 +24,7 @@ def find_clusters(grid, ROWS, COLS):
 
     Returns: A list of sets, each set containing the coordinates of a cluster.
     """
+    grid = to_codes(grid)
     # Initialize a grid to keep track of visited cells
     visited = np.zeros_like(grid, dtype=bool)
     clusters = []
@@ -21,7 +33,7 @@ def find_clusters(grid, ROWS, COLS):
     for r in range(ROWS):
         for c in range(COLS):
             # If a cell contains 'C' and has not been visited, it's a new cluster
-            if grid[r, c] == 'C' and not visited[r, c]:
+            if grid[r, c] == CELL_C and not visited[r, c]:
                 cluster = set()
                 stack = [(r, c)]
 
@@ -29,7 +41,7 @@ def find_clusters(grid, ROWS, COLS):
                 while stack:
                     current_r, current_c = stack.pop()
                     # Check bounds and if the cell is part of the cluster
-                    if 0 <= current_r < ROWS and 0 <= current_c < COLS and grid[current_r, current_c] == 'C' and not visited[current_r, current_c]:
+                    if 0 <= current_r < ROWS and 0 <= current_c < COLS and grid[current_r, current_c] == CELL_C and not visited[current_r, current_c]:
                         visited[current_r, current_c] = True
                         cluster.add((current_r, current_c))
                         # Add neighboring cells to the stack
@@ -41,28 +53,172 @@ def find_clusters(grid, ROWS, COLS):
 
     return clusters
 
-# Assert statement for the find_clusters function
-assert find_clusters(np.array([['N', 'C', 'C'], ['N', 'C', 'N'], ['N', 'N', 'N']]), 3, 3) == [{(0, 1), (0, 2), (1, 1)}], "The find_clusters function did not find the correct clusters."
+def self_check():
+    """Run the sanity check of find_clusters, formerly run on every import."""
+    assert find_clusters(np.array([['N', 'C', 'C'], ['N', 'C', 'N'], ['N', 'N', 'N']]), 3, 3) == [{(0, 1), (0, 2), (1, 1)}], "The find_clusters function did not find the correct clusters."
 
 def delay_coordinates_reconstruction(time_series, tau, d):
     """
     Reconstructs the delay coordinates from a time series.
 
+    Row j is (x[j], x[j + tau], ..., x[j + (d - 1) tau]). The result is a read-only view
+    of the series, so no data is copied, and a batch of series of shape (..., n) gives
+    one embedding per series, of shape (..., n - (d - 1) tau, d).
+
     Args:
-    - time_series: The time series data.
+    - time_series: The time series data, or a batch of series along the last axis.
     - tau: The time delay.
     - d: The embedding dimension.
 
     Returns: The reconstructed delay coordinates.
     """
-    n = len(time_series)
+    time_series = np.asarray(time_series)
+    n = time_series.shape[-1]
     # Ensure the time series is long enough for the given tau and d
     if n <= (d - 1) * tau:
         raise ValueError("Time series is too short for given tau and d values")
 
-    # Construct the delay coordinates
-    reconstructed = np.array([time_series[i:n - (d - 1 - i) * tau:tau] for i in range(d)])
-    return reconstructed.T
+    # Every window of (d - 1) tau + 1 samples, keeping every tau-th sample
+    windows = np.lib.stride_tricks.sliding_window_view(time_series, (d - 1) * tau + 1, axis=-1)
+    return windows[..., ::tau]
+
+
+def _each_series(time_series, measure):
+    """Apply a measure to every series of a batch (..., n) and stack the results."""
+    time_series = np.asarray(time_series, dtype=float)
+    batch = time_series.shape[:-1]
+    results = [np.asarray(measure(time_series[index])) for index in np.ndindex(batch)]
+    return np.reshape(results, batch + results[0].shape)
+
+
+def false_nearest_neighbours(time_series, tau, max_dim=6, ratio=10.0):
+    """
+    Fraction of false nearest neighbours per embedding dimension, to choose the dimension.
+
+    The nearest neighbour of every point in dimension d, found with a k-d tree, is false
+    when the next delay coordinate moves it more than ratio times their distance away.
+    The smallest d where the fraction drops to about 0 unfolds the attractor.
+
+    Args:
+    - time_series: The time series data, or a batch of series along the last axis.
+    - tau: The time delay.
+    - max_dim: The largest embedding dimension to test.
+    - ratio: The distance ratio above which a neighbour counts as false.
+
+    Returns: The fractions for d = 1, ..., max_dim, per series for a batch.
+    """
+    from scipy.spatial import cKDTree
+    def measure(series):
+        fractions = []
+        for d in range(1, max_dim + 1):
+            embedded = delay_coordinates_reconstruction(series, tau, d + 1)
+            points, extra = embedded[:, :d], embedded[:, d]
+            distances, neighbours = cKDTree(points).query(points, k=2)
+            # The first match is the point itself, or a duplicate of it at distance 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stretch = np.abs(extra - extra[neighbours[:, 1]]) / distances[:, 1]
+            fractions.append(np.mean(stretch > ratio))
+        return fractions
+    return _each_series(time_series, measure)
+
+
+def correlation_sum(time_series, tau, d, radii, theiler=0):
+    """
+    Correlation sum C(r): the fraction of pairs of embedded points closer than r.
+
+    Pairs are counted with a dual k-d tree traversal instead of all pairwise distances.
+
+    Args:
+    - time_series: The time series data, or a batch of series along the last axis.
+    - tau: The time delay.
+    - d: The embedding dimension.
+    - radii: The radii r, increasing.
+    - theiler: Pairs less than this many generations apart are left out, as they are
+      close only because the series is continuous.
+
+    Returns: C(r) for every radius, per series for a batch.
+    """
+    from scipy.spatial import cKDTree
+    radii = np.asarray(radii, dtype=float)
+
+    def measure(series):
+        points = delay_coordinates_reconstruction(series, tau, d)
+        n = len(points)
+        tree = cKDTree(points)
+        # Ordered pairs closer than r, including every point with itself
+        close = tree.count_neighbors(tree, radii, cumulative=True).astype(float) - n
+        pairs = n * (n - 1)
+        for lag in range(1, min(theiler, n - 1) + 1):
+            gaps = np.linalg.norm(points[lag:] - points[:-lag], axis=1)
+            close -= 2 * np.count_nonzero(gaps[:, None] <= radii, axis=0)
+            pairs -= 2 * (n - lag)
+        return close / max(pairs, 1)
+    return _each_series(time_series, measure)
+
+
+def correlation_dimension(time_series, tau, d, radii, theiler=0):
+    """
+    Correlation dimension: the slope of log C(r) against log r, see correlation_sum.
+
+    Args:
+    - time_series: The time series data, or a batch of series along the last axis.
+    - tau: The time delay.
+    - d: The embedding dimension.
+    - radii: The radii of the scaling region.
+    - theiler: The Theiler window of correlation_sum.
+
+    Returns: The dimension, per series for a batch; nan with fewer than two nonzero C(r).
+    """
+    radii = np.asarray(radii, dtype=float)
+    sums = correlation_sum(time_series, tau, d, radii, theiler)
+
+    def slope(c):
+        valid = c > 0
+        return np.polyfit(np.log(radii[valid]), np.log(c[valid]), 1)[0] if np.count_nonzero(valid) > 1 else np.nan
+    return np.apply_along_axis(slope, -1, sums) if sums.ndim > 1 else slope(sums)
+
+
+def largest_lyapunov(time_series, tau, d, horizon=20, theiler=10):
+    """
+    Estimate the largest Lyapunov exponent per generation with Rosenstein's method.
+
+    Every embedded point is paired with its nearest neighbour, found with a k-d tree,
+    that is at least theiler generations away in time. The exponent is the slope of
+    the mean log distance of the pairs as both evolve over horizon generations:
+    positive for chaos, about 0 on a limit cycle and negative at a fixed point.
+
+    Args:
+    - time_series: The time series data, or a batch of series along the last axis.
+    - tau: The time delay.
+    - d: The embedding dimension.
+    - horizon: The number of generations the divergence is followed.
+    - theiler: The minimal time separation of a point and its neighbour.
+
+    Returns: The exponent, per series for a batch; nan when no pair can be followed.
+    """
+    from scipy.spatial import cKDTree
+    def measure(series):
+        points = delay_coordinates_reconstruction(series, tau, d)
+        n = len(points)
+        # Among the 2 theiler + 2 nearest points at least one is outside the Theiler window
+        k = min(2 * theiler + 2, n)
+        distances, neighbours = cKDTree(points).query(points, k=k)
+        index = np.arange(n)
+        valid = np.abs(neighbours - index[:, None]) > theiler
+        first = np.argmax(valid, axis=1)
+        found = valid[index, first]
+        start, partner = index[found], neighbours[found, first[found]]
+
+        divergence = []
+        for step in range(horizon + 1):
+            alive = (start + step < n) & (partner + step < n)
+            gaps = np.linalg.norm(points[start[alive] + step] - points[partner[alive] + step], axis=1)
+            gaps = gaps[gaps > 0]
+            divergence.append(np.mean(np.log(gaps)) if gaps.size else np.nan)
+        divergence = np.array(divergence)
+        steps = np.flatnonzero(np.isfinite(divergence))
+        return np.polyfit(steps, divergence[steps], 1)[0] if steps.size > 1 else np.nan
+    return _each_series(time_series, measure)
 
 # Convert cell types to numeric values for visualization
 def cell_type_to_number(cell_type):
@@ -74,23 +230,58 @@ def cell_type_to_number(cell_type):
 
     Returns: The numeric representation of the cell type.
     """
-    return {'N': 0, 'C': 1, 'E': 2, 'D': 3}[cell_type]
+    return CELL_CODES[cell_type]
 
 def convert_matrix(M):
     """
     Converts a matrix of cell type characters to a matrix of numeric values.
 
     Args:
-    - M: The matrix of cell type characters.
+    - M: The matrix of cell type characters or cell codes.
 
     Returns: The matrix of numeric values.
     """
-    # Apply the cell_type_to_number conversion to the entire matrix
-    numeric_M = np.vectorize(cell_type_to_number)(M)
+    # Grids are stored as cell codes already, only character matrices need converting
+    numeric_M = to_codes(M)
     return numeric_M
 
 
-def plot_simulate_tumor_growth(time_delay, generations, k1, k2):
+class GridPlotter:
+    """
+    Stream consumer plotting the grid of every snapshot, five plots per figure.
+
+    Args:
+        - per_figure: The number of plots per figure.
+    """
+
+    def __init__(self, per_figure=5):
+        self.per_figure = per_figure
+        import matplotlib.pyplot as plt
+        self.plot_count = 0  # Count how many plots have been made in the current figure
+        plt.figure(figsize=(20, 8))
+
+    def __call__(self, snapshot):
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import ListedColormap
+        self.plot_count += 1
+        plt.subplot(1, self.per_figure, self.plot_count)
+        plt.imshow(convert_matrix(snapshot['grid']), cmap=ListedColormap(['white', 'black', 'red', 'green']))
+        plt.title(f"Generation {snapshot['generation']}")
+        plt.axis('off')
+
+        # If the figure is full, show the plot and reset for a new figure
+        if self.plot_count == self.per_figure:
+            plt.show()
+            plt.figure(figsize=(20, 8))
+            self.plot_count = 0
+
+    def close(self):
+        """Show the last, partly filled figure."""
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+def plot_simulate_tumor_growth(time_delay, generations, k1, k2, engine='loop'):
     """
     Simulates tumor growth over a specified number of generations and plots the results every 20 generations.
 
@@ -99,6 +290,7 @@ def plot_simulate_tumor_growth(time_delay, generations, k1, k2):
     - generations: Total number of generations to simulate.
     - k1: Proliferation rate of cancer cells.
     - k2: Inmune response rate against cancer cells.
+    - engine: Name of a registered step engine.
 
     Returns: A history dictionary containing the state of the grid at each step.
     """
@@ -106,41 +298,107 @@ def plot_simulate_tumor_growth(time_delay, generations, k1, k2):
     assert isinstance(generations, int), "Generations parameter must be an integer"
     assert generations > 0, "Generations parameter must be positive"
 
-    # Initialize history dictionary and simulation grid
+    # The simulation streams a grid every 20 generations to the plotter
+    from .stream import run_stream
     history = {}
-    M = initialize_grid()
+    plotter = GridPlotter(min(5, max(1, generations // 20)))
+    run_stream(iter_simulation(time_delay, generations, k1, k2, engine, stride=20, detail='grid', history=history),
+               plotter)
+    plotter.close()
 
-    # Set up the plot
-    plt.figure(figsize=(20, 8))
-    iteration_numbers = []  # Track the number of iterations
-    plot_count = 0  # Count how many plots have been made
+    return history
 
-    # Iterate over each generation to simulate tumor growth
-    for g in range(generations):
-        iteration_numbers.append(g)
-        M = simulate_tumor_growth_one_step(M, g, time_delay, history, k1, k2)
-
-        # Plot the grid every 20 generations
-        if g % 20 == 0:
-            plot_count += 1
-            plt.subplot(1, min(5, generations // 20), plot_count)
-            plt.imshow(convert_matrix(M), cmap=ListedColormap(['white', 'black', 'red', 'green']))
-            plt.title(f'Generation {g}')
-            plt.axis('off')
-
-            # If we have plotted 5 times, show the plot and reset for new figure
-            if plot_count == 5:
-                plt.show()
-                plt.figure(figsize=(20, 8))
-                plot_count = 0
-
-    # Show the final plot
-    plt.show()
 
+def animate_simulate_tumor_growth(time_delay, generations, k1, k2, path, engine='fast', stride=1, crop=None,
+                                  scale=1, fps=25):
+    """
+    Simulates tumor growth and writes the grids to an animated PNG while the simulation runs.
+
+    No matplotlib figure is made: the frames are encoded straight from the grid codes.
+
+    Args:
+    - time_delay: Time delay factor in the simulation.
+    - generations: Total number of generations to simulate.
+    - k1: Proliferation rate of cancer cells.
+    - k2: Inmune response rate against cancer cells.
+    - path: The path of the animation.
+    - engine: Name of a registered step engine.
+    - stride: Write every stride-th generation.
+    - crop: Optional (row_start, row_stop, col_start, col_stop) region of the grid.
+    - scale: Integer upscaling factor.
+    - fps: Frames per second.
+
+    Returns: A history dictionary containing the state of the grid at each step.
+    """
+    from .frames import AnimationWriter
+    from .stream import run_stream
+    history = {}
+    with AnimationWriter(path, fps=fps, crop=crop, scale=scale) as writer:
+        run_stream(iter_simulation(time_delay, generations, k1, k2, engine, stride=stride, detail='grid',
+                                   history=history), writer)
     return history
 
-def simulate_and_find_metastasis(generations, rows, cols, k1, k2):
+# Number of clusters above which the tumor counts as metastatic
+METASTASIS_CLUSTERS = 50
+
+
+def metastasis_unreachable(M, k1, remaining):
+    """
+    Check whether a run can no longer exceed METASTASIS_CLUSTERS clusters.
+
+    Every cluster holds at least one cancer cell and every cancer cell divides at
+    most once per generation, so the cluster count is bounded by Nc * 2**remaining,
+    or by Nc itself when the tumor cannot grow (no cancer cells left or k1 <= 0).
+    Daughters only go to neighbours, so the cancer cells of the remaining generations
+    also all lie within `remaining` steps of a current one, which bounds the count by
+    the number of such cells.
+
+    Both bounds only become small near the end of a run, on small grids or once the
+    tumor dies out, so for runs that do not reach metastasis early stopping mostly
+    saves the last few generations; the large savings come from stopping on success.
+
+    Args:
+        - M: The current grid.
+        - k1: Proliferation rate of cancer cells.
+        - remaining: Number of generations left in the run.
+
+    Returns: True if metastasis is impossible in the remaining generations.
+    """
+    M = to_codes(M)
+    n_cancer = int(sum_cell_type(M, CELL_C))
+    if n_cancer == 0 or k1 <= 0:
+        return n_cancer <= METASTASIS_CLUSTERS
+    if remaining < 64 and n_cancer * 2 ** remaining <= METASTASIS_CLUSTERS:
+        return True
+    # Grow the cancer cells one neighbour per generation, stopping once too many cells are reachable
+    reachable = M == CELL_C
+    for _ in range(remaining):
+        grown = dilate(reachable)
+        if np.array_equal(grown, reachable):
+            break
+        reachable = grown
+        if np.count_nonzero(reachable) > METASTASIS_CLUSTERS:
+            return False
+    return np.count_nonzero(reachable) <= METASTASIS_CLUSTERS
+
+
+def simulate_and_find_metastasis(generations, rows, cols, k1, k2, engine='loop', stop_early=False):
+    """
+    Simulate tumor growth on a rows x cols grid and find the time to metastasis.
 
+    Args:
+        - generations: Maximum number of generations to simulate.
+        - rows: Number of rows in the grid.
+        - cols: Number of columns in the grid.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - engine: Name of a registered step engine, 'loop', 'fast', 'active' or 'compiled'.
+        - stop_early: Stop as soon as metastasis is reached or provably unreachable, see
+          metastasis_unreachable. The cluster list then ends at the last simulated generation.
+
+    Returns: Tuple of the number of clusters per generation and Tm, the first generation
+    with more than METASTASIS_CLUSTERS clusters, or None.
+    """
     ORIGIN = (cols // 2, rows // 2)
     CANCER_INIT_POSITIONS = [(ORIGIN[0], ORIGIN[1]), (ORIGIN[0] + 1, ORIGIN[1]),
                             (ORIGIN[0] - 1, ORIGIN[1]), (ORIGIN[0], ORIGIN[1] - 1),
@@ -149,14 +407,269 @@ def simulate_and_find_metastasis(generations, rows, cols, k1, k2):
     M = initialize_grid(rows, cols, CANCER_INIT_POSITIONS)
     num_clusters_list = []
     Tm = None
+    step = get_engine(engine, metastasis=True)
+    state = {}
 
     for g in range(generations):
-        M = simulate_tumor_growth_one_step_metastasis(M, k1, k2, rows, cols, ORIGIN)
-        clusters = find_clusters(M, rows, cols)
-        num_clusters = len(clusters)
-        num_clusters_list.append(len(clusters))
+        instrument.generation(g)
+        with instrument.phase('step'):
+            M = step(M, k1, k2, rows, cols, ORIGIN, state)
+        with instrument.phase('count_clusters'):
+            num_clusters = count_clusters(M)
+        num_clusters_list.append(num_clusters)
         
-        if num_clusters > 50 and Tm is None:
+        if num_clusters > METASTASIS_CLUSTERS and Tm is None:
             Tm = g
+            if stop_early:
+                break
+        if stop_early and metastasis_unreachable(M, k1, generations - g - 1):
+            break
 
     return num_clusters_list, Tm
+
+
+def second_derivative(y, x):
+    """
+    Second derivative of y(x) by central finite differences, for non-uniform x.
+
+    Args:
+    - y: The values.
+    - x: The sample points.
+
+    Returns: The second derivative at every sample point.
+    """
+    dy = np.gradient(y, x)
+    return np.gradient(dy, x)
+
+
+def _metastasis_runs(k1, generations, rows, cols, k2, repeats, engine, seed, stop_early):
+    """
+    Run simulate_and_find_metastasis repeats times with the same seeds for every k1.
+
+    The runs reseed random, which is restored afterwards so the caller's stream is untouched.
+    """
+    from .sweep import task_seed
+    runs = []
+    state = random.getstate()
+    try:
+        for repeat in range(repeats):
+            random.seed(task_seed(seed, repeat))
+            runs.append(simulate_and_find_metastasis(generations, rows, cols, k1, k2, engine, stop_early))
+    finally:
+        random.setstate(state)
+    return runs
+
+
+def find_critical_k1(generations, rows, cols, k2, k1_range=(0.0, 1.0), method='bisection', tol=0.01,
+                     repeats=3, engine='fast', seed=RANDOM_SEED, initial_points=6):
+    """
+    Locate the critical k1 at which time-to-metastasis appears, refining adaptively.
+
+    'bisection' finds the first point of a coarse grid at which most repeats reach
+    metastasis and bisects between it and the point before, with runs that stop
+    early. 'curvature' refines the grid around the inflection point of the
+    mean cluster count, the zero crossing of its second derivative with the steepest
+    slope, like the uniform-grid analysis in cluster_analysis.ipynb. Each k1 is run
+    with the same seeds, so the noise between neighbouring points is correlated.
+
+    Args:
+        - generations: Number of generations per run.
+        - rows: Number of rows in the grid.
+        - cols: Number of columns in the grid.
+        - k2: Inmune response rate against cancer cells.
+        - k1_range: Interval of k1 to search.
+        - method: 'bisection' or 'curvature'.
+        - tol: Width of the final k1 interval.
+        - repeats: Number of runs per k1 value.
+        - engine: Name of a registered step engine.
+        - seed: Seed of the runs.
+        - initial_points: Size of the starting coarse grid.
+
+    Returns: Dictionary with the critical 'k1' (None if there is no transition in
+    k1_range), the final 'interval', the 'evaluations' per k1 value and the number
+    of 'simulations' run. When bisecting and the start of k1_range already reaches
+    metastasis, the transition lies below the range: 'k1' is then that start, an
+    upper bound, with the interval (None, start).
+    """
+    assert method in ('bisection', 'curvature'), "Method must be 'bisection' or 'curvature'"
+    evaluations = {}
+    if method == 'bisection':
+        def reached(k1):
+            runs = _metastasis_runs(k1, generations, rows, cols, k2, repeats, engine, seed, True)
+            evaluations[k1] = np.mean([Tm is not None for _, Tm in runs])
+            return evaluations[k1] > 0.5
+
+        # Bracket the first k1 that reaches metastasis on a coarse grid, then bisect
+        grid = [float(k1) for k1 in np.linspace(*k1_range, initial_points)]
+        hi = next((i for i, k1 in enumerate(grid) if reached(k1)), None)
+        if hi is None:
+            return {'k1': None, 'interval': k1_range, 'evaluations': evaluations,
+                    'simulations': repeats * len(evaluations)}
+        if hi == 0:
+            return {'k1': grid[0], 'interval': (None, grid[0]), 'evaluations': evaluations,
+                    'simulations': repeats * len(evaluations)}
+        lo, hi = grid[hi - 1], grid[hi]
+        while hi - lo > tol:
+            mid = (lo + hi) / 2
+            if reached(mid):
+                hi = mid
+            else:
+                lo = mid
+        return {'k1': (lo + hi) / 2, 'interval': (lo, hi), 'evaluations': evaluations,
+                'simulations': repeats * len(evaluations)}
+
+    def evaluate(k1):
+        runs = _metastasis_runs(k1, generations, rows, cols, k2, repeats, engine, seed, False)
+        evaluations[k1] = np.mean([np.mean(clusters) for clusters, _ in runs])
+
+    for k1 in np.linspace(*k1_range, initial_points):
+        evaluate(float(k1))
+    while True:
+        x = np.array(sorted(evaluations))
+        y = np.array([evaluations[k1] for k1 in x])
+        slope = np.gradient(y, x)
+        crossings = np.flatnonzero(np.diff(np.sign(second_derivative(y, x))))
+        if crossings.size == 0:
+            i = min(int(np.argmax(np.abs(slope))), len(x) - 2)
+        else:
+            i = crossings[np.argmax(np.abs(slope[crossings]))]
+        if x[i + 1] - x[i] <= tol:
+            break
+        for j in range(max(i - 1, 0), min(i + 2, len(x) - 1)):
+            evaluate(float((x[j] + x[j + 1]) / 2))
+
+    d2 = second_derivative(y, x)
+    # Linear interpolation of the zero crossing of the second derivative inside the final interval
+    weight = d2[i] / (d2[i] - d2[i + 1]) if d2[i] != d2[i + 1] else 0.5
+    return {'k1': float(x[i] + np.clip(weight, 0, 1) * (x[i + 1] - x[i])), 'interval': (x[i], x[i + 1]),
+            'evaluations': evaluations, 'simulations': repeats * len(evaluations)}
+
+
+def data_key(values):
+    """
+    Hash identifying the contents of an array, for caching results computed from it.
+
+    Args:
+    - values: The array.
+
+    Returns: A hex digest of the shape, dtype and data.
+    """
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(str((values.shape, values.dtype.str)).encode(), digest_size=16)
+    digest.update(values.data)
+    return digest.hexdigest()
+
+
+def _cached(key, compute):
+    """Look a result up in OSCILLATION_CACHE, computing and storing it, read-only, when missing."""
+    if key in OSCILLATION_CACHE:
+        return OSCILLATION_CACHE[key]
+    result = compute()
+    for value in result.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    if len(OSCILLATION_CACHE) >= OSCILLATION_CACHE_SIZE:
+        del OSCILLATION_CACHE[next(iter(OSCILLATION_CACHE))]
+    OSCILLATION_CACHE[key] = result
+    return result
+
+
+def batch_extrema(values, prominence=1):
+    """
+    Find the peaks of every row of a 2D array with one call of find_peaks.
+
+    The rows are laid end to end, separated by walls of infinity. A wall is higher than
+    any peak, so the prominence of a peak never looks past the end of its row and
+    every row gives the same peaks as find_peaks on that row alone.
+
+    Args:
+    - values: Array of shape (rows, samples).
+    - prominence: The minimal prominence of a peak, as in find_peaks.
+
+    Returns: The row and sample index of every peak, in row order.
+    """
+    from scipy.signal import find_peaks
+    values = np.asarray(values, dtype=float)
+    rows, samples = values.shape
+    walled = np.full((rows, samples + 1), np.inf)
+    walled[:, 1:] = values
+    peaks, _ = find_peaks(np.append(walled.ravel(), np.inf), prominence=prominence)
+    row, sample = np.divmod(peaks, samples + 1)
+    inside = sample > 0
+    return row[inside], sample[inside] - 1
+
+
+def oscillation_analysis(Nc, taus=None, window_length=51, polyorder=5, prominence=1, start=0):
+    """
+    Analyse the oscillations of Nc for every tau in one batched pass.
+
+    Works on the (tau, generation) arrays of load_history. The smoothing and the extrema
+    are cached separately, keyed on a hash of Nc and their own settings, so calling
+    again with another prominence reuses the smoothing and repeated calls return at once.
+    The returned arrays are read-only.
+
+    Args:
+    - Nc: Array of shape (tau, generation) of the number of cancer cells.
+    - taus: The tau of every row, by default 0, 1, 2, ...
+    - window_length: The window of the Savitzky-Golay filter.
+    - polyorder: The polynomial order of the Savitzky-Golay filter.
+    - prominence: The minimal prominence of the peaks and troughs.
+    - start: The first generation considered for the extrema, to skip the transient.
+
+    Returns: A dictionary with
+    - 'tau': The tau of every row.
+    - 'smoothed', 'derivative', 'smoothed_derivative': Nc smoothed, its gradient over the
+      generations and the smoothed gradient, each of shape (tau, generation).
+    - 'peak_tau', 'peak_generation', 'peak_value' and the same for 'trough': every extremum.
+    - 'amplitude': Half the difference of the mean peak and the mean trough per tau, 0 without both.
+    - 'period': The mean number of generations between peaks per tau, nan with fewer than two.
+    - 'bifurcation_tau', 'bifurcation_value': The points of a bifurcation diagram; the values
+      of the extrema of every tau, or its final value when it has none.
+    """
+    from scipy.signal import savgol_filter
+    Nc = np.asarray(Nc)
+    key = data_key(Nc)
+    taus = np.arange(len(Nc)) if taus is None else np.asarray(taus)
+
+    def smooth():
+        derivative = np.gradient(Nc.astype(float), axis=1)
+        return {'smoothed': savgol_filter(Nc, window_length, polyorder, axis=1), 'derivative': derivative,
+                'smoothed_derivative': savgol_filter(derivative, window_length, polyorder, axis=1)}
+
+    def extrema():
+        series = Nc[:, start:].astype(float)
+        rows = len(series)
+        result = {}
+        for name, signal in (('peak', series), ('trough', -series)):
+            row, generation = batch_extrema(signal, prominence)
+            result[f'{name}_row'], result[f'{name}_generation'] = row, generation + start
+            result[f'{name}_value'] = series[row, generation]
+            result[f'{name}_count'] = np.bincount(row, minlength=rows)
+            result[f'{name}_mean'] = np.bincount(row, series[row, generation], minlength=rows) \
+                / np.maximum(result[f'{name}_count'], 1)
+
+        both = (result['peak_count'] > 0) & (result['trough_count'] > 0)
+        result['amplitude'] = np.where(both, (result['peak_mean'] - result['trough_mean']) / 2, 0.0)
+        first = np.full(rows, np.inf)
+        last = np.full(rows, -np.inf)
+        np.minimum.at(first, result['peak_row'], result['peak_generation'])
+        np.maximum.at(last, result['peak_row'], result['peak_generation'])
+        count = result['peak_count']
+        result['period'] = np.where(count > 1, (last - first) / np.maximum(count - 1, 1), np.nan)
+
+        flat = (count == 0) & (result['trough_count'] == 0)
+        rows_all = np.concatenate([result['peak_row'], result['trough_row'], np.flatnonzero(flat)])
+        values_all = np.concatenate([result['peak_value'], result['trough_value'], series[flat, -1]])
+        order = np.argsort(rows_all, kind='stable')
+        result['bifurcation_row'], result['bifurcation_value'] = rows_all[order], values_all[order]
+        return result
+
+    smoothing = _cached((key, 'smooth', window_length, polyorder), smooth)
+    found = _cached((key, 'extrema', prominence, start), extrema)
+    return {'tau': taus, **smoothing,
+            'peak_tau': taus[found['peak_row']], 'peak_generation': found['peak_generation'],
+            'peak_value': found['peak_value'],
+            'trough_tau': taus[found['trough_row']], 'trough_generation': found['trough_generation'],
+            'trough_value': found['trough_value'],
+            'amplitude': found['amplitude'], 'period': found['period'],
+            'bifurcation_tau': taus[found['bifurcation_row']], 'bifurcation_value': found['bifurcation_value']}
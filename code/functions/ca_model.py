@@ -1,6 +1,12 @@
 import numpy as np
 import math
 import random
+from collections.abc import MutableMapping
+from .history import new_history
+from . import instrument, kernels
+from .checkpoint import load_checkpoint, remove_checkpoint, save_checkpoint
+from .geometry import DIRECTIONS, UP, RT, DN, LT, DENSE_TARGETS, NOT_DENSE_TARGETS, get_geometry
+from .counter_rng import CounterRNG
 
 # Set a random seed for reproducibility
 RANDOM_SEED = 42
@@ -15,12 +21,61 @@ CANCER_INIT_POSITIONS = [(ORIGIN[0], ORIGIN[1]), (ORIGIN[0] + 1, ORIGIN[1]),
                          (ORIGIN[0], ORIGIN[1] + 1)]
 K3, K4 = 0.4, 0.4  # Define mitosis and apoptosis probabilities
 RHO = 3.85  # Define a threshold for density development
+DEBUG_COUNTERS = False  # Check incremental counters against a full recount every generation
+
+# Cell states are stored as uint8 codes, the characters are kept for display and old data
+CELL_N, CELL_C, CELL_E, CELL_D = 0, 1, 2, 3
+CELL_TYPES = np.array(['N', 'C', 'E', 'D'])
+CELL_CODES = {'N': CELL_N, 'C': CELL_C, 'E': CELL_E, 'D': CELL_D}
+
+
+def cell_code(cell_type):
+    """
+    Get the uint8 code of a cell type.
+
+    Args:
+        - cell_type: The cell type character ('N', 'C', 'E', 'D') or its code.
+
+    Returns: The code of the cell type.
+    """
+    return CELL_CODES[cell_type] if isinstance(cell_type, str) else cell_type
+
+
+def to_codes(M):
+    """
+    Convert a grid to its uint8 code form, leaving coded grids untouched.
+
+    Args:
+        - M: The grid of cells, as codes or as 'N', 'C', 'E', 'D' characters.
+
+    Returns: The grid as a uint8 array of cell codes.
+    """
+    M = np.asarray(M)
+    if M.dtype.kind not in 'US':
+        return M
+    codes = np.zeros(M.shape, dtype=np.uint8)
+    for cell_type, code in CELL_CODES.items():
+        codes[M == cell_type] = code
+    return codes
+
+
+def to_chars(M):
+    """
+    Convert a grid of cell codes to the 'N', 'C', 'E', 'D' character form.
+
+    Args:
+        - M: The grid of cells.
+
+    Returns: The grid as an array of cell type characters.
+    """
+    return CELL_TYPES[to_codes(M)]
+
 
 def initialize_grid(ROWS=ROWS, COLS=COLS, CANCER_INIT_POSITIONS=CANCER_INIT_POSITIONS):
     """Initialize the grid with normal cells and initial cancer cells."""
-    M = np.full((ROWS, COLS), 'N')
+    M = np.full((ROWS, COLS), CELL_N, dtype=np.uint8)
     for pos in CANCER_INIT_POSITIONS:
-        M[pos] = 'C'
+        M[pos] = CELL_C
     return M
 
 # def initialize_grid():
@@ -41,7 +96,7 @@ def sum_cell_type(M, cell_type):
 
     Returns: The number of cells of the specified type.
     """
-    return np.sum(M == cell_type)
+    return np.count_nonzero(to_codes(M) == cell_code(cell_type))
 
 def calculate_n_prime(M):
     """
@@ -52,41 +107,100 @@ def calculate_n_prime(M):
 
     Returns: The total number of cells; C + E + D.
     """
-    c = sum_cell_type(M, 'C')
-    e = sum_cell_type(M, 'E')
-    d = sum_cell_type(M, 'D')
-    n_prime = c + e + d
+    n_prime = np.count_nonzero(to_codes(M) != CELL_N)
     return n_prime
 
-def origin_distance(M, ORIGIN=ORIGIN):
+def origin_distance(M, ORIGIN=None):
     """
     Calculate the average distance of cancer cells from the origin.
 
     Args:
         - M: The grid of cells.
+        - ORIGIN: The origin, by default the centre of the grid.
 
     Returns: The distance of cancer cells from the origin.
     """
+    M = to_codes(M)
     n_prime = calculate_n_prime(M)
-    R = 0
-    for i in range(len(M)):
-        for j in range(len(M[0])):
-            if M[i, j] == 'C':
-                R += math.sqrt((i - ORIGIN[0]) ** 2 + (j - ORIGIN[1]) ** 2)
+    R = cancer_distance_sum(M, ORIGIN)
     R = R / n_prime if n_prime else 0
     return R
 
-def density_development(M, ORIGIN=ORIGIN):
+
+def distance_map(rows, cols, origin=None):
+    """
+    Distance of every cell in the grid from the origin.
+
+    Args:
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - origin: The origin the distances are measured from, by default the centre of the grid.
+
+    Returns: A read-only float array of shape (rows, cols), shared through get_geometry.
+    """
+    return get_geometry(rows, cols, origin).distances
+
+
+def cancer_distance_sum(M, origin=None):
+    """
+    Sum the distances of all cancer cells from the origin.
+
+    The distances are added one by one in raster order, so the result is
+    bit-identical to summing math.sqrt over the grid in a double loop.
+
+    Args:
+        - M: The grid of cells.
+        - origin: The origin the distances are measured from, by default the centre of the grid.
+
+    Returns: The summed distance of cancer cells from the origin.
+    """
+    distances = distance_map(*M.shape, origin)[M == CELL_C]
+    return np.cumsum(distances)[-1] if distances.size else 0
+
+
+def count_cells(M, origin=None):
+    """
+    Count the cell populations and the cancer distance sum with a full scan.
+
+    Args:
+        - M: The grid of cells.
+        - origin: The origin the distances are measured from.
+
+    Returns: A dictionary of counters with keys Nc, Ne, Nd and Rsum.
+    """
+    M = to_codes(M)
+    counts = np.bincount(M.ravel(), minlength=len(CELL_TYPES))
+    return {'Nc': counts[CELL_C], 'Ne': counts[CELL_E], 'Nd': counts[CELL_D],
+            'Rsum': cancer_distance_sum(M, origin)}
+
+
+def check_counters(M, counters, origin=None):
+    """
+    Check incrementally updated counters against a full recount of the grid.
+
+    Args:
+        - M: The grid of cells.
+        - counters: Counters kept up to date by a step engine.
+        - origin: The origin the distances are measured from.
+    """
+    expected = count_cells(M, origin)
+    for key in ('Nc', 'Ne', 'Nd'):
+        assert counters[key] == expected[key], f"Counter {key} is {counters[key]}, recount gives {expected[key]}"
+    assert math.isclose(counters['Rsum'], expected['Rsum'], rel_tol=1e-9, abs_tol=1e-6), \
+        f"Counter Rsum is {counters['Rsum']}, recount gives {expected['Rsum']}"
+
+def density_development(M, ORIGIN=None):
     """
     Calculate the density development of the tumor.
 
     Args:
         - M: The grid of cells.
+        - ORIGIN: The origin, by default the centre of the grid.
 
     Returns: The density development of the tumor.
     """
     n_prime = calculate_n_prime(M)
-    R = origin_distance(M)
+    R = origin_distance(M, ORIGIN)
     return n_prime / R ** 2 if R else 0
 
 def basic_mitosis_probability(k, n):
@@ -114,7 +228,8 @@ def mitosis_probability(k1, n, time_delay, generation, history):
         return k1 * (1 - n / PHI)
 
 
-def store_history(generation, M, history):
+@instrument.timed('store_history')
+def store_history(generation, M, history, counters=None):
     """ 
     Store the number of each cell type and R at the current generation. 
     
@@ -122,37 +237,43 @@ def store_history(generation, M, history):
         - generation: The current generation of the simulation.
         - M: The grid of cells.
         - history: A record of the previous states of the simulation.
+        - counters: Counters of M kept up to date by the step engine, see count_cells.
+          Without them the grid is rescanned.
     
     """
-    Nc = sum_cell_type(M, 'C')
-    Ne = sum_cell_type(M, 'E')
-    Nd = sum_cell_type(M, 'D')
-    R = origin_distance(M)  # Calculate radius here
-    dense = (density_development(M) > RHO)
+    if counters is None:
+        counters = count_cells(M)
+    elif DEBUG_COUNTERS:
+        check_counters(M, counters)
+    Nc, Ne, Nd = counters['Nc'], counters['Ne'], counters['Nd']
+    n_prime = Nc + Ne + Nd
+    R = counters['Rsum'] / n_prime if n_prime else 0  # Calculate radius here
+    dense = ((n_prime / R ** 2 if R else 0) > RHO)
     history[generation] = {'Nc': Nc, 'Ne': Ne, 'Nd': Nd, 'R': R, "dense": dense}
 
 
-def get_quadrant(r, c):
+def get_quadrant(r, c, origin=ORIGIN):
     """
-    Get quadrant of coordinates relative to ORIGIN.
+    Get quadrant of coordinates relative to the origin.
     
     Args:
         - r: The row index of the cell.
         - c: The column index of the cell.
+        - origin: The origin, ORIGIN by default.
 
     Returns: The quadrant of the cell.
     """
-    if r <= ORIGIN[0] and c > ORIGIN[1]:
+    if r <= origin[0] and c > origin[1]:
         return 'I'
-    elif r <= ORIGIN[0] and c <= ORIGIN[1]:
+    elif r <= origin[0] and c <= origin[1]:
         return 'II'
-    elif r > ORIGIN[0] and c <= ORIGIN[1]:
+    elif r > origin[0] and c <= origin[1]:
         return 'III'
     else:
         return 'IV'
 
 
-def mitosis(M, newM, r, c, dense):
+def mitosis(M, newM, r, c, dense, counters=None, stats=None, geometry=None):
     """
     Model the cell division process, considering the tumor density development.
 
@@ -162,35 +283,92 @@ def mitosis(M, newM, r, c, dense):
         - r: The row index of the dividing cell.
         - c: The column index of the dividing cell.
         - dense: A boolean indicating whether the tumor is dense or not.
+        - counters: Optional counters of newM to update when a new cancer cell appears.
+        - stats: Optional step statistics, see step_stats, counting successful divisions.
+        - geometry: The Geometry of the grid, see get_geometry; by default that of newM
+          with the origin at its centre.
 
     Returns: The updated grid, newM, with the result of the division.
     """
-    # Define directions relative to the cell position
-    up, rt, dn, lt = (r - 1, c), (r, c + 1), (r + 1, c), (r, c - 1)
-    # Get the quadrant to determine division direction
-    quadrant = get_quadrant(r, c)
-    # Maps for cell division based on tumor density
-    dense_map = {'I': [up, rt], 'II': [lt, up], 'III': [dn, lt], 'IV': [rt, dn]}
-    not_dense_map = {'I': [dn, lt], 'II': [rt, dn], 'III': [up, rt], 'IV': [lt, up]}
+    if geometry is None:
+        geometry = get_geometry(*newM.shape)
+    # The two neighbours to divide into, chosen by quadrant and tumor density
+    choices = geometry.targets(r, c, dense)
     # Exclude cells that are not normal for division
-    not_normal = ('E', 'D')
-    # Choose the appropriate map based on density
-    map_choice = dense_map if dense else not_dense_map
-    choices = map_choice[quadrant]
+    not_normal = (CELL_E, CELL_D)
 
     # Attempt to divide the cell in the chosen directions
     for choice in choices:
         if newM[choice] not in not_normal:
-            newM[choice] = 'C'
+            if counters is not None and newM[choice] == CELL_N:
+                counters['Nc'] += 1
+                counters['Rsum'] += geometry.distances[choice]
+            newM[choice] = CELL_C
+            if stats is not None:
+                stats['mitosis_successes'] += 1
             break
     return newM
 
 
-# Assert statement to check if the mitosis function returns a numpy array
-assert isinstance(mitosis(np.array([['N', 'N'], ['N', 'N']]), np.array([['N', 'N'], ['N', 'N']]), 0, 0, False), np.ndarray), "Mitosis function must return a numpy array"
+def step_stats():
+    """
+    Create the statistics a step engine collects for the instrumentation.
 
+    Returns: A dictionary of mitosis attempts and successes, or None when no
+    instrumentation observer is attached, in which case nothing is counted.
+    """
+    return {'mitosis_attempts': 0, 'mitosis_successes': 0} if instrument.enabled() else None
 
-def simulate_tumor_growth_one_step(M, generation, time_delay, history, k1, k2):
+
+def report_step_stats(stats, M, rows, cols, cells_visited, rng_draws=None):
+    """
+    Report the statistics of a step to the instrumentation, see instrument.count_step.
+
+    Args:
+        - stats: The statistics collected during the step, see step_stats.
+        - M: The grid at the start of the step.
+        - rows, cols: The extent of the grid the engine visits, borders excluded.
+        - cells_visited: The number of cells the engine visited.
+        - rng_draws: The number of random numbers drawn. By default those of the loop
+          engine: one per 'E' or 'D' cell and per cancer cell, and a second one per
+          cancer cell that did not attempt mitosis.
+    """
+    if rng_draws is None:
+        counts = np.bincount(M[1:rows - 1, 1:cols - 1].ravel(), minlength=4)
+        rng_draws = 2 * counts[CELL_C] - stats['mitosis_attempts'] + counts[CELL_E] + counts[CELL_D]
+    instrument.count_step(cells_visited, rng_draws, stats['mitosis_attempts'], stats['mitosis_successes'])
+
+
+def keyed_uniforms(state, generation, shape, cells=None):
+    """
+    Get the per-cell draws of a generation when the run uses a counter-based stream.
+
+    With a CounterRNG under 'counter_rng' in the state, every engine reads draw 0 of a
+    cell for mitosis and the E and D transitions and draw 1 for C -> E, so the engines
+    give identical trajectories whatever order they visit the cells in.
+
+    Args:
+        - state: Per-run engine state dictionary, or None.
+        - generation: The generation; None for the metastasis engines, whose generations
+          are counted in the state instead.
+        - shape: The shape of the grid.
+        - cells: Optional (row, column) cells to draw for instead of the whole grid.
+
+    Returns: Array of shape (2,) + shape, or (2, len(cells)), of uniforms, or None
+    without a counter-based stream.
+    """
+    rng = state.get('counter_rng') if state else None
+    if rng is None:
+        return None
+    if generation is None:
+        generation = state['counter_generation'] = state.get('counter_generation', -1) + 1
+    if cells is not None:
+        rows, cols = np.array(cells, dtype=np.int64).reshape(-1, 2).T
+        return rng.cell_draws(generation, shape[1], rows, cols)
+    return rng.uniforms(generation, *shape)
+
+
+def simulate_tumor_growth_one_step(M, generation, time_delay, history, k1, k2, state=None):
     """
     Simulate a single step of tumor growth in the cellular automaton.
 
@@ -201,11 +379,16 @@ def simulate_tumor_growth_one_step(M, generation, time_delay, history, k1, k2):
         - history: A record of the previous states of the simulation.
         - k1: Proliferation rate of cancer cells.
         - k2: Inmune response rate against cancer cells.
+        - state: Per-run engine state; its 'counters', if present, are kept up to date, and
+          its 'counter_rng', if present, replaces random, see keyed_uniforms.
 
     Returns: The grid, newM, after one step of simulation.
     """
+    M = to_codes(M)
+    counters = state.get('counters') if state else None
+    keyed = keyed_uniforms(state, generation, M.shape)
     newM = np.copy(M)  # Create a copy of the grid for the new state
-    store_history(generation, M, history)  # Store the current state in history
+    store_history(generation, M, history, counters)  # Store the current state in history
     dense = history[generation]['dense']  # Determine if current state is dense
 
     # Check for time delay effect on density
@@ -213,52 +396,597 @@ def simulate_tumor_growth_one_step(M, generation, time_delay, history, k1, k2):
     if delayed_gen in history:
         dense = history[delayed_gen]['dense']
 
+    # M is not modified during the step, so the mitosis probability is the same for every cell
+    mitosis_prob = mitosis_probability(k1, history[generation]['Nc'], time_delay, generation, history)
+    rows, cols = M.shape
+    geometry = get_geometry(rows, cols)
+    distances = geometry.distances
+    stats = step_stats()
+
     # Iterate over the grid to simulate cell behavior
-    for r in range(1, ROWS - 1):
-        for c in range(1, COLS - 1):
-            if M[r, c] == 'C':
-                # Calculate mitosis probability for cancerous cells
-                mitosis_prob = mitosis_probability(k1, sum_cell_type(M, 'C'), time_delay, generation, history)
-                if random.random() < mitosis_prob:
+    for r in range(1, rows - 1):
+        for c in range(1, cols - 1):
+            if M[r, c] == CELL_C:
+                if (random.random() if keyed is None else keyed[0, r, c]) < mitosis_prob:
                     # Perform mitosis if probability threshold is met
-                    newM = mitosis(M, newM, r, c, dense)
-                elif random.random() < k2:
+                    if stats is not None:
+                        stats['mitosis_attempts'] += 1
+                    newM = mitosis(M, newM, r, c, dense, counters, stats, geometry)
+                elif (random.random() if keyed is None else keyed[1, r, c]) < k2:
                     # Change cell state to 'E' if probability threshold is met
-                    newM[r, c] = 'E'
-            elif M[r, c] == 'E' and random.random() < K3:
+                    newM[r, c] = CELL_E
+                    if counters is not None:
+                        counters['Nc'] -= 1
+                        counters['Ne'] += 1
+                        counters['Rsum'] -= distances[r, c]
+            elif M[r, c] == CELL_E and (random.random() if keyed is None else keyed[0, r, c]) < K3:
                 # Change cell state to 'D' for 'E' cells
-                newM[r, c] = 'D'
-            elif M[r, c] == 'D' and random.random() < K4:
+                newM[r, c] = CELL_D
+                if counters is not None:
+                    counters['Ne'] -= 1
+                    counters['Nd'] += 1
+            elif M[r, c] == CELL_D and (random.random() if keyed is None else keyed[0, r, c]) < K4:
                 # Change cell state to 'N' for 'D' cells
-                newM[r, c] = 'N'
+                newM[r, c] = CELL_N
+                if counters is not None:
+                    counters['Nd'] -= 1
+    if stats is not None:
+        report_step_stats(stats, M, rows, cols, (rows - 2) * (cols - 2))
+    return newM
+
+
+def quadrant_map(rows, cols, origin=None):
+    """
+    Vectorized get_quadrant over a whole grid.
+
+    Args:
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - origin: The origin the quadrants are measured against, by default the centre of the grid.
+
+    Returns: A read-only int array with 0, 1, 2, 3 for quadrants I, II, III, IV.
+    """
+    return get_geometry(rows, cols, origin).quadrants
+
+
+def engine_rng(state):
+    """
+    Get the numpy generator of a run, creating it on first use.
+
+    The generator is seeded from the module-level random stream, so seeding
+    random (as the tests do) also makes the vectorized engine reproducible.
+
+    Args:
+        - state: Per-run engine state dictionary, or None for a one-off generator.
+
+    Returns: A numpy random Generator.
+    """
+    if state is None:
+        return np.random.default_rng(random.getrandbits(64))
+    if 'rng' not in state:
+        state['rng'] = np.random.default_rng(random.getrandbits(64))
+    return state['rng']
+
+
+def vectorized_transitions(M, mitosis_prob, k2, dense, uniforms, origin=None, counters=None):
+    """
+    Apply one generation of C->E, E->D, D->N and mitosis transitions with masks.
+
+    The result follows the rules of the loop engine, in which cells are visited in
+    raster order and write into newM in place. A neighbour above or to the left
+    of a dividing cell has already been visited, so it blocks the division if it
+    is 'E' or 'D' after its own transition. A neighbour below or to the right has
+    not been visited yet, so it blocks if it was 'E' or 'D' at the start of the step.
+
+    Collisions: when several parents target the same neighbour, every one of them
+    succeeds, because a daughter only ever writes 'C' and 'C' never blocks. The
+    neighbour becomes a single 'C' unless its own transition turns it into 'E',
+    which, as in the loop, is written after the daughter and wins.
+
+    A batch of independent grids of shape (replicas, rows, cols) is stepped at once
+    when mitosis_prob and dense are given per replica.
+
+    Args:
+        - M: Current state of the grid, or a batch of grids.
+        - mitosis_prob: Probability of a cancer cell undergoing mitosis this step, per replica for a batch.
+        - k2: Inmune response rate against cancer cells.
+        - dense: A boolean indicating whether the tumor is dense or not, per replica for a batch.
+        - uniforms: Array of shape (2,) + M.shape of uniform draws; the first is
+          used for mitosis and the E/D transitions, the second for C->E.
+        - origin: The origin the division quadrants are measured against, by default the centre of the grid.
+        - counters: Optional counters of a single grid M, see count_cells, updated to those of newM.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    rows, cols = M.shape[-2:]
+    geometry = get_geometry(rows, cols, origin)
+    interior = np.zeros((rows, cols), dtype=bool)
+    interior[1:-1, 1:-1] = True
+    # Per-replica values broadcast over the grid axes
+    mitosis_prob = np.reshape(mitosis_prob, np.shape(mitosis_prob) + (1, 1))
+    cancer = (M == CELL_C) & interior
+    divide = cancer & (uniforms[0] < mitosis_prob)
+    to_edge = cancer & ~divide & (uniforms[1] < k2)
+    to_dead = (M == CELL_E) & interior & (uniforms[0] < K3)
+    to_normal = (M == CELL_D) & interior & (uniforms[0] < K4)
+
+    newM = np.copy(M)
+    newM[to_edge] = CELL_E
+    newM[to_dead] = CELL_D
+    newM[to_normal] = CELL_N
+
+    # Blocking cells as seen by a parent: post-transition above/left, initial below/right
+    blocked_visited = newM >= CELL_E
+    blocked_pending = M >= CELL_E
+    was_normal = newM == CELL_N
+
+    *batch, r, c = np.nonzero(divide)
+    if np.ndim(dense):
+        dense_parent = np.asarray(dense)[batch[0]]
+        choices = np.where(dense_parent[:, None], geometry.target_directions[True][r, c],
+                           geometry.target_directions[False][r, c])
+    else:
+        choices = geometry.target_directions[bool(dense)][r, c]
+    placed = np.zeros(len(r), dtype=bool)
+    for k in range(choices.shape[1]):
+        direction = choices[:, k]
+        target = (*batch, r + DIRECTIONS[direction, 0], c + DIRECTIONS[direction, 1])
+        visited = (direction == UP) | (direction == LT)
+        blocked = np.where(visited, blocked_visited[target], blocked_pending[target])
+        place = ~placed & ~blocked
+        # A daughter survives unless its target is about to become 'E' itself
+        target = tuple(index[place] for index in target)
+        keep = ~blocked_visited[target]
+        newM[tuple(index[keep] for index in target)] = CELL_C
+        placed |= place
+
+    if instrument.enabled():
+        instrument.count_step(M.size, uniforms.size, len(r), np.count_nonzero(placed))
+    if counters is not None:
+        distances = geometry.distances
+        born = was_normal & (newM == CELL_C)
+        n_edge, n_dead, n_normal = (np.count_nonzero(mask) for mask in (to_edge, to_dead, to_normal))
+        counters['Nc'] += np.count_nonzero(born) - n_edge
+        counters['Ne'] += n_edge - n_dead
+        counters['Nd'] += n_dead - n_normal
+        counters['Rsum'] += distances[born].sum() - distances[to_edge].sum()
     return newM
 
 
-# Sample assert statement to ensure function returns a numpy array
-assert isinstance(simulate_tumor_growth_one_step(np.full((ROWS, COLS), 'N'), 0, 1, {}, 0.1, 0.2),
-                  np.ndarray), "Function must return a numpy array"
+def simulate_tumor_growth_one_step_fast(M, generation, time_delay, history, k1, k2, state=None):
+    """
+    Vectorized counterpart of simulate_tumor_growth_one_step.
+
+    All random numbers for the grid are drawn at once and the transitions are
+    applied with masks, see vectorized_transitions for the update rules. The draws
+    come from a numpy generator rather than random, so trajectories follow the
+    same rules as the loop engine but not the same random sequence.
+
+    Args:
+        - M: Current state of the grid.
+        - generation: Current generation of the simulation.
+        - time_delay: Time delay factor for mitosis probability calculation.
+        - history: A record of the previous states of the simulation.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - state: Per-run engine state holding the random generator or 'counter_rng' and,
+          optionally, the 'counters' to keep up to date.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    counters = state.get('counters') if state else None
+    store_history(generation, M, history, counters)
+    dense = history[generation]['dense']
+    delayed_gen = generation - time_delay
+    if delayed_gen in history:
+        dense = history[delayed_gen]['dense']
+
+    mitosis_prob = mitosis_probability(k1, history[generation]['Nc'], time_delay, generation, history)
+    uniforms = keyed_uniforms(state, generation, M.shape)
+    if uniforms is None:
+        uniforms = engine_rng(state).random((2,) + M.shape)
+    return vectorized_transitions(M, mitosis_prob, k2, dense, uniforms, counters=counters)
+
 
-def simulate_tumor_growth_one_step_metastasis(M, k1, k2, ROWS, COLS, ORIGIN):
+def simulate_tumor_growth_one_step_metastasis(M, k1, k2, ROWS, COLS, ORIGIN, state=None):
   
+    M = to_codes(M)
     newM = np.copy(M)
     dense = (density_development(M,ORIGIN) > RHO)
+    # M is not modified during the step, so the mitosis probability is the same for every cell
+    mitosis_prob = basic_mitosis_probability(k1, sum_cell_type(M, CELL_C))
+    geometry = get_geometry(ROWS, COLS, ORIGIN)
+    keyed = keyed_uniforms(state, None, M.shape)
+    stats = step_stats()
 
     for r in range(1, ROWS - 1):
         for c in range(1, COLS - 1):
-            if M[r, c] == 'C':
-                mitosis_prob = basic_mitosis_probability(k1, sum_cell_type(M, 'C'))
-                if random.random() < mitosis_prob:
-                    newM = mitosis(M, newM, r, c, dense)
-                elif random.random() < k2:
-                    newM[r, c] = 'E'
-            elif M[r, c] == 'E' and random.random() < K3:
-                newM[r, c] = 'D'
-            elif M[r, c] == 'D' and random.random() < K4:
-                newM[r, c] = 'N'
+            if M[r, c] == CELL_C:
+                if (random.random() if keyed is None else keyed[0, r, c]) < mitosis_prob:
+                    if stats is not None:
+                        stats['mitosis_attempts'] += 1
+                    newM = mitosis(M, newM, r, c, dense, stats=stats, geometry=geometry)
+                elif (random.random() if keyed is None else keyed[1, r, c]) < k2:
+                    newM[r, c] = CELL_E
+            elif M[r, c] == CELL_E and (random.random() if keyed is None else keyed[0, r, c]) < K3:
+                newM[r, c] = CELL_D
+            elif M[r, c] == CELL_D and (random.random() if keyed is None else keyed[0, r, c]) < K4:
+                newM[r, c] = CELL_N
+    if stats is not None:
+        report_step_stats(stats, M, ROWS, COLS, (ROWS - 2) * (COLS - 2))
     return newM
 
 
-def simulate_tumor_growth(time_delay, generations, k1, k2):
+def simulate_tumor_growth_one_step_metastasis_fast(M, k1, k2, ROWS, COLS, ORIGIN, state=None):
+    """
+    Vectorized counterpart of simulate_tumor_growth_one_step_metastasis.
+
+    Args:
+        - M: Current state of the grid.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - ROWS: The number of rows in the grid.
+        - COLS: The number of columns in the grid.
+        - ORIGIN: The origin used for the tumor density.
+        - state: Per-run engine state holding the random generator or 'counter_rng'.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    dense = (density_development(M, ORIGIN) > RHO)
+    mitosis_prob = basic_mitosis_probability(k1, sum_cell_type(M, CELL_C))
+    uniforms = keyed_uniforms(state, None, M.shape)
+    if uniforms is None:
+        uniforms = engine_rng(state).random((2, ROWS, COLS))
+    return vectorized_transitions(M, mitosis_prob, k2, dense, uniforms, ORIGIN)
+
+
+def active_set(M, state):
+    """
+    Get the active set of a run: the flat indices of all cells that are not 'N'.
+
+    Normal cells never change on their own, so an engine only has to visit the
+    active cells. The set is built on first use and kept in state['active'].
+
+    Args:
+        - M: The current grid.
+        - state: Per-run engine state, or None to build a one-off set.
+
+    Returns: The active set.
+    """
+    if state is None:
+        return set(np.flatnonzero(M != CELL_N).tolist())
+    if 'active' not in state:
+        state['active'] = set(np.flatnonzero(M != CELL_N).tolist())
+    return state['active']
+
+
+def active_interior_cells(active, rows, cols):
+    """
+    List the active cells the loop engine would visit, in the same raster order.
+
+    Args:
+        - active: The active set.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+
+    Returns: A list of (row, column) tuples.
+    """
+    cells = (divmod(index, cols) for index in sorted(active))
+    return [(r, c) for r, c in cells if 0 < r < rows - 1 and 0 < c < cols - 1]
+
+
+def update_active_set(active, newM, vacated, dividers):
+    """
+    Bring the active set up to date with the new grid.
+
+    Args:
+        - active: The active set of the old grid, updated in place.
+        - newM: The new grid.
+        - vacated: Cells that turned from 'D' into 'N' during the step.
+        - dividers: Cells that underwent mitosis; their new daughters join the set.
+    """
+    cols = newM.shape[1]
+    for r, c in vacated:
+        if newM[r, c] == CELL_N:
+            active.discard(r * cols + c)
+    for r, c in dividers:
+        for nr, nc in ((r - 1, c), (r, c + 1), (r + 1, c), (r, c - 1)):
+            if newM[nr, nc] == CELL_C:
+                active.add(nr * cols + nc)
+
+
+def step_active_cells(M, cells, mitosis_prob, k2, dense, counters=None, geometry=None, keyed=None):
+    """
+    Apply the loop engine's cell updates to a list of cells only.
+
+    The cells are visited in the given order and draw from random exactly like the
+    loop engine, so visiting the active cells in raster order gives the same newM
+    and leaves random in the same state.
+
+    Args:
+        - M: Current state of the grid.
+        - cells: The (row, column) cells to update, in raster order.
+        - mitosis_prob: Probability of a cancer cell undergoing mitosis this step.
+        - k2: Inmune response rate against cancer cells.
+        - dense: A boolean indicating whether the tumor is dense or not.
+        - counters: Optional counters of M, see count_cells, updated to those of newM.
+        - geometry: The Geometry of the grid, by default with the origin at its centre.
+        - keyed: Optional (2, len(cells)) counter-based draws of the cells, see
+          keyed_uniforms, used instead of random.
+
+    Returns: Tuple of newM and the lists of vacated and dividing cells for update_active_set.
+    """
+    newM = np.copy(M)
+    if geometry is None:
+        geometry = get_geometry(*M.shape)
+    distances = geometry.distances
+    vacated, dividers = [], []
+    stats = step_stats()
+    for i, (r, c) in enumerate(cells):
+        cell = M[r, c]
+        if cell == CELL_C:
+            if (random.random() if keyed is None else keyed[0, i]) < mitosis_prob:
+                newM = mitosis(M, newM, r, c, dense, counters, stats, geometry)
+                dividers.append((r, c))
+            elif (random.random() if keyed is None else keyed[1, i]) < k2:
+                newM[r, c] = CELL_E
+                if counters is not None:
+                    counters['Nc'] -= 1
+                    counters['Ne'] += 1
+                    counters['Rsum'] -= distances[r, c]
+        elif cell == CELL_E and (random.random() if keyed is None else keyed[0, i]) < K3:
+            newM[r, c] = CELL_D
+            if counters is not None:
+                counters['Ne'] -= 1
+                counters['Nd'] += 1
+        elif cell == CELL_D and (random.random() if keyed is None else keyed[0, i]) < K4:
+            newM[r, c] = CELL_N
+            vacated.append((r, c))
+            if counters is not None:
+                counters['Nd'] -= 1
+    if stats is not None:
+        stats['mitosis_attempts'] = len(dividers)
+        report_step_stats(stats, M, *M.shape, len(cells))
+    return newM, vacated, dividers
+
+
+def simulate_tumor_growth_one_step_active(M, generation, time_delay, history, k1, k2, state=None):
+    """
+    Active-frontier counterpart of simulate_tumor_growth_one_step.
+
+    Only the cells in the active set are visited, so the cost of a step scales with
+    the size of the tumor rather than with the grid. The trajectory is identical to
+    the loop engine's for the same random seed.
+
+    Args:
+        - M: Current state of the grid.
+        - generation: Current generation of the simulation.
+        - time_delay: Time delay factor for mitosis probability calculation.
+        - history: A record of the previous states of the simulation.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - state: Per-run engine state holding the active set and, optionally, the 'counters'
+          and 'counter_rng'.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    counters = state.get('counters') if state else None
+    active = active_set(M, state)
+    store_history(generation, M, history, counters)
+    dense = history[generation]['dense']
+    delayed_gen = generation - time_delay
+    if delayed_gen in history:
+        dense = history[delayed_gen]['dense']
+
+    mitosis_prob = mitosis_probability(k1, history[generation]['Nc'], time_delay, generation, history)
+    cells = active_interior_cells(active, *M.shape)
+    keyed = keyed_uniforms(state, generation, M.shape, cells)
+    newM, vacated, dividers = step_active_cells(M, cells, mitosis_prob, k2, dense, counters, keyed=keyed)
+    update_active_set(active, newM, vacated, dividers)
+    return newM
+
+
+def simulate_tumor_growth_one_step_metastasis_active(M, k1, k2, ROWS, COLS, ORIGIN, state=None):
+    """
+    Active-frontier counterpart of simulate_tumor_growth_one_step_metastasis.
+
+    Args:
+        - M: Current state of the grid.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - ROWS: The number of rows in the grid.
+        - COLS: The number of columns in the grid.
+        - ORIGIN: The origin used for the tumor density.
+        - state: Per-run engine state holding the active set and, optionally, 'counter_rng'.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    active = active_set(M, state)
+    dense = (density_development(M, ORIGIN) > RHO)
+    mitosis_prob = basic_mitosis_probability(k1, sum_cell_type(M, CELL_C))
+    cells = active_interior_cells(active, ROWS, COLS)
+    keyed = keyed_uniforms(state, None, M.shape, cells)
+    newM, vacated, dividers = step_active_cells(M, cells, mitosis_prob, k2, dense,
+                                                geometry=get_geometry(ROWS, COLS, ORIGIN), keyed=keyed)
+    update_active_set(active, newM, vacated, dividers)
+    return newM
+
+
+def step_compiled(M, mitosis_prob, k2, dense, rows, cols, counters=None, geometry=None, keyed=None):
+    """
+    Run the loop engine's cell updates in the compiled kernel, see kernels.step_cells.
+
+    The kernel reads its uniforms from a copy of the random state; random is then
+    advanced by exactly the number of uniforms the loop engine would have drawn.
+    With counter-based draws the kernel reads those of each cell instead and random
+    is left alone.
+
+    Args:
+        - M: Current state of the grid.
+        - mitosis_prob: Probability of a cancer cell undergoing mitosis this step.
+        - k2: Inmune response rate against cancer cells.
+        - dense: A boolean indicating whether the tumor is dense or not.
+        - rows, cols: The extent of the grid the loop engine visits.
+        - counters: Optional counters of M, see count_cells, updated to those of newM.
+        - geometry: The Geometry of the grid, by default with the origin at its centre.
+        - keyed: Optional (2,) + M.shape counter-based draws, see keyed_uniforms.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    newM = np.copy(M)
+    if geometry is None:
+        geometry = get_geometry(*M.shape)
+    if keyed is None:
+        # Cancer cells draw at most twice, effector and dead cells once
+        _, Nc, Ne, Nd = np.bincount(M.ravel(), minlength=4)[:4]
+        uniforms, random_state = kernels.python_random_uniforms(int(2 * Nc + Ne + Nd))
+    else:
+        uniforms = np.ascontiguousarray(keyed).ravel()
+    totals = np.array([counters['Nc'], counters['Ne'], counters['Nd'], counters['Rsum']]
+                      if counters is not None else np.zeros(4), dtype=np.float64)
+    tallies = np.zeros(2, dtype=np.int64)
+    used = kernels.step_cells(M, newM, uniforms, totals, tallies, geometry.distances,
+                              geometry.kernel_targets[bool(dense)], mitosis_prob, k2, K3, K4, rows, cols,
+                              *geometry.origin, keyed is not None)
+    if keyed is None:
+        kernels.advance_python_random(random_state, used)
+    if instrument.enabled():
+        instrument.count_step((rows - 2) * (cols - 2), used, tallies[0], tallies[1])
+    if counters is not None:
+        counters.update(Nc=int(totals[0]), Ne=int(totals[1]), Nd=int(totals[2]), Rsum=float(totals[3]))
+    return newM
+
+
+def simulate_tumor_growth_one_step_compiled(M, generation, time_delay, history, k1, k2, state=None):
+    """
+    Compiled counterpart of simulate_tumor_growth_one_step, with identical results.
+
+    The kernel is compiled with numba when it is installed and interpreted otherwise.
+
+    Args:
+        - M: Current state of the grid.
+        - generation: Current generation of the simulation.
+        - time_delay: Time delay factor for mitosis probability calculation.
+        - history: A record of the previous states of the simulation.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - state: Per-run engine state; its 'counters', if present, are kept up to date, and
+          its 'counter_rng', if present, replaces random.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    counters = state.get('counters') if state else None
+    store_history(generation, M, history, counters)
+    dense = history[generation]['dense']
+    delayed_gen = generation - time_delay
+    if delayed_gen in history:
+        dense = history[delayed_gen]['dense']
+
+    mitosis_prob = mitosis_probability(k1, history[generation]['Nc'], time_delay, generation, history)
+    return step_compiled(M, mitosis_prob, k2, dense, *M.shape, counters,
+                         keyed=keyed_uniforms(state, generation, M.shape))
+
+
+def simulate_tumor_growth_one_step_metastasis_compiled(M, k1, k2, ROWS, COLS, ORIGIN, state=None):
+    """
+    Compiled counterpart of simulate_tumor_growth_one_step_metastasis, with identical results.
+
+    Args:
+        - M: Current state of the grid.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - ROWS: The number of rows in the grid.
+        - COLS: The number of columns in the grid.
+        - ORIGIN: The origin used for the tumor density.
+        - state: Per-run engine state; its 'counter_rng', if present, replaces random.
+
+    Returns: The grid, newM, after one step of simulation.
+    """
+    M = to_codes(M)
+    dense = (density_development(M, ORIGIN) > RHO)
+    mitosis_prob = basic_mitosis_probability(k1, sum_cell_type(M, CELL_C))
+    return step_compiled(M, mitosis_prob, k2, dense, ROWS, COLS, geometry=get_geometry(ROWS, COLS, ORIGIN),
+                         keyed=keyed_uniforms(state, None, M.shape))
+
+
+# Step engines selectable by name in the simulation drivers, see register_engine
+STEP_ENGINES = {}
+METASTASIS_STEP_ENGINES = {}
+MEAN_FIELD_STEP_ENGINES = {}
+
+
+def register_engine(name, step=None, metastasis_step=None, mean_field_step=None):
+    """
+    Register a step engine under a name, making it selectable through engine=name.
+
+    Args:
+        - name: The name of the engine.
+        - step: Optional step function with the signature of simulate_tumor_growth_one_step.
+        - metastasis_step: Optional step function with the signature of
+          simulate_tumor_growth_one_step_metastasis.
+        - mean_field_step: Optional step function with the signature of
+          mean_field.simulate_tumor_growth_one_step.
+    """
+    if step is not None:
+        STEP_ENGINES[name] = step
+    if metastasis_step is not None:
+        METASTASIS_STEP_ENGINES[name] = metastasis_step
+    if mean_field_step is not None:
+        MEAN_FIELD_STEP_ENGINES[name] = mean_field_step
+
+
+def get_engine(name, metastasis=False, mean_field=False):
+    """
+    Look up a registered step engine by name.
+
+    Args:
+        - name: The name of the engine, e.g. 'loop', 'fast', 'active' or 'compiled'.
+        - metastasis: Whether to return the metastasis step function.
+        - mean_field: Whether to return the step function of the mean field model.
+
+    Returns: The step function.
+    """
+    engines = MEAN_FIELD_STEP_ENGINES if mean_field else METASTASIS_STEP_ENGINES if metastasis else STEP_ENGINES
+    if name not in engines:
+        raise ValueError(f"Unknown engine {name!r}, choose one of {sorted(engines)}")
+    return engines[name]
+
+
+register_engine('loop', simulate_tumor_growth_one_step, simulate_tumor_growth_one_step_metastasis)
+register_engine('fast', simulate_tumor_growth_one_step_fast, simulate_tumor_growth_one_step_metastasis_fast)
+register_engine('active', simulate_tumor_growth_one_step_active, simulate_tumor_growth_one_step_metastasis_active)
+register_engine('compiled', simulate_tumor_growth_one_step_compiled, simulate_tumor_growth_one_step_metastasis_compiled)
+
+
+def initial_state(M, incremental=False, seed=None, replica=0):
+    """
+    Create the per-run engine state passed to the step engines.
+
+    Args:
+        - M: The initial grid of cells.
+        - incremental: Whether the engines keep population counters up to date instead
+          of rescanning the grid every generation. The radius then agrees with a
+          rescan up to floating point rounding; set DEBUG_COUNTERS to verify it.
+        - seed: Optional seed of a counter-based random stream, see CounterRNG. Every
+          engine then gives the same trajectory for the same seed, and random is not
+          used. Without it the engines draw from random as before.
+        - replica: The replica number of the counter-based stream.
+
+    Returns: A dictionary of engine state.
+    """
+    state = {'counters': count_cells(M)} if incremental else {}
+    if seed is not None:
+        state['counter_rng'] = CounterRNG(seed, replica)
+    return state
+
+
+def simulate_tumor_growth(time_delay, generations, k1, k2, engine='loop', incremental=False,
+                          history_backend='dict', checkpoint_path=None, checkpoint_interval=50, seed=None):
     """
     Simulate the growth of a tumor over multiple generations.
 
@@ -267,25 +995,126 @@ def simulate_tumor_growth(time_delay, generations, k1, k2):
         - generations: Number of generations to simulate.
         - k1: Proliferation rate of cancer cells.
         - k2: Inmune response rate against cancer cells.
+        - engine: Name of a registered step engine, 'loop', 'fast', 'active' or 'compiled'.
+        - incremental: Keep population counters up to date instead of rescanning, see initial_state.
+        - history_backend: 'dict', 'array' (ArrayHistory) or 'ring' (RingHistory, keeps only
+          the last time_delay + 1 generations).
+        - checkpoint_path: File to checkpoint the run to. If it holds a checkpoint of the same
+          run, the run resumes from it with bit-identical results. Removed once the run finishes.
+        - checkpoint_interval: Number of generations between checkpoints.
+        - seed: Optional seed of a counter-based random stream, see initial_state.
 
     Returns: A dictionary named history recording the state of the simulation at each generation.
     """
-    history = {}  # Initialize history record
-    M = initialize_grid()  # Initialize the grid
+    params = {'time_delay': time_delay, 'generations': generations, 'k1': k1, 'k2': k2, 'engine': engine,
+              'incremental': incremental, 'history_backend': history_backend, 'seed': seed}
+    step = get_engine(engine)
+    resumed = load_checkpoint(checkpoint_path, 'simulation', params)
+    if resumed is None:
+        history = new_history(history_backend, generations, time_delay)  # Initialize history record
+        M = initialize_grid()  # Initialize the grid
+        state = initial_state(M, incremental, seed)
+        start = 0
+    else:
+        # The history holds the delayed window read by mitosis_probability and the dense flag
+        M, state, history, start = resumed['M'], resumed['state'], resumed['history'], resumed['generation']
+        random.setstate(resumed['random_state'])
 
     # Simulate growth over the specified number of generations
-    for g in range(generations):
-        M = simulate_tumor_growth_one_step(M, g, time_delay, history, k1, k2)
+    for g in range(start, generations):
+        instrument.generation(g)
+        with instrument.phase('step'):
+            M = step(M, g, time_delay, history, k1, k2, state)
+        if checkpoint_path is not None and (g + 1) % checkpoint_interval == 0 and g + 1 < generations:
+            save_checkpoint(checkpoint_path, 'simulation', params,
+                            {'M': M, 'state': state, 'history': history, 'generation': g + 1,
+                             'random_state': random.getstate()})
+    remove_checkpoint(checkpoint_path)
 
     # Return the history of the simulation
     return history
 
 
-# Sample assert statement to ensure function returns a dictionary
-assert isinstance(simulate_tumor_growth(1, 10, 0.1, 0.2), dict), "Function must return a dictionary"
+def self_check():
+    """
+    Run the sanity checks of the model, formerly run on every import.
+
+    random is restored afterwards, so the checks do not change later results.
+    """
+    state = random.getstate()
+    try:
+        # Check that the mitosis function returns a numpy array
+        assert isinstance(mitosis(initialize_grid(2, 2, []), initialize_grid(2, 2, []), 0, 0, False), np.ndarray), "Mitosis function must return a numpy array"
+        # Check that the loop and fast engines return a numpy array
+        assert isinstance(simulate_tumor_growth_one_step(initialize_grid(ROWS, COLS, []), 0, 1, {}, 0.1, 0.2),
+                          np.ndarray), "Function must return a numpy array"
+        assert isinstance(simulate_tumor_growth_one_step_fast(initialize_grid(ROWS, COLS, []), 0, 1, {}, 0.1, 0.2),
+                          np.ndarray), "Function must return a numpy array"
+        # Check that a simulation returns a dictionary
+        assert isinstance(simulate_tumor_growth(1, 10, 0.1, 0.2), dict), "Function must return a dictionary"
+    finally:
+        random.setstate(state)
+
+
+# Levels of detail of the snapshots of iter_simulation
+SNAPSHOT_DETAILS = ('counts', 'labels', 'grid')
+
+
+def iter_simulation(time_delay, generations, k1, k2, engine='loop', stride=1, detail='counts', incremental=False,
+                    history_backend='ring', history=None, seed=None):
+    """
+    Simulate the growth of a tumor and yield a snapshot every stride generations.
+
+    Nothing is kept between snapshots apart from the history, which by default only
+    holds the delayed window the engines read, so memory depends on the stride and
+    the consumers rather than on generations x grid size.
+
+    A snapshot is a dictionary with the generation and the counts Nc, Ne, Nd, R and
+    dense of the grid at the start of that generation, as recorded in history. With
+    detail 'labels' it also holds 'labels' and 'clusters' of the cancer cell clusters,
+    with detail 'grid' also the 'grid'; both describe the grid produced by the step
+    of that generation, like the grids of simulate_tumor_growth_with_clusters.
+
+    Args:
+        - time_delay: Time delay factor for mitosis probability calculation.
+        - generations: Number of generations to simulate.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - engine: Name of a registered step engine, 'loop', 'fast', 'active' or 'compiled'.
+        - stride: Yield the generations that are a multiple of stride.
+        - detail: One of SNAPSHOT_DETAILS.
+        - incremental: Keep population counters up to date instead of rescanning, see initial_state.
+        - history_backend: 'dict', 'array' or 'ring', see simulate_tumor_growth.
+        - history: An existing history to record into instead of a new one.
+        - seed: Optional seed of a counter-based random stream, see initial_state.
+
+    Yields: The snapshot dictionaries.
+    """
+    assert detail in SNAPSHOT_DETAILS, f"Snapshot detail must be one of {SNAPSHOT_DETAILS}"
+    assert stride >= 1, "The stride must be at least 1"
+    if history is None:
+        history = new_history(history_backend, generations, time_delay)
+    M = initialize_grid()
+    step = get_engine(engine)
+    state = initial_state(M, incremental, seed)
+
+    for g in range(generations):
+        instrument.generation(g)
+        with instrument.phase('step'):
+            M = step(M, g, time_delay, history, k1, k2, state)
+        if g % stride:
+            continue
+        snapshot = {'generation': g, **history[g]}
+        if detail == 'labels':
+            from .clusters import label_clusters
+            snapshot['labels'], snapshot['clusters'] = label_clusters(M)
+        elif detail == 'grid':
+            snapshot['grid'] = M
+        yield snapshot
 
 
-def simulate_tumor_growth_with_clusters(time_delay, generations, k1, k2):
+def simulate_tumor_growth_with_clusters(time_delay, generations, k1, k2, engine='loop', incremental=False,
+                                        history_backend='dict'):
     """
     Simulate the tumor growth over a number of generations with cluster tracking.
 
@@ -294,25 +1123,21 @@ def simulate_tumor_growth_with_clusters(time_delay, generations, k1, k2):
         - generations: The total number of generations to simulate.
         - k1: Proliferation rate of cancer cells.
         - k2: Inmune response rate against cancer cells.
+        - engine: Name of a registered step engine, 'loop', 'fast', 'active' or 'compiled'.
+        - incremental: Keep population counters up to date instead of rescanning, see initial_state.
+        - history_backend: 'dict' or 'array' (ArrayHistory).
 
     Returns: Tuple of history (dict) of tumor growth and cancer_cell_grid (list) of numpy arrays representing tumor state at each generation.
     """
-    # Initialize history dictionary and the grid
-    history = {}
-    M = initialize_grid()
-    # List to store the grid state at each generation for clusters
-    cancer_cell_grid= []
-
-
-    # Iterate over each generation to simulate tumor growth
-    for g in range(generations):
-        # Simulate one step of tumor growth
-        M = simulate_tumor_growth_one_step(M, g, time_delay, history, k1, k2)
-        # Append the state of the grid to cancer_cell_grid
-        cancer_cell_grid.append(M)
+    # Initialize history dictionary
+    history = new_history(history_backend, generations, time_delay)
+    # List of the grid state at each generation, from the stream of full grids
+    cancer_cell_grid = [snapshot['grid'] for snapshot in
+                        iter_simulation(time_delay, generations, k1, k2, engine, detail='grid',
+                                        incremental=incremental, history=history)]
 
     # Assert statements to verify the correctness of the simulation's output
-    assert isinstance(history, dict), "History must be a dictionary"
+    assert isinstance(history, MutableMapping), "History must be a dictionary or ArrayHistory"
     assert all(isinstance(M, np.ndarray) for M in cancer_cell_grid), "All elements in cancer_cell_grid must be numpy arrays"
     assert len(cancer_cell_grid) == generations, "The length of cancer_cell_grid must be equal to the number of generations"
 
@@ -320,4 +1145,36 @@ def simulate_tumor_growth_with_clusters(time_delay, generations, k1, k2):
     expected_keys = {'Nc', 'Ne', 'Nd', 'R', 'dense'}
     assert all(key in history[0] for key in expected_keys), "History should contain expected keys for simulation data"
 
-    return history, cancer_cell_grid
\ No newline at end of file
+    return history, cancer_cell_grid
+
+
+def simulate_tumor_growth_with_matrices(time_delay, generations, ROWS, COLS, PHI, RHO, K1, K2, K3, K4,
+                                        CANCER_INIT_POSITIONS, ORIGIN):
+    """
+    Simulate the tumor growth and return the history and the grid of every generation,
+    as used by create_csv_data.ipynb to write the history and matrices CSV files.
+
+    The grid shape, the initial positions, the origin and PHI, RHO, K3 and K4 are
+    the module constants of the step engines; other values are rejected rather than
+    silently ignored.
+
+    Args:
+        - time_delay: The delay in generations for mitosis to affect tumor density.
+        - generations: The total number of generations to simulate.
+        - ROWS, COLS: The number of rows and columns in the grid.
+        - PHI, RHO: The carrying capacity and the density threshold.
+        - K1, K2, K3, K4: The transition rates.
+        - CANCER_INIT_POSITIONS: The initial cancer cells.
+        - ORIGIN: The origin of the tumor.
+
+    Returns: Tuple of the history dictionary and the list of grids, as 'N', 'C', 'E', 'D'
+    characters like the matrices CSV file.
+    """
+    constants = globals()
+    for name, value in (('ROWS', ROWS), ('COLS', COLS), ('PHI', PHI), ('RHO', RHO), ('K3', K3), ('K4', K4),
+                        ('CANCER_INIT_POSITIONS', CANCER_INIT_POSITIONS), ('ORIGIN', tuple(ORIGIN))):
+        assert value == constants[name], f"{name} must be the module constant {constants[name]}"
+    history = {}
+    matrices = [to_chars(snapshot['grid']) for snapshot in
+                iter_simulation(time_delay, generations, K1, K2, detail='grid', history=history)]
+    return history, matrices
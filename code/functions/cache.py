@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import random
+import zipfile
+from functools import lru_cache
+import numpy as np
+from .analyze import simulate_and_find_metastasis
+from .ca_model import simulate_tumor_growth
+from .checkpoint import atomic_write
+from .history import HISTORY_FIELDS, ArrayHistory, RingHistory
+
+# Directory and size bound of the default cache; set TUMOR_CA_CACHE to move it
+CACHE_DIR = os.environ.get('TUMOR_CA_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'tumor_ca'))
+CACHE_MAX_BYTES = 512 * 2 ** 20
+# Modules whose code decides the results; editing any of them invalidates the cache
+MODEL_MODULES = ('analyze', 'ca_model', 'clusters', 'counter_rng', 'geometry', 'history', 'kernels')
+# Options that change how a run is carried out but not its results
+UNKEYED_OPTIONS = ('checkpoint_path', 'checkpoint_interval')
+
+
+@lru_cache(maxsize=None)
+def model_code_hash():
+    """Hash of the source of MODEL_MODULES, computed once per process."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in MODEL_MODULES:
+        with open(os.path.join(os.path.dirname(__file__), name + '.py'), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def run_key(kind, params, seed=None):
+    """
+    Key of a simulation run: a hash of the entry point, its parameters, the seed and the model code.
+
+    Args:
+        - kind: The name of the entry point.
+        - params: Dictionary of the parameters of the run, JSON serializable.
+        - seed: The seed of a counter-based stream, see CounterRNG. Without it the run draws
+          from random, and its current state stands in for the seed.
+
+    Returns: A hex digest.
+    """
+    source = {'kind': kind, 'params': params, 'code': model_code_hash(),
+              'seed': seed if seed is not None else repr(random.getstate())}
+    return hashlib.blake2b(json.dumps(source, sort_keys=True, default=str).encode(), digest_size=20).hexdigest()
+
+
+def encode_random_state(state):
+    """Encode a state of random as an array: the 625 words of the generator, then the cached gauss."""
+    version, words, gauss = state
+    assert version == 3, "Only random states of version 3 are supported"
+    return np.array(words, dtype=np.uint32), np.float64(np.nan if gauss is None else gauss)
+
+
+def decode_random_state(words, gauss):
+    """Inverse of encode_random_state."""
+    return 3, tuple(int(word) for word in words), None if np.isnan(gauss) else float(gauss)
+
+
+class ResultCache:
+    """
+    On-disk cache of simulation results, one compressed .npz file of arrays per run key.
+
+    The least recently used files are removed once the cache grows beyond max_bytes;
+    reading a file counts as using it.
+
+    Args:
+        - directory: The directory of the cache, created if missing.
+        - max_bytes: The size bound of the cache.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory, self.max_bytes = directory, max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """The file of a key."""
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """
+        Read the arrays stored under a key.
+
+        Returns: A dictionary of arrays, or None when the key is not cached. A truncated or
+        corrupted file is removed and counts as not cached.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            os.remove(path)
+            return None
+        os.utime(path)
+        return arrays
+
+    def put(self, key, arrays):
+        """Store a dictionary of arrays under a key, then evict down to max_bytes."""
+        with atomic_write(self.path(key)) as file:
+            np.savez_compressed(file, **arrays)
+        self.evict(keep=key)
+
+    def entries(self):
+        """The (last use, size, path) of every cached file, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def size(self):
+        """The total size of the cached files in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Remove the least recently used files until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every cached file."""
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+def cached_run(kind, params, seed, compute, encode, decode, cache=None, refresh=False):
+    """
+    Run a simulation through the cache.
+
+    Runs drawing from random restore the state random would be left in by the run, so
+    a cached result leaves the program in the same state as a fresh one.
+
+    Args:
+        - kind: The name of the entry point.
+        - params: Dictionary of the parameters that decide the result.
+        - seed: The seed of a counter-based stream, or None for runs drawing from random.
+        - compute: Function running the simulation.
+        - encode: Function turning the result into a dictionary of arrays.
+        - decode: Inverse of encode.
+        - cache: A ResultCache, None for the default one or False to bypass the cache.
+        - refresh: Whether to run the simulation even when cached, replacing the stored result.
+
+    Returns: The result of compute, or the cached one.
+    """
+    if cache is False:
+        return compute()
+    cache = cache if cache is not None else ResultCache()
+    key = run_key(kind, params, seed)
+    arrays = None if refresh else cache.get(key)
+    if arrays is not None:
+        if seed is None:
+            random.setstate(decode_random_state(arrays.pop('random_words'), arrays.pop('random_gauss')))
+        return decode(arrays)
+
+    result = compute()
+    arrays = encode(result)
+    if seed is None:
+        arrays['random_words'], arrays['random_gauss'] = encode_random_state(random.getstate())
+    cache.put(key, arrays)
+    return result
+
+
+def encode_history(history):
+    """Encode any history as its generations and column arrays."""
+    generations = sorted(history)
+    arrays = {field: np.array([history[g][field] for g in generations]) for field in HISTORY_FIELDS}
+    arrays['generation'] = np.array(generations, dtype=np.int64)
+    return arrays
+
+
+def decode_history(arrays, backend='dict', time_delay=0):
+    """Rebuild a history of the given backend, see new_history, from encode_history."""
+    generations = arrays['generation'].tolist()
+    if backend == 'array':
+        history = ArrayHistory(len(generations))
+    elif backend == 'ring':
+        history = RingHistory(time_delay)
+    else:
+        history = {}
+    for i, g in enumerate(generations):
+        history[g] = {field: arrays[field][i] for field in HISTORY_FIELDS}
+    return history
+
+
+def cached_simulate_tumor_growth(time_delay, generations, k1, k2, cache=None, refresh=False, **options):
+    """
+    simulate_tumor_growth through the on-disk cache, see cached_run.
+
+    Args:
+        - time_delay, generations, k1, k2: As in simulate_tumor_growth.
+        - cache: A ResultCache, None for the default one or False to bypass the cache.
+        - refresh: Whether to re-run and replace a cached result.
+        - options: Further arguments of simulate_tumor_growth, e.g. engine or seed.
+
+    Returns: The history, as simulate_tumor_growth returns it.
+    """
+    params = {'time_delay': time_delay, 'generations': generations, 'k1': k1, 'k2': k2,
+              **{name: value for name, value in options.items() if name not in UNKEYED_OPTIONS}}
+    return cached_run('simulate_tumor_growth', params, options.get('seed'),
+                      lambda: simulate_tumor_growth(time_delay, generations, k1, k2, **options), encode_history,
+                      lambda arrays: decode_history(arrays, options.get('history_backend', 'dict'), time_delay),
+                      cache, refresh)
+
+
+def cached_simulate_and_find_metastasis(generations, rows, cols, k1, k2, cache=None, refresh=False, **options):
+    """
+    simulate_and_find_metastasis through the on-disk cache, see cached_run.
+
+    Args:
+        - generations, rows, cols, k1, k2: As in simulate_and_find_metastasis.
+        - cache: A ResultCache, None for the default one or False to bypass the cache.
+        - refresh: Whether to re-run and replace a cached result.
+        - options: Further arguments of simulate_and_find_metastasis, e.g. engine.
+
+    Returns: Tuple of the number of clusters per generation and Tm.
+    """
+    params = {'generations': generations, 'rows': rows, 'cols': cols, 'k1': k1, 'k2': k2, **options}
+    return cached_run('simulate_and_find_metastasis', params, None,
+                      lambda: simulate_and_find_metastasis(generations, rows, cols, k1, k2, **options),
+                      lambda result: {'clusters': np.array(result[0], dtype=np.int64),
+                                      'Tm': np.int64(-1 if result[1] is None else result[1])},
+                      lambda arrays: (arrays['clusters'].tolist(), None if arrays['Tm'] < 0 else int(arrays['Tm'])),
+                      cache, refresh)
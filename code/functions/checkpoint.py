@@ -0,0 +1,72 @@
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='wb', **open_args):
+    """
+    Open a temporary file that replaces path only once it is completely written.
+
+    A crash while writing leaves the previous file, if any, untouched instead of
+    a half-written one. Usable for checkpoints as well as for CSV files.
+
+    Args:
+        - path: The path of the file to write.
+        - mode: 'wb' or 'w'.
+        - open_args: Further arguments for open, e.g. newline='' and encoding='utf-8'.
+
+    Returns: The open temporary file, as a context manager.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **open_args) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def save_checkpoint(path, kind, params, payload):
+    """
+    Atomically write a checkpoint.
+
+    Args:
+        - path: The path of the checkpoint file.
+        - kind: What is checkpointed, e.g. 'simulation' or 'sweep'.
+        - params: The parameters of the run; a checkpoint only resumes a run with the same ones.
+        - payload: Dictionary of everything needed to resume, e.g. the grid and the random state.
+    """
+    with atomic_write(path) as file:
+        pickle.dump({'kind': kind, 'params': params, 'payload': payload}, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path, kind, params):
+    """
+    Read a checkpoint written by save_checkpoint, if there is one.
+
+    Args:
+        - path: The path of the checkpoint file, or None.
+        - kind: What is checkpointed, e.g. 'simulation' or 'sweep'.
+        - params: The parameters of the run being resumed.
+
+    Returns: The payload, or None if there is no checkpoint.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        checkpoint = pickle.load(file)
+    if checkpoint['kind'] != kind or checkpoint['params'] != params:
+        raise ValueError(f"Checkpoint {path} belongs to a different run: {checkpoint['kind']} {checkpoint['params']}")
+    return checkpoint['payload']
+
+
+def remove_checkpoint(path):
+    """Remove the checkpoint of a finished run, if there is one."""
+    if path is not None and os.path.exists(path):
+        os.remove(path)
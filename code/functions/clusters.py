@@ -0,0 +1,215 @@
+import numpy as np
+from .ca_model import CELL_C, to_codes
+
+
+def union_find_roots(n, a, b):
+    """
+    Find the connected components of a graph with numpy union-find.
+
+    Every round hooks the larger root of each edge onto the smaller one and then
+    compresses all paths by pointer jumping, until no edge joins two roots.
+
+    Args:
+        - n: The number of nodes.
+        - a, b: Integer arrays with the end points of every edge.
+
+    Returns: An array with the root, the smallest node index, of every node's component.
+    """
+    parent = np.arange(n)
+    while True:
+        pa, pb = parent[a], parent[b]
+        differ = pa != pb
+        if not differ.any():
+            return parent
+        np.minimum.at(parent, np.maximum(pa[differ], pb[differ]), np.minimum(pa[differ], pb[differ]))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def label_mask(mask):
+    """
+    Label the 4-connected components of a boolean mask.
+
+    Args:
+        - mask: Boolean array of cells to label.
+
+    Returns: Tuple of an int32 label array (0 outside the mask, clusters numbered
+    from 1 in raster order of their first cell) and the number of clusters.
+    """
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    n = np.count_nonzero(mask)
+    if n == 0:
+        return labels, 0
+    index = np.full(mask.shape, -1, dtype=np.int64)
+    index[mask] = np.arange(n)
+    horizontal = mask[:, :-1] & mask[:, 1:]
+    vertical = mask[:-1, :] & mask[1:, :]
+    a = np.concatenate([index[:, :-1][horizontal], index[:-1, :][vertical]])
+    b = np.concatenate([index[:, 1:][horizontal], index[1:, :][vertical]])
+    roots = union_find_roots(n, a, b)
+    # Roots are the first cell of each cluster in raster order, so unique keeps that order
+    _, compact = np.unique(roots, return_inverse=True)
+    labels[mask] = compact + 1
+    return labels, int(compact.max()) + 1
+
+
+def label_clusters(grid):
+    """
+    Label the clusters of cancer cells in a grid.
+
+    Gives the same clusters as analyze.find_clusters, as a label array instead of
+    sets of coordinates.
+
+    Args:
+        - grid: The grid of cells.
+
+    Returns: Tuple of the label array (0 for non-cancer cells) and the number of clusters.
+    """
+    return label_mask(to_codes(grid) == CELL_C)
+
+
+def count_clusters(grid):
+    """
+    Count the clusters of cancer cells in a grid.
+
+    Args:
+        - grid: The grid of cells.
+
+    Returns: The number of clusters.
+    """
+    return label_clusters(grid)[1]
+
+
+def self_check():
+    """Run the sanity check of the cluster labelling, formerly run on every import."""
+    assert count_clusters(np.array([['C', 'N', 'C'], ['C', 'N', 'C'], ['N', 'C', 'N']])) == 3, "The label_clusters function did not find the correct clusters."
+
+
+def dilate(mask):
+    """Grow a boolean mask by its 4-neighbours."""
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
+
+
+def label_boxes(labels, offset=(0, 0)):
+    """
+    Find the bounding box of every label in a label array.
+
+    Args:
+        - labels: Integer label array, 0 outside every cluster.
+        - offset: The (row, column) of labels[0, 0] in the whole grid.
+
+    Returns: A dictionary mapping each label to its (first row, end row, first column,
+    end column) in the whole grid, the ends exclusive.
+    """
+    rows, cols = np.nonzero(labels)
+    if not len(rows):
+        return {}
+    values, inverse = np.unique(labels[rows, cols], return_inverse=True)
+    bounds = np.zeros((4, len(values)), dtype=np.int64)
+    bounds[0], bounds[2] = labels.shape
+    np.minimum.at(bounds[0], inverse, rows)
+    np.maximum.at(bounds[1], inverse, rows + 1)
+    np.minimum.at(bounds[2], inverse, cols)
+    np.maximum.at(bounds[3], inverse, cols + 1)
+    bounds += np.array([offset[0], offset[0], offset[1], offset[1]])[:, None]
+    return {int(label): tuple(box) for label, box in zip(values.tolist(), bounds.T.tolist())}
+
+
+class ClusterTracker:
+    """
+    Track cancer cell clusters from generation to generation.
+
+    Finding the changed cells is one comparison of the old and new grids; the labelling
+    itself only runs over the window spanning the changed cells and the clusters they
+    touch, found from the kept bounding box of every cluster. Every other cluster keeps
+    its label without being visited again, so the cost of an update scales with the
+    size of the changes rather than with the grid, save for the comparison.
+    A cluster that continues as exactly one cluster keeps its label, clusters formed
+    by a birth, merge or split get a new label.
+
+    Args:
+        - grid: The grid of the first generation.
+    """
+
+    def __init__(self, grid):
+        self.cancer = to_codes(grid) == CELL_C
+        self.labels, self.count = label_mask(self.cancer)
+        self.next_label = self.count + 1
+        self.boxes = label_boxes(self.labels)
+
+    def update(self, grid):
+        """
+        Update the labels to a new generation.
+
+        Args:
+            - grid: The grid of the next generation.
+
+        Returns: A dictionary of events: 'births' and 'deaths' list labels, 'merges'
+        maps each new label to the old labels it joins and 'splits' maps each old
+        label to the new labels it broke into.
+        """
+        events = {'births': [], 'deaths': [], 'merges': {}, 'splits': {}}
+        cancer = to_codes(grid) == CELL_C
+        rows, cols = np.nonzero(cancer != self.cancer)
+        if not len(rows):
+            return events
+
+        # Any cluster that can gain, lose or join cells touches a changed cell
+        r0, r1 = max(rows.min() - 1, 0), min(rows.max() + 2, cancer.shape[0])
+        c0, c1 = max(cols.min() - 1, 0), min(cols.max() + 2, cancer.shape[1])
+        changed = np.zeros((r1 - r0, c1 - c0), dtype=bool)
+        changed[rows - r0, cols - c0] = True
+        affected = np.unique(self.labels[r0:r1, c0:c1][dilate(changed)])
+        affected = affected[affected > 0]
+        # The window spans the changed cells and every affected cluster
+        for label in affected.tolist():
+            top, bottom, left, right = self.boxes.pop(label)
+            r0, r1, c0, c1 = min(r0, top), max(r1, bottom), min(c0, left), max(c1, right)
+        window = np.s_[r0:r1, c0:c1]
+        labels, old_cancer, new_cancer = self.labels[window], self.cancer[window], cancer[window]
+        in_affected = np.isin(labels, affected)
+        region = new_cancer & (in_affected | (new_cancer != old_cancer))
+        local, n_local = label_mask(region)
+
+        # Overlaps between old and new clusters, through cells that stayed cancerous
+        kept = region & old_cancer
+        pairs = np.unique(labels[kept].astype(np.int64) * (n_local + 1) + local[kept])
+        old_of_new = {new: [] for new in range(1, n_local + 1)}
+        new_of_old = {old: [] for old in affected.tolist()}
+        for old, new in zip(*(part.tolist() for part in np.divmod(pairs, n_local + 1))):
+            old_of_new[new].append(old)
+            new_of_old[old].append(new)
+
+        relabel = np.zeros(n_local + 1, dtype=np.int32)
+        for new, olds in old_of_new.items():
+            if len(olds) == 1 and len(new_of_old[olds[0]]) == 1:
+                relabel[new] = olds[0]
+                continue
+            relabel[new] = self.next_label
+            self.next_label += 1
+            if not olds:
+                events['births'].append(int(relabel[new]))
+            elif len(olds) > 1:
+                events['merges'][int(relabel[new])] = olds
+        for old, news in new_of_old.items():
+            if not news:
+                events['deaths'].append(old)
+            elif len(news) > 1:
+                events['splits'][old] = [int(relabel[new]) for new in news]
+
+        # labels is a view, so this writes the window of self.labels
+        labels[in_affected] = 0
+        labels[region] = relabel[local[region]]
+        for new, box in label_boxes(local, (r0, c0)).items():
+            self.boxes[int(relabel[new])] = box
+        self.cancer = cancer
+        self.count += n_local - len(affected)
+        return events
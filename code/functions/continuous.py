@@ -0,0 +1,346 @@
+import numpy as np
+from .ca_model import K3, K4, PHI
+
+# Populations of the continuous model, in the order of its state vector
+DDE_FIELDS = ('Nc', 'Ne', 'Nd')
+# Stepping schemes of solve_dde
+DDE_METHODS = ('fixed', 'adaptive')
+# Coefficient of the weakly nonlinear limit-cycle amplitude of Wright's equation
+WRIGHT_AMPLITUDE = 40 / (3 * np.pi - 2)
+
+
+def growth_rate(k1, k2):
+    """
+    Net growth rate r of the cancer cells of a small tumor in the continuous model.
+
+    A cancer cell divides with probability p = k1 (1 - N(t - tau) / PHI) and otherwise
+    turns into an effector cell with probability k2, so dNc/dt = Nc (p (1 + k2) - k2),
+    the delayed logistic equation dNc/dt = r Nc (1 - N(t - tau) / K).
+
+    Args:
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+
+    Returns: r = k1 (1 + k2) - k2, broadcast over the parameters.
+    """
+    k1, k2 = np.asarray(k1, dtype=float), np.asarray(k2, dtype=float)
+    return k1 * (1 + k2) - k2
+
+
+def carrying_capacity(k1, k2, phi=PHI):
+    """
+    Carrying capacity K of the delayed logistic equation, see growth_rate.
+
+    Args:
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - phi: The cell capacity PHI of the mitosis probability.
+
+    Returns: K = phi r / (k1 (1 + k2)), 0 where the tumor cannot grow (r <= 0).
+    """
+    k1, k2 = np.asarray(k1, dtype=float), np.asarray(k2, dtype=float)
+    r = growth_rate(k1, k2)
+    return np.where(r > 0, phi * r / np.where(r > 0, k1 * (1 + k2), 1), 0.0)
+
+
+def fixed_points(k1, k2, phi=PHI):
+    """
+    The equilibrium populations of the continuous model.
+
+    Besides the trivial equilibrium without a tumor, the model has one with
+    Nc = K, where the mitosis probability is k2 / (1 + k2), so that divisions and
+    conversions to effector cells balance.
+
+    Args:
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - phi: The cell capacity PHI of the mitosis probability.
+
+    Returns: A dictionary of Nc, Ne and Nd at the non-trivial equilibrium, 0 where it does not exist.
+    """
+    k2 = np.asarray(k2, dtype=float)
+    Nc = carrying_capacity(k1, k2, phi)
+    Ne = k2 / (1 + k2) * Nc / K3
+    return {'Nc': Nc, 'Ne': Ne, 'Nd': K3 * Ne / K4}
+
+
+def hopf_delay(k1, k2):
+    """
+    The delay at which the tumor equilibrium loses stability in a Hopf bifurcation.
+
+    Linearised around Nc = K the model is Wright's equation, whose equilibrium is
+    stable for r tau < pi / 2 and oscillates with period 4 tau just beyond it.
+
+    Args:
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+
+    Returns: The critical delay pi / (2 r), infinite where the tumor cannot grow.
+    """
+    r = growth_rate(k1, k2)
+    return np.where(r > 0, np.pi / 2 / np.where(r > 0, r, 1), np.inf)
+
+
+def hopf_amplitude(tau, k1, k2, phi=PHI):
+    """
+    The weakly nonlinear estimate of the Nc limit-cycle amplitude beyond the Hopf bifurcation.
+
+    The relative deviation from K oscillates with amplitude sqrt(40 (r tau - pi / 2) / (3 pi - 2)),
+    accurate close to the threshold; compare with limit_cycle_amplitude of a solution further away.
+
+    Args:
+        - tau: The time delay.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - phi: The cell capacity PHI of the mitosis probability.
+
+    Returns: The amplitude in cells, 0 where the equilibrium is stable.
+    """
+    excess = np.maximum(growth_rate(k1, k2) * np.asarray(tau, dtype=float) - np.pi / 2, 0)
+    return carrying_capacity(k1, k2, phi) * np.sqrt(WRIGHT_AMPLITUDE * excess)
+
+
+class DelayHistory:
+    """
+    The computed past of a vector of solutions, for the delayed lookups of solve_dde.
+
+    Stores the state (log Nc, Ne, Nd) and its derivative at every accepted time, shared
+    by all parameter points, and interpolates with cubic Hermite polynomials, as accurate
+    as the steps.
+
+    Args:
+        - points: The number of parameter points.
+        - capacity: The number of times to preallocate; the buffers grow when full.
+    """
+
+    def __init__(self, points, capacity=1024):
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, len(DDE_FIELDS), points))
+        self.slopes = np.zeros((capacity, len(DDE_FIELDS), points))
+        self.size = 0
+        self.columns = np.arange(points)
+
+    def append(self, t, y, rates):
+        """Record the state y and its derivative at time t, later than the times recorded before."""
+        if self.size == len(self.times):
+            self.times = np.concatenate([self.times, np.zeros(self.size)])
+            self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+            self.slopes = np.concatenate([self.slopes, np.zeros_like(self.slopes)])
+        self.times[self.size], self.values[self.size], self.slopes[self.size] = t, y, rates
+        self.size += 1
+
+    def _interval(self, s):
+        # The recorded interval holding every time in s, and the position within it
+        times = self.times[:self.size]
+        i = np.searchsorted(times, s, side='right') - 1
+        i = np.minimum(np.maximum(i, 0), self.size - 2)
+        h = times[i + 1] - times[i]
+        return i, h, (s - times[i]) / h
+
+    @staticmethod
+    def _hermite(y0, y1, d0, d1, x):
+        x2 = x * x
+        x3 = x2 * x
+        return y0 + (3 * x2 - 2 * x3) * (y1 - y0) + (x3 - 2 * x2 + x) * d0 + (x3 - x2) * d1
+
+    def __call__(self, s):
+        """log Nc of every point at its own time s, an array of one time per point."""
+        if self.size == 1:
+            return self.values[0, 0].copy()
+        i, h, x = self._interval(s)
+        values, slopes, columns = self.values[:, 0], self.slopes[:, 0], self.columns
+        return self._hermite(values[i, columns], values[i + 1, columns],
+                             slopes[i, columns] * h, slopes[i + 1, columns] * h, x)
+
+    def sample(self, times):
+        """
+        The state of every point at the given times, within the recorded times.
+
+        Returns: An array of shape (3, points, len(times)) of log Nc, Ne and Nd.
+        """
+        times = np.asarray(times, dtype=float)
+        if self.size == 1:
+            return np.repeat(self.values[0][..., None], len(times), axis=-1)
+        i, h, x = self._interval(times)
+        h, x = h[:, None, None], x[:, None, None]
+        sampled = self._hermite(self.values[i], self.values[i + 1], self.slopes[i] * h, self.slopes[i + 1] * h, x)
+        return np.moveaxis(sampled, 0, -1)
+
+
+def dde_rates(y, delayed, k1, k2, phi=PHI):
+    """
+    Right-hand side of the continuous model for a vector of parameter points.
+
+    The expected change per generation of the cellular automaton: a cancer cell divides
+    with the mitosis probability of mitosis_probability, clipped to [0, 1], otherwise
+    turns into an effector cell with probability k2; effector cells die at rate K3 and
+    dead cells are cleared at rate K4.
+
+    Nc is integrated as log Nc, whose rate p (1 + k2) - k2 stays bounded while Nc
+    swings over orders of magnitude at long delays, so the steps can stay large.
+
+    Args:
+        - y: The state, shape (3, points), rows log Nc, Ne, Nd.
+        - delayed: Nc at time t - tau of every point.
+        - k1: Proliferation rate of cancer cells, per point.
+        - k2: Inmune response rate against cancer cells, per point.
+        - phi: The cell capacity PHI of the mitosis probability.
+
+    Returns: The derivative of y, shape (3, points).
+    """
+    log_Nc, Ne, Nd = y
+    p = np.minimum(np.maximum(k1 * (1 - delayed / phi), 0), 1)
+    to_edge = (1 - p) * k2 * np.exp(log_Nc)
+    rates = np.empty_like(y)
+    rates[0] = p * (1 + k2) - k2
+    rates[1] = to_edge - K3 * Ne
+    rates[2] = K3 * Ne - K4 * Nd
+    return rates
+
+
+class DDESolution:
+    """
+    Solution of the continuous model for an array of parameter points.
+
+    Attributes:
+        - tau, k1, k2: The parameters, broadcast to the shape of the parameter array.
+        - generation: The sample times 0, 1, ..., generations - 1.
+        - Nc, Ne, Nd: The populations at every generation, shape tau.shape + (generations,),
+          comparable with history columns of the cellular automaton.
+        - steps: The number of accepted integration steps.
+    """
+
+    def __init__(self, tau, k1, k2, generation, values, steps):
+        self.tau, self.k1, self.k2 = tau, k1, k2
+        self.generation = generation
+        for field, value in zip(DDE_FIELDS, values):
+            setattr(self, field, value)
+        self.steps = steps
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+
+def solve_dde(tau, k1, k2, generations, n0=5, method='adaptive', step=0.1, rtol=1e-4, atol=0.1, phi=PHI):
+    """
+    Integrate the continuous model for a whole array of (tau, k1, k2) parameter points at once.
+
+    All points share the time steps, so every step is a few array operations over the
+    points and a bifurcation diagram over thousands of delays costs one integration.
+    The delayed Nc is interpolated from a history buffer. As in mitosis_probability,
+    the delay only acts once t >= tau; before that the current Nc is used.
+
+    Steps are capped at the smallest positive delay, so the delayed value always lies
+    in the computed past. A delay of 0 gives the undelayed logistic equation.
+
+    Args:
+        - tau: The time delays, in generations.
+        - k1: Proliferation rates of cancer cells.
+        - k2: Inmune response rates against cancer cells.
+        - generations: The number of generations to sample, from generation 0.
+        - n0: The initial number of cancer cells, 5 in the cellular automaton.
+        - method: 'fixed' for classical Runge-Kutta steps of size step, 'adaptive' for
+          Bogacki-Shampine steps controlled by rtol and atol over all points.
+        - step: The step size, or the first step size of the adaptive method, in generations.
+        - rtol, atol: The relative and absolute (in cells) tolerances of the adaptive method.
+        - phi: The cell capacity PHI of the mitosis probability.
+
+    Returns: A DDESolution, with arrays of the broadcast shape of tau, k1 and k2.
+    """
+    assert method in DDE_METHODS, f"Unknown method {method!r}, choose one of {DDE_METHODS}"
+    tau, k1, k2 = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (tau, k1, k2)))
+    shape = tau.shape
+    taus, k1s, k2s = tau.ravel(), k1.ravel(), k2.ravel()
+    points = taus.size
+    end = max(generations - 1, 0)
+    positive = taus[taus > 0]
+    max_step = min(positive.min(), 1.0) if positive.size else 1.0
+    h = min(step, max_step)
+
+    y = np.zeros((3, points))
+    y[0] = np.log(n0)
+    history = DelayHistory(points)
+
+    def rates_at(t, y):
+        # Nc at t - tau, or the current Nc of the points whose delay does not act yet
+        delayed = np.exp(np.where(t >= taus, history(t - taus), y[0]))
+        return dde_rates(y, delayed, k1s, k2s, phi)
+
+    t, steps = 0.0, 0
+    rates = dde_rates(y, np.exp(y[0]), k1s, k2s, phi)
+    history.append(t, y, rates)
+    while t < end - 1e-12:
+        h = min(h, end - t)
+        if method == 'fixed':
+            s2 = rates_at(t + h / 2, y + h / 2 * rates)
+            s3 = rates_at(t + h / 2, y + h / 2 * s2)
+            s4 = rates_at(t + h, y + h * s3)
+            y = y + h / 6 * (rates + 2 * s2 + 2 * s3 + s4)
+            t += h
+            rates = rates_at(t, y)
+        else:
+            s2 = rates_at(t + h / 2, y + h / 2 * rates)
+            s3 = rates_at(t + 3 * h / 4, y + 3 * h / 4 * s2)
+            new = y + h * (2 / 9 * rates + 1 / 3 * s2 + 4 / 9 * s3)
+            s4 = rates_at(t + h, new)
+            error = h * (-5 / 72 * rates + 1 / 12 * s2 + 1 / 9 * s3 - 1 / 8 * s4)
+            # An error in log Nc is a relative error in Nc
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(new))
+            scale[0] = rtol
+            norm = np.max(np.abs(error) / scale, initial=0)
+            factor = min(5.0, max(0.2, 0.9 * norm ** (-1 / 3))) if norm > 0 else 5.0
+            h_used, h = h, min(h * factor, max_step)
+            if norm > 1:
+                continue
+            y, rates, t = new, s4, t + h_used
+        history.append(t, y, rates)
+        steps += 1
+
+    generation = np.arange(generations)
+    values = history.sample(generation)
+    values[0] = np.exp(values[0])
+    values = [value.reshape(shape + (generations,)) for value in values]
+    return DDESolution(tau, k1, k2, generation, values, steps)
+
+
+def limit_cycle_amplitude(values, tail=0.5):
+    """
+    Measure the oscillation amplitude of trajectories, half their range over the final part.
+
+    Works on a DDESolution field as well as on a history column of the cellular automaton.
+
+    Args:
+        - values: Trajectories with generations along the last axis.
+        - tail: The final fraction of the generations to measure, after the transient.
+
+    Returns: Half the peak-to-peak range of every trajectory over the tail.
+    """
+    values = np.asarray(values, dtype=float)
+    start = min(int(values.shape[-1] * (1 - tail)), values.shape[-1] - 1)
+    final = values[..., start:]
+    return (final.max(axis=-1) - final.min(axis=-1)) / 2
+
+
+def bifurcation_diagram(taus, k1, k2, generations=1000, tail=0.5, **solve_args):
+    """
+    Bifurcation diagram of Nc over the time delay, from one vectorized integration.
+
+    Args:
+        - taus: The time delays.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - generations: The number of generations to integrate.
+        - tail: The final fraction of the generations the extremes are taken over.
+        - solve_args: Further arguments of solve_dde, e.g. method or step.
+
+    Returns: A dictionary with the delays 'tau', the 'min', 'max' and 'amplitude' of Nc
+    over the tail per delay, the equilibrium 'fixed_point', the 'hopf_delay' and the
+    weakly nonlinear 'hopf_amplitude' estimate per delay.
+    """
+    taus = np.asarray(taus, dtype=float)
+    solution = solve_dde(taus, k1, k2, generations, **solve_args)
+    start = min(int(generations * (1 - tail)), generations - 1)
+    final = solution.Nc[..., start:]
+    return {'tau': taus, 'min': final.min(axis=-1), 'max': final.max(axis=-1),
+            'amplitude': limit_cycle_amplitude(solution.Nc, tail), 'fixed_point': fixed_points(k1, k2)['Nc'],
+            'hopf_delay': hopf_delay(k1, k2), 'hopf_amplitude': hopf_amplitude(taus, k1, k2)}
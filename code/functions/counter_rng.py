@@ -0,0 +1,115 @@
+import numpy as np
+
+# Random draws per cell and generation: the first decides mitosis, E -> D and D -> N,
+# the second C -> E for cancer cells that do not divide, as in the loop engine
+DRAWS = 2
+# Increment of the SplitMix64 generator, the odd integer closest to 2**64 / golden ratio
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_SHIFTS = (np.uint64(30), np.uint64(27), np.uint64(31))
+_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+def splitmix64(x):
+    """
+    The SplitMix64 output function: a bijective mix of 64-bit integers.
+
+    Args:
+        - x: Array of uint64 values; arithmetic wraps modulo 2**64.
+
+    Returns: The mixed uint64 values.
+    """
+    x = np.array(x, dtype=np.uint64, ndmin=1)
+    x = (x ^ (x >> _SHIFTS[0])) * _MULTIPLIERS[0]
+    x = (x ^ (x >> _SHIFTS[1])) * _MULTIPLIERS[1]
+    return x ^ (x >> _SHIFTS[2])
+
+
+def stream_key(seed, replica, generation):
+    """
+    The 64-bit key of the random stream of one generation of one replica of a run.
+
+    Args:
+        - seed: The seed of the run.
+        - replica: The replica number.
+        - generation: The generation.
+
+    Returns: The key, a uint64 array of one element.
+    """
+    key = splitmix64(np.uint64(seed % 2 ** 64))
+    for part in (replica, generation):
+        key = splitmix64(key ^ splitmix64(np.uint64(part % 2 ** 64)))
+    return key
+
+
+def draws(seed, replica, generation, cells):
+    """
+    The uniform draws of the given cells for one generation.
+
+    Draw d of cell number n is the SplitMix64 output at counter n * DRAWS + d of the
+    stream of the generation, see stream_key.
+
+    Args:
+        - seed: The seed of the run.
+        - replica: The replica number.
+        - generation: The generation.
+        - cells: Array of cell numbers, r * cols + c.
+
+    Returns: Array of shape (DRAWS,) + cells.shape of uniforms in [0, 1).
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    counters = cells[None] * np.uint64(DRAWS) + np.arange(DRAWS, dtype=np.uint64).reshape((DRAWS,) + (1,) * cells.ndim)
+    bits = splitmix64(stream_key(seed, replica, generation) + counters * GOLDEN_GAMMA).reshape(counters.shape)
+    # The top 53 bits give a double in [0, 1), as numpy's random does
+    return (bits >> np.uint64(11)) * 2.0 ** -53
+
+
+def cell_uniforms(seed, replica, generation, rows, cols, region=None):
+    """
+    The uniform draws of every cell of a grid for one generation.
+
+    Draw d of the cell at (r, c) is a hash of (seed, replica, generation, r * cols + c, d),
+    see draws. It depends on nothing else, so any engine, visiting cells in any order,
+    in any subset or in separate tiles, sees the same numbers.
+
+    Args:
+        - seed: The seed of the run.
+        - replica: The replica number.
+        - generation: The generation.
+        - rows, cols: The shape of the whole grid, which numbers the cells.
+        - region: Optional (row_start, row_stop, col_start, col_stop) block to draw for.
+
+    Returns: Array of shape (DRAWS, rows, cols), or that of the region, of uniforms in [0, 1).
+    """
+    row_start, row_stop, col_start, col_stop = (0, rows, 0, cols) if region is None else region
+    r = np.arange(row_start, row_stop, dtype=np.uint64)[:, None]
+    c = np.arange(col_start, col_stop, dtype=np.uint64)[None, :]
+    return draws(seed, replica, generation, r * np.uint64(cols) + c)
+
+
+class CounterRNG:
+    """
+    Counter-based random stream of a run, keyed on (seed, replica, generation, cell, draw).
+
+    Put into the engine state, see ca_model.initial_state, it replaces random and the
+    numpy generator of the engines, making trajectories independent of the order in
+    which the cells are updated.
+
+    Args:
+        - seed: The seed of the run.
+        - replica: The replica number, for independent streams of runs sharing a seed.
+    """
+
+    def __init__(self, seed, replica=0):
+        self.seed, self.replica = int(seed), int(replica)
+
+    def uniforms(self, generation, rows, cols, region=None):
+        """The draws of every cell for one generation, see cell_uniforms."""
+        return cell_uniforms(self.seed, self.replica, generation, rows, cols, region)
+
+    def cell_draws(self, generation, cols, r, c):
+        """The draws of the cells (r, c) of a grid with cols columns, shape (DRAWS, len(r))."""
+        return draws(self.seed, self.replica, generation, np.asarray(r, dtype=np.uint64) * np.uint64(cols)
+                     + np.asarray(c, dtype=np.uint64))
+
+    def __repr__(self):
+        return f'CounterRNG(seed={self.seed}, replica={self.replica})'
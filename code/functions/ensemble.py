@@ -0,0 +1,196 @@
+import numpy as np
+from .ca_model import (CELL_N, CELL_C, CELL_E, CELL_D, K3, K4, PHI, RHO, engine_rng, distance_map,
+                       initialize_grid, vectorized_transitions)
+from .clusters import label_mask
+from .geometry import grid_origin
+
+# Statistics recorded for every generation of an ensemble
+ENSEMBLE_FIELDS = ('Nc', 'Ne', 'Nd', 'R', 'clusters')
+# Update rules an ensemble can follow, see simulate_ensemble
+ENSEMBLE_MODELS = ('growth', 'metastasis', 'mean_field')
+# Replicas stepped together by simulate_ensemble, which bounds the memory of a step
+ENSEMBLE_BATCH = 64
+
+
+def batch_counts(M, distances):
+    """
+    Count the cells of every replica in a batch, as count_cells does for one grid.
+
+    Args:
+        - M: Batch of grids of shape (replicas, rows, cols).
+        - distances: Distance of every cell to the origin, see distance_map.
+
+    Returns: A dictionary of per-replica arrays Nc, Ne, Nd and R.
+    """
+    cancer = M == CELL_C
+    Nc = np.count_nonzero(cancer, axis=(1, 2))
+    Ne = np.count_nonzero(M == CELL_E, axis=(1, 2))
+    Nd = np.count_nonzero(M == CELL_D, axis=(1, 2))
+    n_prime = Nc + Ne + Nd
+    Rsum = (cancer * distances).sum(axis=(1, 2))
+    R = np.divide(Rsum, n_prime, out=np.zeros(len(M)), where=n_prime > 0)
+    return {'Nc': Nc, 'Ne': Ne, 'Nd': Nd, 'R': R}
+
+
+def batch_cluster_counts(M):
+    """
+    Count the cancer cell clusters of every replica in a batch with a single labelling.
+
+    The replicas are stacked on top of each other, separated by an empty row, so no
+    cluster spans two replicas and the raster-ordered labels of each replica form a
+    contiguous range.
+
+    Args:
+        - M: Batch of grids of shape (replicas, rows, cols).
+
+    Returns: An array with the number of clusters of every replica.
+    """
+    replicas, rows, cols = M.shape
+    mask = np.zeros((replicas, rows + 1, cols), dtype=bool)
+    mask[:, :rows] = M == CELL_C
+    labels, _ = label_mask(mask.reshape(-1, cols))
+    last_label = np.maximum.accumulate(labels.reshape(replicas, -1).max(axis=1))
+    return np.diff(last_label, prepend=0)
+
+
+class EnsembleStats:
+    """
+    Per-generation statistics of an ensemble: the mean, variance and quantiles over
+    the replicas of Nc, Ne, Nd, R and the cluster count.
+
+    Only these summaries are kept, so memory does not grow with the number of replicas.
+
+    Args:
+        - generations: The number of generations.
+        - replicas: The number of replicas.
+        - quantiles: The quantile levels to record, e.g. (0.05, 0.5, 0.95).
+        - fields: The fields to record.
+    """
+
+    def __init__(self, generations, replicas, quantiles, fields=ENSEMBLE_FIELDS):
+        self.replicas = replicas
+        self.quantile_levels = np.asarray(quantiles, dtype=float)
+        self.fields = fields
+        self.mean = {field: np.zeros(generations) for field in fields}
+        self.var = {field: np.zeros(generations) for field in fields}
+        self.quantiles = {field: np.zeros((len(self.quantile_levels), generations)) for field in fields}
+
+    def record(self, generation, values):
+        """Record the per-replica values of one generation, a dictionary of arrays per field."""
+        for field in self.fields:
+            value = np.asarray(values[field], dtype=float)
+            self.mean[field][generation] = value.mean()
+            self.var[field][generation] = value.var(ddof=1) if self.replicas > 1 else 0.0
+            self.quantiles[field][:, generation] = np.quantile(value, self.quantile_levels)
+
+    def stderr(self, field):
+        """Standard error of the mean of a field, for error bars."""
+        return np.sqrt(self.var[field] / self.replicas)
+
+    def quantile(self, field, level):
+        """The recorded quantile of a field at one of the quantile levels."""
+        index = np.flatnonzero(np.isclose(self.quantile_levels, level))
+        assert len(index), f"Quantile {level} was not recorded, choose one of {self.quantile_levels.tolist()}"
+        return self.quantiles[field][index[0]]
+
+
+def simulate_ensemble(replicas, generations, k1, k2, time_delay=0, model='growth', rows=101, cols=101,
+                      quantiles=(0.05, 0.5, 0.95), clusters=True, rng=None, batch=ENSEMBLE_BATCH):
+    """
+    Simulate independent replicas of the cellular automaton together as one batch.
+
+    The replicas are stepped as a (replicas, rows, cols) array with the rules of the
+    fast engine, see vectorized_transitions, so every generation is a handful of
+    array operations over the whole ensemble. The model chooses the update rule:
+
+    - 'growth': simulate_tumor_growth, mitosis probability and density from generation g - time_delay.
+    - 'metastasis': simulate_and_find_metastasis, mitosis probability and density without delay.
+    - 'mean_field': mean_field.simulate_tumor_growth, cancer cells stay 'C' with the mitosis
+      probability or turn 'E' with rate k2, without placing daughters.
+
+    The origin of the quadrants and distances is the centre cell of the grid, see geometry.grid_origin.
+
+    Memory: the grids and the counts of a generation take about 10 bytes per cell of
+    every replica, 10 * replicas * rows * cols. On top of that a step draws two float64
+    uniforms per cell for at most batch replicas at a time, 16 * batch * rows * cols bytes,
+    about 10 MB for the default batch on a 101 x 101 grid, whatever the number of replicas.
+    The draws are made batch by batch, so the result for a given rng depends on batch.
+
+    Args:
+        - replicas: The number of replicas.
+        - generations: The number of generations to simulate.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - time_delay: The time delay of the 'growth' model.
+        - model: One of ENSEMBLE_MODELS.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - quantiles: The quantile levels to record.
+        - clusters: Whether to count the cancer cell clusters every generation.
+        - rng: numpy Generator to draw from, by default seeded from random like the fast engine.
+        - batch: The number of replicas stepped together.
+
+    Returns: EnsembleStats of the state at the start of every generation, as recorded in history.
+    """
+    assert model in ENSEMBLE_MODELS, f"Model must be one of {ENSEMBLE_MODELS}"
+    rng = rng if rng is not None else engine_rng(None)
+    origin = grid_origin(rows, cols)
+    init_positions = [origin, (origin[0] + 1, origin[1]), (origin[0] - 1, origin[1]),
+                      (origin[0], origin[1] - 1), (origin[0], origin[1] + 1)]
+    M = np.repeat(initialize_grid(rows, cols, init_positions)[None], replicas, axis=0)
+    distances = distance_map(rows, cols, origin)
+    fields = ENSEMBLE_FIELDS if clusters else ENSEMBLE_FIELDS[:-1]
+    stats = EnsembleStats(generations, replicas, quantiles, fields)
+
+    # Only the last time_delay + 1 generations of Nc and the dense flag are read
+    delay = time_delay if model == 'growth' else 0
+    past_Nc = np.zeros((delay + 1, replicas))
+    past_dense = np.zeros((delay + 1, replicas), dtype=bool)
+
+    for g in range(generations):
+        values = batch_counts(M, distances)
+        if clusters:
+            values['clusters'] = batch_cluster_counts(M)
+        stats.record(g, values)
+
+        n_prime = values['Nc'] + values['Ne'] + values['Nd']
+        R = values['R']
+        density = np.divide(n_prime, R ** 2, out=np.zeros(replicas), where=R > 0)
+        past_Nc[g % (delay + 1)] = values['Nc']
+        past_dense[g % (delay + 1)] = density > RHO
+        # Before generation time_delay the current generation is used instead
+        slot = (g - delay) % (delay + 1) if g >= delay else g % (delay + 1)
+        mitosis_prob = k1 * (1 - past_Nc[slot] / PHI)
+        dense = past_dense[slot]
+
+        for start in range(0, replicas, batch):
+            part = slice(start, start + batch)
+            uniforms = rng.random((2,) + M[part].shape)
+            if model == 'mean_field':
+                M[part] = mean_field_transitions(M[part], mitosis_prob[part], k2, uniforms)
+            else:
+                M[part] = vectorized_transitions(M[part], mitosis_prob[part], k2, dense[part], uniforms, origin)
+    return stats
+
+
+def mean_field_transitions(M, mitosis_prob, k2, uniforms):
+    """
+    Apply one generation of the mean field rules to a batch of grids.
+
+    Args:
+        - M: Batch of grids of shape (replicas, rows, cols).
+        - mitosis_prob: Per-replica probability of a cancer cell staying 'C'.
+        - k2: Rate of a cancer cell turning 'E' otherwise.
+        - uniforms: Array of shape (2,) + M.shape of uniform draws.
+
+    Returns: The batch of grids after one step.
+    """
+    interior = np.zeros(M.shape[1:], dtype=bool)
+    interior[1:-1, 1:-1] = True
+    cancer = (M == CELL_C) & interior
+    to_edge = cancer & (uniforms[0] >= mitosis_prob[:, None, None]) & (uniforms[1] < k2)
+    newM = np.copy(M)
+    newM[to_edge] = CELL_E
+    newM[(M == CELL_E) & interior & (uniforms[0] < K3)] = CELL_D
+    newM[(M == CELL_D) & interior & (uniforms[0] < K4)] = CELL_N
+    return newM
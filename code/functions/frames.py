@@ -0,0 +1,210 @@
+import os
+import struct
+import zlib
+import numpy as np
+from . import instrument
+from .ca_model import to_codes
+
+# Colors of the cell codes N, C, E, D, as in the matplotlib plots of analyze
+PALETTE = ((255, 255, 255), (0, 0, 0), (255, 0, 0), (0, 128, 0))
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+BIT_DEPTH = 2  # Four palette entries fit in 2 bits per pixel
+PIXELS_PER_BYTE = 8 // BIT_DEPTH
+
+
+def frame_pixels(M, crop=None, scale=1):
+    """
+    Turn a grid into the palette indices of a frame.
+
+    Args:
+        - M: The grid of cells.
+        - crop: Optional (row_start, row_stop, col_start, col_stop) region of the grid.
+        - scale: Integer upscaling factor; every cell becomes scale x scale pixels.
+
+    Returns: A uint8 array of palette indices.
+    """
+    pixels = to_codes(M)
+    if crop is not None:
+        row_start, row_stop, col_start, col_stop = crop
+        pixels = pixels[row_start:row_stop, col_start:col_stop]
+    if scale > 1:
+        pixels = np.repeat(np.repeat(pixels, scale, axis=0), scale, axis=1)
+    return pixels
+
+
+def pack_rows(pixels):
+    """
+    Pack palette indices into PNG scanlines: a filter byte of 0, then 4 pixels per byte.
+
+    Args:
+        - pixels: A uint8 array of palette indices below 4.
+
+    Returns: The raw image data, one scanline per row.
+    """
+    height, width = pixels.shape
+    padded = np.zeros((height, -(-width // PIXELS_PER_BYTE) * PIXELS_PER_BYTE), dtype=np.uint8)
+    padded[:, :width] = pixels
+    quads = padded.reshape(height, -1, PIXELS_PER_BYTE)
+    # The first pixel of a byte goes in its highest bits
+    packed = (quads[..., 0] << 6) | (quads[..., 1] << 4) | (quads[..., 2] << 2) | quads[..., 3]
+    scanlines = np.zeros((height, packed.shape[1] + 1), dtype=np.uint8)
+    scanlines[:, 1:] = packed
+    return scanlines.tobytes()
+
+
+def png_chunk(kind, data):
+    """Encode a PNG chunk: length, type, data and the CRC of type and data."""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)))
+
+
+def png_header(width, height):
+    """The signature, IHDR and PLTE chunks of a palette PNG with the cell colors."""
+    header = struct.pack('>IIBBBBB', width, height, BIT_DEPTH, 3, 0, 0, 0)
+    palette = bytes(channel for color in PALETTE for channel in color)
+    return PNG_SIGNATURE + png_chunk(b'IHDR', header) + png_chunk(b'PLTE', palette)
+
+
+def write_png(path, M, crop=None, scale=1, compression=6):
+    """
+    Write a grid as a palette PNG image.
+
+    Args:
+        - path: The path of the image.
+        - M: The grid of cells.
+        - crop: Optional (row_start, row_stop, col_start, col_stop) region, see frame_pixels.
+        - scale: Integer upscaling factor.
+        - compression: The zlib compression level, 0 to 9.
+    """
+    pixels = frame_pixels(M, crop, scale)
+    data = zlib.compress(pack_rows(pixels), compression)
+    with open(path, 'wb') as file:
+        file.write(png_header(pixels.shape[1], pixels.shape[0]) + png_chunk(b'IDAT', data) + png_chunk(b'IEND', b''))
+
+
+class FrameSequenceWriter:
+    """
+    Stream consumer writing the grid of every snapshot as a numbered PNG image.
+
+    Needs snapshots with detail 'grid', see iter_simulation.
+
+    Args:
+        - directory: The directory of the images, created if missing.
+        - pattern: The file name of a frame, formatted with the generation.
+        - stride: Only write generations that are a multiple of stride.
+        - crop: Optional (row_start, row_stop, col_start, col_stop) region, see frame_pixels.
+        - scale: Integer upscaling factor.
+        - compression: The zlib compression level, 0 to 9.
+    """
+
+    def __init__(self, directory, pattern='frame_{generation:05d}.png', stride=1, crop=None, scale=1,
+                 compression=6):
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.pattern = directory, pattern
+        self.stride, self.crop, self.scale, self.compression = stride, crop, scale, compression
+        self.paths = []
+
+    @instrument.timed('write_frame')
+    def __call__(self, snapshot):
+        if snapshot['generation'] % self.stride:
+            return
+        path = os.path.join(self.directory, self.pattern.format(generation=snapshot['generation']))
+        write_png(path, snapshot['grid'], self.crop, self.scale, self.compression)
+        self.paths.append(path)
+
+
+class AnimationWriter:
+    """
+    Stream consumer writing the grid of every snapshot as a frame of an animated PNG.
+
+    Frames are compressed and written as they arrive, so memory stays constant however
+    long the run. The frame count, unknown until the end, is filled in by close.
+    Needs snapshots with detail 'grid', see iter_simulation.
+
+    Args:
+        - path: The path of the animation.
+        - fps: Frames per second.
+        - loops: The number of times the animation plays, 0 to repeat forever.
+        - stride: Only write generations that are a multiple of stride.
+        - crop: Optional (row_start, row_stop, col_start, col_stop) region, see frame_pixels.
+        - scale: Integer upscaling factor.
+        - compression: The zlib compression level, 0 to 9.
+    """
+
+    def __init__(self, path, fps=10, loops=0, stride=1, crop=None, scale=1, compression=6):
+        self.fps, self.loops = fps, loops
+        self.stride, self.crop, self.scale, self.compression = stride, crop, scale, compression
+        self.frames = 0
+        self.sequence = 0  # Sequence number of the next fcTL or fdAT chunk
+        self.shape = None
+        self.control_offset = None
+        self.path = path
+        self.file = open(path, 'wb')
+
+    def _write_control(self):
+        # acTL: the number of frames and loops, rewritten by close
+        self.file.seek(self.control_offset)
+        self.file.write(png_chunk(b'acTL', struct.pack('>II', self.frames, self.loops)))
+        self.file.seek(0, os.SEEK_END)
+
+    @instrument.timed('write_frame')
+    def __call__(self, snapshot):
+        if snapshot['generation'] % self.stride:
+            return
+        self.write(snapshot['grid'])
+
+    def write(self, M):
+        """Append one grid as the next frame."""
+        pixels = frame_pixels(M, self.crop, self.scale)
+        height, width = pixels.shape
+        if self.shape is None:
+            self.shape = pixels.shape
+            header = png_header(width, height)
+            self.file.write(header)
+            self.control_offset = len(header)
+            self._write_control()
+        assert pixels.shape == self.shape, "All frames of an animation must have the same shape"
+
+        data = zlib.compress(pack_rows(pixels), self.compression)
+        control = struct.pack('>IIIIIHHBB', self.sequence, width, height, 0, 0, 1, self.fps, 0, 0)
+        self.file.write(png_chunk(b'fcTL', control))
+        self.sequence += 1
+        if self.frames == 0:
+            # The first frame is the default image, shown by viewers without animation support
+            self.file.write(png_chunk(b'IDAT', data))
+        else:
+            self.file.write(png_chunk(b'fdAT', struct.pack('>I', self.sequence) + data))
+            self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        """
+        Record the number of frames and close the file.
+
+        Without any frame there is no valid image, so the empty file is removed and
+        a ValueError raised.
+        """
+        if self._close():
+            raise ValueError(f"No frames were written to the animation {self.path}")
+
+    def _close(self):
+        # Close the file, removing it if it has no frames; returns whether it was removed
+        if self.file.closed:
+            return False
+        if self.shape is not None:
+            self._write_control()
+            self.file.write(png_chunk(b'IEND', b''))
+        self.file.close()
+        if self.shape is None:
+            os.remove(self.path)
+            return True
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On an exception the file is closed without masking it by a ValueError
+        if exc_type is None:
+            self.close()
+        else:
+            self._close()
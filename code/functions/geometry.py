@@ -0,0 +1,87 @@
+from functools import lru_cache
+import numpy as np
+
+# Neighbour offsets: up, right, down, left
+DIRECTIONS = np.array([(-1, 0), (0, 1), (1, 0), (0, -1)])
+UP, RT, DN, LT = range(4)
+# Division targets per quadrant (I, II, III, IV), tried in order, for dense and not dense tumors
+DENSE_TARGETS = np.array([[UP, RT], [LT, UP], [DN, LT], [RT, DN]])
+NOT_DENSE_TARGETS = np.array([[DN, LT], [RT, DN], [UP, RT], [LT, UP]])
+TARGETS = {True: DENSE_TARGETS, False: NOT_DENSE_TARGETS}
+
+
+def grid_origin(rows, cols):
+    """The default origin of a grid: its centre cell, (rows // 2, cols // 2)."""
+    return (rows // 2, cols // 2)
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class Geometry:
+    """
+    Geometry tables of one grid configuration, computed once and shared by every run.
+
+    Attributes:
+        - rows, cols: The grid shape.
+        - origin: The origin, as (row, column), of the quadrants and distances.
+        - distances: Distance of every cell to the origin.
+        - quadrants: Quadrant of every cell, 0, 1, 2, 3 for I, II, III, IV.
+        - target_directions: For dense (True) and not dense (False) tumors, the two
+          directions in DIRECTIONS a dividing cell tries, per cell, shape (rows, cols, 2).
+        - target_offsets: For dense and not dense tumors, the two (row, column) offsets
+          tried per quadrant, as tuples for the per-cell loops of the Python engines.
+        - kernel_targets: The same offsets as (4, 2, 2) arrays, for the compiled kernel.
+
+    All arrays are read-only. Use get_geometry to get the cached instance.
+
+    Args:
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - origin: The origin, by default the centre of the grid.
+    """
+
+    def __init__(self, rows, cols, origin=None):
+        self.rows, self.cols = rows, cols
+        self.origin = tuple(int(x) for x in origin) if origin is not None else grid_origin(rows, cols)
+        r, c = np.ogrid[:rows, :cols]
+        self.distances = _read_only(np.sqrt((r - self.origin[0]) ** 2 + (c - self.origin[1]) ** 2))
+        upper, right = r <= self.origin[0], c > self.origin[1]
+        self.quadrants = _read_only(np.where(upper, np.where(right, 0, 1), np.where(right, 3, 2)).astype(np.int8))
+        # Python lists index faster than arrays inside the per-cell loops
+        self.quadrant_rows = self.quadrants.tolist()
+        self.target_directions = {dense: _read_only(table[self.quadrants].astype(np.uint8))
+                                  for dense, table in TARGETS.items()}
+        self.kernel_targets = {dense: _read_only(DIRECTIONS[table]) for dense, table in TARGETS.items()}
+        self.target_offsets = {dense: tuple(tuple(map(tuple, DIRECTIONS[choices].tolist())) for choices in table)
+                               for dense, table in TARGETS.items()}
+
+    def targets(self, r, c, dense):
+        """The two cells, in order, a cancer cell at (r, c) tries to divide into."""
+        (dr1, dc1), (dr2, dc2) = self.target_offsets[bool(dense)][self.quadrant_rows[r][c]]
+        return (r + dr1, c + dc1), (r + dr2, c + dc2)
+
+
+def get_geometry(rows, cols, origin=None):
+    """
+    Get the cached Geometry of a grid configuration.
+
+    Every run with the same shape and origin, e.g. all tasks of a sweep handled by one
+    worker process, shares the same tables.
+
+    Args:
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - origin: The origin, by default the centre of the grid.
+
+    Returns: The Geometry.
+    """
+    origin = grid_origin(rows, cols) if origin is None else (int(origin[0]), int(origin[1]))
+    return _cached_geometry(int(rows), int(cols), origin)
+
+
+@lru_cache(maxsize=32)
+def _cached_geometry(rows, cols, origin):
+    return Geometry(rows, cols, origin)
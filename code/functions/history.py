@@ -0,0 +1,161 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+# Columns recorded by store_history for every generation
+HISTORY_DTYPE = np.dtype([('Nc', np.int64), ('Ne', np.int64), ('Nd', np.int64),
+                          ('R', np.float64), ('dense', np.bool_)])
+HISTORY_FIELDS = HISTORY_DTYPE.names
+# Marks an empty slot in RingHistory; never a valid (or delayed, negative) generation
+EMPTY_SLOT = np.iinfo(np.int64).min
+
+
+class ArrayHistory(MutableMapping):
+    """
+    Simulation history stored as a structured numpy array, one row per generation.
+
+    Reads behave like the dictionary history: history[g] is a dictionary with keys
+    Nc, Ne, Nd, R and dense, and `g in history` tells whether g was recorded.
+    Whole columns are available through column() without any conversion.
+
+    Args:
+        - generations: Number of generations to preallocate; the array grows if more are stored.
+    """
+
+    def __init__(self, generations):
+        self.data = np.zeros(max(generations, 1), dtype=HISTORY_DTYPE)
+        self.recorded = np.zeros(len(self.data), dtype=bool)
+
+    def __setitem__(self, generation, entry):
+        if generation >= len(self.data):
+            size = max(generation + 1, 2 * len(self.data))
+            self.data = np.resize(self.data, size)
+            self.recorded = np.concatenate([self.recorded, np.zeros(size - len(self.recorded), dtype=bool)])
+        row = self.data[generation]
+        for field in HISTORY_FIELDS:
+            row[field] = entry[field]
+        self.recorded[generation] = True
+
+    def __getitem__(self, generation):
+        if generation not in self:
+            raise KeyError(generation)
+        row = self.data[generation]
+        return {field: row[field] for field in HISTORY_FIELDS}
+
+    def __delitem__(self, generation):
+        if generation not in self:
+            raise KeyError(generation)
+        self.recorded[generation] = False
+
+    def __contains__(self, generation):
+        return isinstance(generation, (int, np.integer)) and 0 <= generation < len(self.data) \
+            and bool(self.recorded[generation])
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self.recorded).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.recorded))
+
+    def as_array(self):
+        """Return the recorded rows as a structured array, in generation order."""
+        return self.data[:len(self)] if self.recorded[:len(self)].all() else self.data[self.recorded]
+
+    def column(self, field):
+        """Return one field, e.g. 'Nc', for all recorded generations as an array."""
+        return self.as_array()[field]
+
+
+class RingHistory(MutableMapping):
+    """
+    Simulation history that only keeps the last time_delay + 1 generations.
+
+    This is all the step engines read: the current generation and the delayed
+    generation g - time_delay used by mitosis_probability and the dense flag.
+    Memory therefore does not grow with the length of the run.
+
+    Args:
+        - time_delay: The time delay of the simulation.
+    """
+
+    def __init__(self, time_delay):
+        self.data = np.zeros(time_delay + 1, dtype=HISTORY_DTYPE)
+        self.generations = np.full(time_delay + 1, EMPTY_SLOT, dtype=np.int64)
+
+    def _slot(self, generation):
+        return generation % len(self.data)
+
+    def __setitem__(self, generation, entry):
+        slot = self._slot(generation)
+        row = self.data[slot]
+        for field in HISTORY_FIELDS:
+            row[field] = entry[field]
+        self.generations[slot] = generation
+
+    def __getitem__(self, generation):
+        if generation not in self:
+            raise KeyError(generation)
+        row = self.data[self._slot(generation)]
+        return {field: row[field] for field in HISTORY_FIELDS}
+
+    def __delitem__(self, generation):
+        if generation not in self:
+            raise KeyError(generation)
+        self.generations[self._slot(generation)] = EMPTY_SLOT
+
+    def __contains__(self, generation):
+        return isinstance(generation, (int, np.integer)) and self.generations[self._slot(generation)] == generation
+
+    def __iter__(self):
+        return iter(np.sort(self.generations[self.generations != EMPTY_SLOT]).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.generations != EMPTY_SLOT))
+
+    def as_array(self):
+        """Return the rows still held, as a structured array in generation order."""
+        order = np.argsort(self.generations)
+        return self.data[order][self.generations[order] != EMPTY_SLOT]
+
+    def column(self, field):
+        """Return one field, e.g. 'Nc', for the generations still held as an array."""
+        return self.as_array()[field]
+
+
+# History backends selectable by name in the simulation drivers
+HISTORY_BACKENDS = ('dict', 'array', 'ring')
+
+
+def new_history(backend, generations, time_delay):
+    """
+    Create an empty history for a simulation run.
+
+    Args:
+        - backend: 'dict' for a plain dictionary, 'array' for ArrayHistory or 'ring' for RingHistory.
+        - generations: Number of generations the run will record.
+        - time_delay: The time delay of the run.
+
+    Returns: The empty history.
+    """
+    assert backend in HISTORY_BACKENDS, f"History backend must be one of {HISTORY_BACKENDS}"
+    if backend == 'array':
+        return ArrayHistory(generations)
+    if backend == 'ring':
+        return RingHistory(time_delay)
+    return {}
+
+
+def history_columns(history):
+    """
+    Convert any history to a dictionary of column arrays.
+
+    Args:
+        - history: A history dictionary, ArrayHistory or RingHistory.
+
+    Returns: A dictionary mapping Nc, Ne, Nd, R and dense to arrays in generation order.
+    """
+    if hasattr(history, 'as_array'):
+        rows = history.as_array()
+        return {field: rows[field] for field in HISTORY_FIELDS}
+    generations = sorted(history)
+    return {field: np.array([history[g][field] for g in generations], dtype=HISTORY_DTYPE[field])
+            for field in HISTORY_FIELDS}
@@ -0,0 +1,232 @@
+import contextlib
+import csv
+import functools
+import json
+import time
+import tracemalloc
+
+# Attached observers; instrumentation points do nothing while this list is empty
+OBSERVERS = []
+# Counts every step engine reports through count_step
+STEP_COUNTS = ('cells_visited', 'rng_draws', 'mitosis_attempts', 'mitosis_successes')
+_NO_PHASE = contextlib.nullcontext()
+
+
+class Observer:
+    """
+    Base class of instrumentation observers; subclasses override the hooks they need.
+
+    Hooks:
+        - on_generation(generation): A simulation driver starts a generation.
+        - on_phase(name, start, duration): A phase, e.g. 'step' or 'store_history', ended.
+          start is a time.perf_counter() value, duration in seconds.
+        - on_count(name, value): A count, e.g. 'rng_draws', increased by value.
+    """
+
+    def on_generation(self, generation):
+        pass
+
+    def on_phase(self, name, start, duration):
+        pass
+
+    def on_count(self, name, value):
+        pass
+
+
+def add_observer(observer):
+    """Attach an observer to the instrumentation points."""
+    OBSERVERS.append(observer)
+
+
+def remove_observer(observer):
+    """Detach an observer attached with add_observer."""
+    OBSERVERS.remove(observer)
+
+
+def enabled():
+    """Check whether any observer is attached, to skip collecting counts otherwise."""
+    return bool(OBSERVERS)
+
+
+def generation(g):
+    """Mark the start of generation g of a simulation driver."""
+    for observer in OBSERVERS:
+        observer.on_generation(g)
+
+
+@contextlib.contextmanager
+def _timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        for observer in OBSERVERS:
+            observer.on_phase(name, start, duration)
+
+
+def phase(name):
+    """
+    Time a phase of the computation for the attached observers.
+
+    Use as `with phase('store_history'):`; without observers nothing is timed.
+
+    Args:
+        - name: The name of the phase.
+
+    Returns: A context manager.
+    """
+    return _timed_phase(name) if OBSERVERS else _NO_PHASE
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a phase, see phase.
+
+    Args:
+        - name: The name of the phase.
+
+    Returns: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not OBSERVERS:
+                return function(*args, **kwargs)
+            with _timed_phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Report that a count, e.g. 'rng_draws', increased by value."""
+    for observer in OBSERVERS:
+        observer.on_count(name, value)
+
+
+def count_step(cells_visited, rng_draws, mitosis_attempts, mitosis_successes):
+    """Report the work of one step of a step engine, see STEP_COUNTS."""
+    for name, value in zip(STEP_COUNTS, (cells_visited, rng_draws, mitosis_attempts, mitosis_successes)):
+        count(name, int(value))
+
+
+class Recorder(Observer):
+    """
+    Observer recording the time per phase, the counts and the peak memory of every generation.
+
+    Phases are nested as they run: the 'step' phase includes its 'store_history'.
+    Anything outside a simulation driver, e.g. reading files, is recorded under
+    generation None.
+
+    Args:
+        - memory: Whether to trace the peak memory per generation with tracemalloc.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.rows = {}
+        self.current = None
+        self.events = []
+        self.origin = time.perf_counter()
+        self.peak_memory = 0
+
+    def _row(self):
+        if self.current not in self.rows:
+            self.rows[self.current] = {'generation': self.current}
+        return self.rows[self.current]
+
+    def _close_memory(self):
+        if self.memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            if self.current in self.rows:
+                row = self.rows[self.current]
+                row['peak_memory'] = max(row.get('peak_memory', 0), peak)
+            self.peak_memory = max(self.peak_memory, peak)
+            tracemalloc.reset_peak()
+
+    def on_generation(self, generation):
+        self._close_memory()
+        self.current = generation
+        self._row()
+
+    def on_phase(self, name, start, duration):
+        row = self._row()
+        row[f'{name}_seconds'] = row.get(f'{name}_seconds', 0.0) + duration
+        self.events.append({'name': name, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6,
+                            'pid': 0, 'tid': 0, 'args': {'generation': self.current}})
+
+    def on_count(self, name, value):
+        row = self._row()
+        row[name] = row.get(name, 0) + value
+
+    def table(self):
+        """
+        The per-generation table, one dictionary per generation with the seconds per
+        phase ('<phase>_seconds'), the counts and 'peak_memory' in bytes.
+        """
+        columns = ['generation'] + sorted({key for row in self.rows.values() for key in row} - {'generation'})
+        return [{column: row.get(column, 0) for column in columns} for row in self.rows.values()]
+
+    def totals(self):
+        """The phase times and counts summed over all generations."""
+        totals = {}
+        for row in self.table():
+            for key, value in row.items():
+                if key == 'generation':
+                    continue
+                totals[key] = max(totals.get(key, 0), value) if key == 'peak_memory' else totals.get(key, 0) + value
+        return totals
+
+    def to_csv(self, path):
+        """Write the per-generation table to a CSV file."""
+        table = self.table()
+        with open(path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=list(table[0]) if table else ['generation'])
+            writer.writeheader()
+            writer.writerows(table)
+
+    def to_chrome_trace(self, path):
+        """
+        Write the phases as a Chrome trace event file, readable by chrome://tracing,
+        Perfetto and speedscope, with the counts as counter tracks per generation.
+        """
+        events = list(self.events)
+        for row in self.table():
+            timestamp = min((e['ts'] for e in self.events if e['args']['generation'] == row['generation']), default=0)
+            counts = {name: row[name] for name in STEP_COUNTS + ('peak_memory',) if name in row}
+            if counts:
+                events.append({'name': 'counts', 'ph': 'C', 'ts': timestamp, 'pid': 0, 'tid': 0, 'args': counts})
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+@contextlib.contextmanager
+def instrumented(memory=True):
+    """
+    Record the instrumentation of everything run inside the block.
+
+    Example:
+        with instrumented() as recorder:
+            simulate_tumor_growth(10, 100, 0.74, 0.2)
+        recorder.to_chrome_trace('trace.json')
+
+    Args:
+        - memory: Whether to trace the peak memory with tracemalloc, which slows Python allocations down.
+
+    Returns: The Recorder, as a context manager.
+    """
+    recorder = Recorder(memory)
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif memory:
+        tracemalloc.reset_peak()
+    add_observer(recorder)
+    try:
+        yield recorder
+    finally:
+        recorder._close_memory()
+        remove_observer(recorder)
+        if started_tracing:
+            tracemalloc.stop()
@@ -0,0 +1,141 @@
+import importlib.util
+import random
+import numpy as np
+
+# Whether the cell update kernel is compiled; without numba, or with one that fails to
+# import, it is interpreted with the same results. numba is only imported when step_cells
+# is first used, see __getattr__, which sets this to False if the import fails
+COMPILED = importlib.util.find_spec('numba') is not None
+
+
+def python_random_uniforms(n):
+    """
+    Draw the next n numbers random.random() would return, without advancing random.
+
+    Python's random and numpy's MT19937 share the Mersenne Twister and the 53-bit
+    conversion to a float, so the numbers are drawn by numpy from a copy of the state.
+
+    Args:
+        - n: The number of uniforms to draw.
+
+    Returns: Tuple of the float64 array of uniforms and the state of random they start from.
+    """
+    state = random.getstate()
+    bit_generator = _mt19937(state)
+    return np.random.Generator(bit_generator).random(n), state
+
+
+def advance_python_random(state, used):
+    """
+    Set random to the state reached after `used` calls of random.random() from `state`.
+
+    Args:
+        - state: A state of random, as returned by python_random_uniforms.
+        - used: The number of uniforms consumed.
+    """
+    bit_generator = _mt19937(state)
+    bit_generator.random_raw(2 * used)  # Every float consumes two 32-bit outputs
+    mt = bit_generator.state['state']
+    random.setstate((state[0], tuple(mt['key'].tolist()) + (int(mt['pos']),), state[2]))
+
+
+def _mt19937(state):
+    """Create a numpy MT19937 bit generator in the given state of random."""
+    bit_generator = np.random.MT19937()
+    internal = state[1]
+    bit_generator.state = {'bit_generator': 'MT19937',
+                           'state': {'key': np.array(internal[:-1], dtype=np.uint32), 'pos': internal[-1]}}
+    return bit_generator
+
+
+def _step_cells(M, newM, uniforms, totals, tallies, distances, targets, mitosis_prob, k2, k3, k4,
+                rows, cols, origin_r, origin_c, keyed):
+    """
+    Update the interior cells of a grid in raster order, as the loop engine does.
+
+    Every branch, the order of the random draws and the in-place writes to newM are
+    those of simulate_tumor_growth_one_step and mitosis, so the result is identical.
+
+    Args:
+        - M: Current grid of uint8 cell codes, read only.
+        - newM: Copy of M receiving the next grid, updated in place.
+        - uniforms: Uniform random numbers, consumed in order, or with keyed the flattened
+          (2, rows, cols) per-cell draws of counter_rng.cell_uniforms, looked up by cell.
+        - totals: float64 array of Nc, Ne, Nd and Rsum of newM, updated in place.
+        - tallies: int64 array counting the mitosis attempts and successes, updated in place.
+        - distances: Distance of every cell to the origin, see ca_model.distance_map.
+        - targets: (4, 2, 2) array of the row and column offsets mitosis tries, per quadrant.
+        - mitosis_prob: Probability of a cancer cell undergoing mitosis this step.
+        - k2, k3, k4: Transition rates of cancer, effector and dead cells.
+        - rows, cols: The cells visited are those in 1..rows-2 by 1..cols-2.
+        - origin_r, origin_c: The origin deciding the quadrant of a cell.
+        - keyed: Whether uniforms holds per-cell draws instead of a sequence.
+
+    Returns: The number of uniforms consumed.
+    """
+    # Cell codes as in ca_model: N = 0, C = 1, E = 2, D = 3
+    used = 0
+    width, plane = M.shape[1], M.size
+    for r in range(1, rows - 1):
+        for c in range(1, cols - 1):
+            cell = M[r, c]
+            first = r * width + c if keyed else used
+            if cell == 1:
+                u = uniforms[first]
+                used += 1
+                if u < mitosis_prob:
+                    tallies[0] += 1
+                    if r <= origin_r:
+                        quadrant = 0 if c > origin_c else 1
+                    else:
+                        quadrant = 2 if c <= origin_c else 3
+                    for choice in range(2):
+                        tr = r + targets[quadrant, choice, 0]
+                        tc = c + targets[quadrant, choice, 1]
+                        target = newM[tr, tc]
+                        if target != 2 and target != 3:
+                            if target == 0:
+                                totals[0] += 1
+                                totals[3] += distances[tr, tc]
+                            newM[tr, tc] = 1
+                            tallies[1] += 1
+                            break
+                else:
+                    u = uniforms[plane + first if keyed else used]
+                    used += 1
+                    if u < k2:
+                        newM[r, c] = 2
+                        totals[0] -= 1
+                        totals[1] += 1
+                        totals[3] -= distances[r, c]
+            elif cell == 2:
+                u = uniforms[first]
+                used += 1
+                if u < k3:
+                    newM[r, c] = 3
+                    totals[1] -= 1
+                    totals[2] += 1
+            elif cell == 3:
+                u = uniforms[first]
+                used += 1
+                if u < k4:
+                    newM[r, c] = 0
+                    totals[2] -= 1
+    return used
+
+
+def __getattr__(name):
+    # step_cells is compiled on first access, so importing the module does not load numba
+    global COMPILED
+    if name == 'step_cells':
+        kernel = _step_cells
+        if COMPILED:
+            try:
+                from numba import njit
+            except ImportError:  # e.g. a numba built against another numpy
+                COMPILED = False
+            else:
+                kernel = njit(cache=True, nogil=True)(_step_cells)
+        globals()['step_cells'] = kernel
+        return kernel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
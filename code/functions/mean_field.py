@@ -1,6 +1,7 @@
 import numpy as np
 import random
-from functions import ca_model
+from . import ca_model
+from .ca_model import CELL_N, CELL_C, CELL_E, CELL_D
 
 RANDOM_SEED = 42
 random.seed(RANDOM_SEED)
@@ -20,34 +21,66 @@ def mean_field_interaction(M, cell_type):
         return 0.0
     return ca_model.sum_cell_type(M, cell_type) / n_prime
 
-def mitosis(M, newM, r, c, dense):
-    """ Model cell division with density development. """
-    mitosis_prob = ca_model.mitosis_probability(K1, ca_model.sum_cell_type(M, 'C'), 1, 1, {})
+def mitosis(newM, r, c, mitosis_prob):
+    """ Model cell division with the mitosis probability of the step, computed once from Nc. """
     if random.random() < mitosis_prob:
-        newM[r, c] = 'C'
+        newM[r, c] = CELL_C
     elif random.random() < K2:
-        newM[r, c] = 'E'
+        newM[r, c] = CELL_E
     return newM
 
-def simulate_tumor_growth_one_step(M, generation, time_delay, history):
+def simulate_tumor_growth_one_step(M, generation, time_delay, history, state=None):
+    M = ca_model.to_codes(M)
     newM = np.copy(M)
     ca_model.store_history(generation, M, history)
+    mitosis_prob = ca_model.mitosis_probability(K1, history[generation]['Nc'], 1, 1, {})
 
     for r in range(1, ROWS - 1):
         for c in range(1, COLS - 1):
-            if M[r, c] == 'C':
-                newM = mitosis(M, newM, r, c, ca_model.density_development(M) > RHO)
-            elif M[r, c] == 'E' and random.random() < K3:
-                newM[r, c] = 'D'
-            elif M[r, c] == 'D' and random.random() < K4:
-                newM[r, c] = 'N'
+            if M[r, c] == CELL_C:
+                newM = mitosis(newM, r, c, mitosis_prob)
+            elif M[r, c] == CELL_E and random.random() < K3:
+                newM[r, c] = CELL_D
+            elif M[r, c] == CELL_D and random.random() < K4:
+                newM[r, c] = CELL_N
     return newM
 
-def simulate_tumor_growth(time_delay, generations):
+def simulate_tumor_growth_one_step_active(M, generation, time_delay, history, state=None):
+    """
+    Active-frontier counterpart of simulate_tumor_growth_one_step.
+
+    Only cells in the active set (see ca_model.active_set) are visited, in the same
+    order and with the same random draws, so the trajectory is unchanged. The grid is
+    counted once per step, for the history, and never per cell.
+    """
+    M = ca_model.to_codes(M)
+    active = ca_model.active_set(M, state)
+    newM = np.copy(M)
+    ca_model.store_history(generation, M, history)
+    mitosis_prob = ca_model.mitosis_probability(K1, history[generation]['Nc'], 1, 1, {})
+
+    vacated = []
+    for r, c in ca_model.active_interior_cells(active, ROWS, COLS):
+        if M[r, c] == CELL_C:
+            newM = mitosis(newM, r, c, mitosis_prob)
+        elif M[r, c] == CELL_E and random.random() < K3:
+            newM[r, c] = CELL_D
+        elif M[r, c] == CELL_D and random.random() < K4:
+            newM[r, c] = CELL_N
+            vacated.append((r, c))
+    ca_model.update_active_set(active, newM, vacated, [])
+    return newM
+
+ca_model.register_engine('loop', mean_field_step=simulate_tumor_growth_one_step)
+ca_model.register_engine('active', mean_field_step=simulate_tumor_growth_one_step_active)
+
+def simulate_tumor_growth(time_delay, generations, engine='loop'):
     history = {}
     M = ca_model.initialize_grid()
+    step = ca_model.get_engine(engine, mean_field=True)
+    state = {}
 
     for g in range(generations):
-        M = simulate_tumor_growth_one_step(M, g, time_delay, history)
+        M = step(M, g, time_delay, history, state)
 
     return history
\ No newline at end of file
@@ -1,6 +1,17 @@
+import json
+import os
 import numpy as np
 import csv
+from . import instrument
+from .ca_model import to_codes
+from .trajectory import Trajectory, is_trajectory
+from .history import HISTORY_DTYPE, HISTORY_FIELDS
 
+# Sidecar files next to a history CSV: run metadata and the binary cache of load_history
+METADATA_SUFFIX = '.meta.json'
+CACHE_SUFFIX = '.cache.npy'
+
+@instrument.timed('read_history')
 def read_history(history_array, history_csv_file='history_data.csv'):
     """
     The function reads the history data from the CSV file and stores it in the history_array.
@@ -25,23 +36,126 @@ def read_history(history_array, history_csv_file='history_data.csv'):
     return history_array
 
 
+def write_history_metadata(history_csv_file, generations, **params):
+    """
+    Write the metadata sidecar of a history CSV file, read by load_history.
+
+    Args:
+        - history_csv_file: the path to the CSV file.
+        - generations: the number of generations per run.
+        - params: any other parameters of the runs, e.g. k1 and k2.
+    """
+    with open(str(history_csv_file) + METADATA_SUFFIX, mode='w', encoding='utf-8') as file:
+        json.dump({'generations': generations, **params}, file)
+
+
+def infer_generations(Nc, Ne, Nd):
+    """
+    Infer the number of generations per run from the history columns.
+
+    Every run starts from the initial grid, so a new run begins wherever the first
+    row's populations reappear with no edge or dead cells.
+
+    Args:
+        - Nc, Ne, Nd: the population columns of the whole CSV file.
+
+    Returns: The number of generations per run.
+    """
+    starts = np.flatnonzero((Nc == Nc[0]) & (Ne == 0) & (Nd == 0))
+    spacing = np.diff(starts)
+    if spacing.size == 0:
+        return len(Nc)
+    # A run can pass through the initial populations again, so take the most common spacing
+    values, counts = np.unique(spacing, return_counts=True)
+    generations = int(values[np.argmax(counts)])
+    assert len(Nc) % generations == 0 and np.isin(np.arange(0, len(Nc), generations), starts).all(), \
+        "Could not infer the number of generations, pass it to load_history"
+    return generations
+
+
+def _source_stamp(path):
+    """Size and modification time identifying the version of a file."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+@instrument.timed('load_history')
+def load_history(history_csv_file='history_data.csv', generations=None, cache=True):
+    """
+    Load a history CSV file as typed arrays of shape (tau, generation) per field.
+
+    The number of generations per run is taken from the argument, the metadata
+    sidecar written by write_history_metadata, or inferred from the data. The parsed
+    arrays are cached in a binary file next to the CSV, which later loads
+    memory-map instead of parsing; the cache is rebuilt when the CSV changes.
+
+    Args:
+        - history_csv_file: the path to the CSV file.
+        - generations: the number of generations per run, if known.
+        - cache: whether to read and write the binary cache.
+
+    Returns: A dictionary mapping Nc, Ne, Nd, R and dense to arrays of shape (tau, generation).
+    """
+    history_csv_file = str(history_csv_file)
+    cache_file = history_csv_file + CACHE_SUFFIX
+    stamp = _source_stamp(history_csv_file)
+    if cache and os.path.exists(cache_file) and os.path.exists(cache_file + METADATA_SUFFIX):
+        with open(cache_file + METADATA_SUFFIX, encoding='utf-8') as file:
+            if json.load(file) == stamp:
+                data = np.load(cache_file, mmap_mode='r')
+                if generations is None or data.shape[1] == generations:
+                    return {field: data[field] for field in HISTORY_FIELDS}
+
+    with open(history_csv_file, mode='r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        columns = next(reader)
+        values = list(zip(*reader))
+    rows = np.zeros(len(values[0]) if values else 0, dtype=HISTORY_DTYPE)
+    for name, column in zip(columns, values):
+        rows[name] = np.array(column) == 'True' if name == 'dense' else np.array(column, dtype=HISTORY_DTYPE[name])
+
+    if generations is None and os.path.exists(history_csv_file + METADATA_SUFFIX):
+        with open(history_csv_file + METADATA_SUFFIX, encoding='utf-8') as file:
+            generations = json.load(file).get('generations')
+    if generations is None:
+        generations = infer_generations(rows['Nc'], rows['Ne'], rows['Nd'])
+    data = rows.reshape(-1, generations)
+
+    if cache:
+        np.save(cache_file, data)
+        with open(cache_file + METADATA_SUFFIX, mode='w', encoding='utf-8') as file:
+            json.dump(stamp, file)
+    return {field: data[field] for field in HISTORY_FIELDS}
+
+
+@instrument.timed('read_matrix')
 def read_matrix(rows, cols, generation, matrices_csv_file='matrices_data.csv'):
     """
     The function reads the matrices from the CSV file and stores them in the all_M array.
 
+    A trajectory file (see trajectory.convert_matrices_csv) is memory-mapped instead of
+    parsed: the returned Trajectory is indexed the same way, all_M[tau][generation], and
+    only unpacks the grids that are accessed.
+
     Args:
         - rows: the number of rows in the matrix.
         - cols: the number of columns in the matrix.
         - all_M: the array to store the matrices.
         - generations: the number of generations.
-        - matrices_csv_file: the path to the CSV file.
+        - matrices_csv_file: the path to the CSV file or trajectory file.
 
-    Returns: The array containing the matrices.
+    Returns: The array containing the matrices, as uint8 grids of cell codes.
     """
+    if is_trajectory(matrices_csv_file):
+        all_M = Trajectory(matrices_csv_file)
+        assert (all_M.rows, all_M.cols, all_M.generations) == (rows, cols, generation), \
+            "Trajectory shape does not match the requested rows, cols and generations"
+        print(f"Total tau reconstructed: {len(all_M)}")
+        return all_M
 
     def reconstruct_matrix(row, rows, cols):
-        # Convert the row to a NumPy array and reshape it back to the original matrix shape
-        return np.array(row).reshape(rows, cols)
+        # Convert the row of characters to cell codes and reshape it back to the original matrix shape
+        return to_codes(np.array(row)).reshape(rows, cols)
 
     all_M = []
     # Read the CSV file
@@ -0,0 +1,92 @@
+import csv
+import numpy as np
+from . import instrument
+from .ca_model import to_chars
+from .clusters import count_clusters
+from .history import HISTORY_FIELDS
+
+
+def run_stream(snapshots, *consumers):
+    """
+    Feed every snapshot of a stream, e.g. iter_simulation, to each consumer in turn.
+
+    Args:
+        - snapshots: Iterable of snapshot dictionaries.
+        - consumers: Callables taking one snapshot.
+
+    Returns: The consumers, to read their results from.
+    """
+    for snapshot in snapshots:
+        for consumer in consumers:
+            consumer(snapshot)
+    return consumers
+
+
+class HistoryCSVWriter:
+    """
+    Consumer writing the counts of every snapshot as a row of a history CSV file.
+
+    Args:
+        - file: A text file opened with newline=''; the header is written if header is set.
+        - header: Whether to write the header row first.
+    """
+
+    def __init__(self, file, header=False):
+        self.writer = csv.DictWriter(file, fieldnames=list(HISTORY_FIELDS), extrasaction='ignore')
+        if header:
+            self.writer.writeheader()
+
+    @instrument.timed('write_csv')
+    def __call__(self, snapshot):
+        self.writer.writerow(snapshot)
+
+
+class MatrixCSVWriter:
+    """
+    Consumer writing the grid of every snapshot as a flattened row of 'N', 'C', 'E', 'D'
+    characters, the format of the matrices CSV file. Needs snapshots with detail 'grid'.
+
+    Args:
+        - file: A text file opened with newline=''.
+    """
+
+    def __init__(self, file):
+        self.writer = csv.writer(file)
+
+    @instrument.timed('write_csv')
+    def __call__(self, snapshot):
+        self.writer.writerow(to_chars(snapshot['grid']).ravel().tolist())
+
+
+class ClusterCounter:
+    """
+    Consumer collecting the number of cancer cell clusters of every snapshot, from the
+    labels of detail 'labels' or by labelling the grid of detail 'grid'.
+    """
+
+    def __init__(self):
+        self.generations = []
+        self.clusters = []
+
+    def __call__(self, snapshot):
+        self.generations.append(snapshot['generation'])
+        self.clusters.append(snapshot['clusters'] if 'clusters' in snapshot else count_clusters(snapshot['grid']))
+
+
+class Collector:
+    """
+    Consumer collecting fields of every snapshot as arrays, e.g. Collector('Nc', 'R').
+
+    Args:
+        - fields: The names of the snapshot fields to collect.
+    """
+
+    def __init__(self, *fields):
+        self.values = {field: [] for field in ('generation',) + fields}
+
+    def __call__(self, snapshot):
+        for field, values in self.values.items():
+            values.append(snapshot[field])
+
+    def __getitem__(self, field):
+        return np.asarray(self.values[field])
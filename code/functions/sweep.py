@@ -0,0 +1,201 @@
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .ca_model import RANDOM_SEED, simulate_tumor_growth
+from .checkpoint import load_checkpoint, remove_checkpoint, save_checkpoint
+from .history import HISTORY_FIELDS, history_columns
+
+
+def parameter_grid(**axes):
+    """
+    Build the cartesian product of parameter values, last axis varying fastest.
+
+    Args:
+        - axes: Parameter names mapped to the values to sweep, e.g. time_delay=range(100).
+
+    Returns: Tuple of the list of parameter dictionaries and the grid shape.
+    """
+    names = list(axes)
+    values = [list(axes[name]) for name in names]
+    grid = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+    return grid, tuple(len(v) for v in values)
+
+
+def task_seed(seed, index):
+    """
+    Derive the seed of one sweep task.
+
+    The seed only depends on the sweep seed and the task index, so a task gives
+    the same numbers whichever worker runs it and in whatever order.
+
+    Args:
+        - seed: The seed of the whole sweep.
+        - index: The index of the task in the parameter grid.
+
+    Returns: An integer seed for random.seed.
+    """
+    return int(np.random.SeedSequence([seed, index]).generate_state(1, np.uint64)[0])
+
+
+def history_task(time_delay, generations, k1, k2, **options):
+    """
+    Sweep task running simulate_tumor_growth.
+
+    Args:
+        - time_delay, generations, k1, k2: Passed to simulate_tumor_growth.
+        - options: Further keyword arguments for simulate_tumor_growth, e.g. engine.
+
+    Returns: A dictionary of history columns Nc, Ne, Nd, R and dense.
+    """
+    options.setdefault('history_backend', 'array')
+    return history_columns(simulate_tumor_growth(time_delay, generations, k1, k2, **options))
+
+
+def trajectory_task(time_delay, generations, k1, k2, **options):
+    """
+    Sweep task running iter_simulation and keeping every grid, e.g. to write the matrices CSV file.
+
+    Args:
+        - time_delay, generations, k1, k2: Passed to iter_simulation.
+        - options: Further keyword arguments for iter_simulation, e.g. engine.
+
+    Returns: A dictionary of history columns Nc, Ne, Nd, R and dense, and the 'grids' of every
+    generation packed with trajectory.pack_grid, 2 bits per cell.
+    """
+    from .ca_model import iter_simulation
+    from .trajectory import pack_grid
+    records, grids = [], []
+    for snapshot in iter_simulation(time_delay, generations, k1, k2, detail='grid', **options):
+        records.append(snapshot)
+        grids.append(pack_grid(snapshot['grid']))
+    columns = {field: np.array([record[field] for record in records]) for field in HISTORY_FIELDS}
+    return {**columns, 'grids': np.array(grids)}
+
+
+def metastasis_task(generations, rows, cols, k1, k2, **options):
+    """
+    Sweep task running simulate_and_find_metastasis.
+
+    Args:
+        - generations, rows, cols, k1, k2: Passed to simulate_and_find_metastasis.
+        - options: Further keyword arguments for simulate_and_find_metastasis, e.g. engine.
+
+    Returns: A dictionary with the cluster count per generation, -1 after a run that stopped
+    early, and Tm, -1 if never reached.
+    """
+    from .analyze import simulate_and_find_metastasis
+    num_clusters, Tm = simulate_and_find_metastasis(generations, rows, cols, k1, k2, **options)
+    clusters = np.full(generations, -1)
+    clusters[:len(num_clusters)] = num_clusters
+    return {'clusters': clusters, 'Tm': -1 if Tm is None else Tm}
+
+
+def run_task(task, params, seed):
+    """
+    Run one sweep task with its own seed; executed inside the worker processes.
+
+    Args:
+        - task: The task function, e.g. history_task.
+        - params: Keyword arguments for the task.
+        - seed: The seed of this task, see task_seed.
+
+    Returns: The dictionary of results of the task.
+    """
+    random.seed(seed)
+    return task(**params)
+
+
+class SweepResult:
+    """
+    Results of a parameter sweep, stored as one array per result field.
+
+    Each field has the grid shape followed by the shape of the per-task value, so
+    a sweep over 100 time delays of 500 generations gives result['Nc'] with shape
+    (100, 500), and a k1 x k2 sweep gives result['Tm'] with shape (len(k1), len(k2)).
+
+    Args:
+        - params: The list of parameter dictionaries, one per task.
+        - shape: The shape of the parameter grid.
+        - seed: The seed of the sweep.
+    """
+
+    def __init__(self, params, shape, seed):
+        self.params = params
+        self.shape = shape
+        self.seed = seed
+        self.fields = {}
+        self.completed = np.zeros(len(params), dtype=bool)
+
+    def store(self, index, record):
+        """Store the result record of task index, allocating the field arrays on first use."""
+        for name, value in record.items():
+            value = np.asarray(value)
+            if name not in self.fields:
+                self.fields[name] = np.zeros((len(self.params),) + value.shape, dtype=value.dtype)
+            self.fields[name][index] = value
+        self.completed[index] = True
+
+    def __getitem__(self, name):
+        values = self.fields[name]
+        return values.reshape(self.shape + values.shape[1:])
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def save(self, path):
+        """Save all fields, the grid shape and the seed to a .npz file."""
+        np.savez(path, shape=np.array(self.shape), seed=self.seed, **self.fields)
+
+
+def run_sweep(task, grid, shape=None, seed=RANDOM_SEED, processes=None, fixed=None, checkpoint_path=None,
+              checkpoint_interval=10):
+    """
+    Run a task for every point of a parameter grid, spread over a process pool.
+
+    Every task is seeded with task_seed(seed, index), so the results do not depend
+    on the number of processes or the order in which the tasks finish.
+
+    Args:
+        - task: A module-level task function, e.g. history_task or metastasis_task.
+        - grid: List of parameter dictionaries, or the (grid, shape) tuple of parameter_grid.
+        - shape: Shape of the grid, by default a flat list of tasks.
+        - seed: The seed of the sweep.
+        - processes: Number of worker processes, all cores by default; 1 runs in this process.
+        - fixed: Keyword arguments shared by every task, e.g. {'generations': 500}.
+        - checkpoint_path: File to checkpoint the completed tasks to. Re-running the same sweep
+          only runs the tasks missing from it, with bit-identical results. Removed once the
+          sweep finishes.
+        - checkpoint_interval: Number of completed tasks between checkpoints.
+
+    Returns: A SweepResult holding the results of every task.
+    """
+    if isinstance(grid, tuple):
+        grid, shape = grid
+    fixed = fixed or {}
+    params = {'task': f"{task.__module__}.{task.__qualname__}", 'grid': grid, 'seed': seed, 'fixed': fixed}
+    result = load_checkpoint(checkpoint_path, 'sweep', params) or SweepResult(grid, shape or (len(grid),), seed)
+    pending = [index for index in range(len(grid)) if not result.completed[index]]
+
+    def store(index, record, done):
+        result.store(index, record)
+        if checkpoint_path is not None and done % checkpoint_interval == 0:
+            save_checkpoint(checkpoint_path, 'sweep', params, result)
+
+    try:
+        if processes == 1:
+            for done, index in enumerate(pending, start=1):
+                store(index, run_task(task, {**fixed, **grid[index]}, task_seed(seed, index)), done)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = {pool.submit(run_task, task, {**fixed, **grid[index]}, task_seed(seed, index)): index
+                           for index in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    store(futures[future], future.result(), done)
+    except BaseException:
+        # Keep the tasks completed since the last checkpoint, e.g. on a KeyboardInterrupt
+        if checkpoint_path is not None:
+            save_checkpoint(checkpoint_path, 'sweep', params, result)
+        raise
+    remove_checkpoint(checkpoint_path)
+    return result
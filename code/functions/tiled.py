@@ -0,0 +1,279 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from . import instrument
+from .ca_model import CELL_C, CELL_D, CELL_E, CELL_TYPES, initialize_grid, mitosis_probability, store_history, \
+    vectorized_transitions
+from .clusters import label_mask, union_find_roots
+from .counter_rng import CounterRNG
+from .geometry import get_geometry, grid_origin
+from .history import new_history
+
+# Rows and columns of the previous grid a tile reads around itself. A cell depends on
+# the daughters of its neighbours, which depend on the cells next to those (2 cells);
+# the outermost ring of a block is never updated by the step, hence one more.
+HALO = 3
+# Field order of the per-tile counts reduced into the global counters
+TILE_COUNTS = ('Nc', 'Ne', 'Nd', 'Rsum')
+
+# Shared arrays of a worker process, attached once by _attach
+_shared = {}
+
+
+def tile_bounds(rows, cols, tiles):
+    """
+    Split a grid into a (tile_rows, tile_cols) arrangement of nearly equal blocks.
+
+    Args:
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - tiles: The number of tiles along the rows and along the columns.
+
+    Returns: List of (row_start, row_stop, col_start, col_stop) of every tile, in raster order.
+    """
+    row_edges = np.linspace(0, rows, tiles[0] + 1).astype(int)
+    col_edges = np.linspace(0, cols, tiles[1] + 1).astype(int)
+    return [(int(row_edges[i]), int(row_edges[i + 1]), int(col_edges[j]), int(col_edges[j + 1]))
+            for i in range(tiles[0]) for j in range(tiles[1])]
+
+
+def step_tile(grids, labels, source, bounds, origin, generation, mitosis_prob, k2, dense, rng):
+    """
+    Step one tile of a grid held in shared memory.
+
+    The tile and its halo are read from grids[source], the grid at the start of the
+    generation, and the tile of the next grid is written to grids[1 - source]. The draws
+    come from the counter-based stream of the whole grid, so the tile gets exactly the
+    cells the fast engine would give it.
+
+    Args:
+        - grids: Array of shape (2, rows, cols) holding the current and the next grid.
+        - labels: Unused, see label_tile; accepted for a uniform task signature.
+        - source: The index in grids of the current grid.
+        - bounds: The (row_start, row_stop, col_start, col_stop) of the tile.
+        - origin: The origin of the whole grid.
+        - generation: The generation, which keys the random stream.
+        - mitosis_prob: Probability of a cancer cell undergoing mitosis this step.
+        - k2: Inmune response rate against cancer cells.
+        - dense: A boolean indicating whether the tumor is dense or not.
+        - rng: The CounterRNG of the run.
+
+    Returns: The counts Nc, Ne, Nd and Rsum of the tile in the next grid, see TILE_COUNTS.
+    """
+    rows, cols = grids.shape[1:]
+    row_start, row_stop, col_start, col_stop = bounds
+    block = (max(row_start - HALO, 0), min(row_stop + HALO, rows), max(col_start - HALO, 0), min(col_stop + HALO, cols))
+    M = grids[source, block[0]:block[1], block[2]:block[3]]
+    uniforms = rng.uniforms(generation, rows, cols, block)
+    newM = vectorized_transitions(M, mitosis_prob, k2, dense, uniforms, (origin[0] - block[0], origin[1] - block[2]))
+    tile = newM[row_start - block[0]:row_stop - block[0], col_start - block[2]:col_stop - block[2]]
+    grids[1 - source, row_start:row_stop, col_start:col_stop] = tile
+
+    counts = np.bincount(tile.ravel(), minlength=len(CELL_TYPES))
+    distances = get_geometry(rows, cols, origin).distances[row_start:row_stop, col_start:col_stop]
+    return counts[CELL_C], counts[CELL_E], counts[CELL_D], float(distances[tile == CELL_C].sum())
+
+
+def label_tile(grids, labels, source, bounds):
+    """
+    Label the cancer cell clusters of one tile, within the tile only, see label_mask.
+
+    Args:
+        - grids: Array of shape (2, rows, cols) holding the current and the next grid.
+        - labels: int32 array of shape (rows, cols) receiving the labels of the tile.
+        - source: The index in grids of the grid to label.
+        - bounds: The (row_start, row_stop, col_start, col_stop) of the tile.
+
+    Returns: The number of clusters in the tile.
+    """
+    row_start, row_stop, col_start, col_stop = bounds
+    labels[row_start:row_stop, col_start:col_stop], n = label_mask(
+        grids[source, row_start:row_stop, col_start:col_stop] == CELL_C)
+    return n
+
+
+def stitch_clusters(labels, bounds, counts):
+    """
+    Merge the clusters of neighbouring tiles that touch across their common edge.
+
+    Args:
+        - labels: The per-tile labels, see label_tile.
+        - bounds: The bounds of every tile, see tile_bounds.
+        - counts: The number of clusters of every tile.
+
+    Returns: The number of clusters of the whole grid.
+    """
+    # Number the clusters of all tiles consecutively
+    offsets = np.zeros(labels.shape, dtype=np.int64)
+    starts = np.cumsum([0] + list(counts))
+    for (row_start, row_stop, col_start, col_stop), start in zip(bounds, starts):
+        offsets[row_start:row_stop, col_start:col_stop] = start
+    a, b = [], []
+    row_edges = sorted({bound[0] for bound in bounds} - {0})
+    col_edges = sorted({bound[2] for bound in bounds} - {0})
+    # Only the two lines of cells on either side of every tile edge are read
+    for first, second in [(np.s_[edge - 1, :], np.s_[edge, :]) for edge in row_edges] + \
+                         [(np.s_[:, edge - 1], np.s_[:, edge]) for edge in col_edges]:
+        touching = (labels[first] > 0) & (labels[second] > 0)
+        a.append((labels[first] + offsets[first] - 1)[touching])
+        b.append((labels[second] + offsets[second] - 1)[touching])
+    total = int(starts[-1])
+    if total == 0:
+        return 0
+    roots = union_find_roots(total, np.concatenate(a or [[]]).astype(np.int64), np.concatenate(b or [[]]).astype(np.int64))
+    return int(np.count_nonzero(roots == np.arange(total)))
+
+
+def _attach(names, shape):
+    # Worker initializer: map the shared grids and labels once per process
+    grids = shared_memory.SharedMemory(name=names[0])
+    labels = shared_memory.SharedMemory(name=names[1])
+    _shared['memory'] = (grids, labels)
+    _shared['grids'] = np.ndarray((2,) + shape, dtype=np.uint8, buffer=grids.buf)
+    _shared['labels'] = np.ndarray(shape, dtype=np.int32, buffer=labels.buf)
+
+
+def _run(task, *args):
+    return task(_shared['grids'], _shared['labels'], *args)
+
+
+class TiledGrid:
+    """
+    A grid split into tiles held in shared memory and stepped by worker processes.
+
+    Every generation each worker reads its tile and a halo of HALO cells of the current
+    grid and writes its tile of the next one; the two grids swap roles, so the halos
+    are exchanged through shared memory without copies. The workers return the counts
+    of their tiles, which are summed into the global counters the mitosis probability
+    and the dense flag need.
+
+    Steps use the counter-based stream of CounterRNG, so the result does not depend on
+    the tiling and is the one the fast engine gives with the same seed.
+
+    Use as a context manager, or call close, to stop the workers and free the memory.
+
+    Args:
+        - M: The initial grid of cell codes.
+        - seed: The seed of the counter-based stream.
+        - tiles: The number of tiles along the rows and along the columns.
+        - processes: The number of worker processes; 1 steps the tiles in this process.
+          By default one per tile, up to the number of CPUs.
+        - origin: The origin of the quadrants and distances, by default the centre.
+        - replica: The replica number of the counter-based stream.
+    """
+
+    def __init__(self, M, seed, tiles=(2, 2), processes=None, origin=None, replica=0):
+        self.shape = M.shape
+        self.origin = grid_origin(*M.shape) if origin is None else tuple(origin)
+        self.bounds = tile_bounds(*M.shape, tiles)
+        self.rng = CounterRNG(seed, replica)
+        self.source = 0
+        self.memory = (shared_memory.SharedMemory(create=True, size=2 * M.size),
+                       shared_memory.SharedMemory(create=True, size=4 * M.size))
+        self.grids = np.ndarray((2,) + M.shape, dtype=np.uint8, buffer=self.memory[0].buf)
+        self.labels = np.ndarray(M.shape, dtype=np.int32, buffer=self.memory[1].buf)
+        self.grids[0] = M
+        counts = np.bincount(M.ravel(), minlength=len(CELL_TYPES))
+        distances = get_geometry(*M.shape, self.origin).distances
+        self.counters = {'Nc': int(counts[CELL_C]), 'Ne': int(counts[CELL_E]), 'Nd': int(counts[CELL_D]),
+                         'Rsum': float(distances[M == CELL_C].sum())}
+
+        processes = processes or min(len(self.bounds), os.cpu_count() or 1)
+        self.pool = None
+        if processes > 1:
+            self.pool = ProcessPoolExecutor(max_workers=processes, initializer=_attach,
+                                            initargs=((self.memory[0].name, self.memory[1].name), M.shape))
+
+    def _reduce(self, tasks):
+        # Run one task per tile and wait for all of them: the barrier between generations
+        if self.pool is None:
+            return [task(self.grids, self.labels, *args) for task, *args in tasks]
+        return [future.result() for future in [self.pool.submit(_run, *task) for task in tasks]]
+
+    def step(self, generation, mitosis_prob, k2, dense):
+        """
+        Step every tile one generation and update the counters.
+
+        Args:
+            - generation: The generation, which keys the random stream.
+            - mitosis_prob: Probability of a cancer cell undergoing mitosis this step.
+            - k2: Inmune response rate against cancer cells.
+            - dense: A boolean indicating whether the tumor is dense or not.
+        """
+        results = self._reduce([(step_tile, self.source, bounds, self.origin, generation, mitosis_prob, k2,
+                                 bool(dense), self.rng) for bounds in self.bounds])
+        self.source = 1 - self.source
+        totals = np.sum(results, axis=0)
+        self.counters = {'Nc': int(totals[0]), 'Ne': int(totals[1]), 'Nd': int(totals[2]), 'Rsum': float(totals[3])}
+
+    def grid(self):
+        """A copy of the current grid."""
+        return self.grids[self.source].copy()
+
+    def count_clusters(self):
+        """Count the cancer cell clusters of the current grid, labelling the tiles in parallel."""
+        counts = self._reduce([(label_tile, self.source, bounds) for bounds in self.bounds])
+        return stitch_clusters(self.labels, self.bounds, counts)
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        del self.grids, self.labels
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def simulate_tiled(time_delay, generations, k1, k2, seed, rows=2001, cols=2001, tiles=(2, 2), processes=None,
+                   cluster_stride=0, history_backend='ring', history=None):
+    """
+    Simulate the growth of a tumor on a large grid, split into tiles stepped in parallel.
+
+    Gives the trajectory of simulate_tumor_growth(..., engine='fast', seed=seed) on a
+    rows x cols grid started from five cancer cells at its centre.
+
+    Args:
+        - time_delay: Time delay factor for mitosis probability calculation.
+        - generations: Number of generations to simulate.
+        - k1: Proliferation rate of cancer cells.
+        - k2: Inmune response rate against cancer cells.
+        - seed: The seed of the counter-based stream, see CounterRNG.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - tiles: The number of tiles along the rows and along the columns.
+        - processes: The number of worker processes, see TiledGrid.
+        - cluster_stride: Count the cancer cell clusters every cluster_stride generations; 0 never.
+        - history_backend: 'dict', 'array' or 'ring', see simulate_tumor_growth.
+        - history: An existing history to record into instead of a new one.
+
+    Returns: Tuple of the history and a dictionary of cluster counts by generation.
+    """
+    if history is None:
+        history = new_history(history_backend, generations, time_delay)
+    origin = grid_origin(rows, cols)
+    init_positions = [origin, (origin[0] + 1, origin[1]), (origin[0] - 1, origin[1]),
+                      (origin[0], origin[1] - 1), (origin[0], origin[1] + 1)]
+    clusters = {}
+    with TiledGrid(initialize_grid(rows, cols, init_positions), seed, tiles, processes, origin) as grid:
+        for g in range(generations):
+            instrument.generation(g)
+            with instrument.phase('step'):
+                store_history(g, grid.grids[grid.source], history, grid.counters)
+                dense = history[g]['dense']
+                delayed_gen = g - time_delay
+                if delayed_gen in history:
+                    dense = history[delayed_gen]['dense']
+                mitosis_prob = mitosis_probability(k1, history[g]['Nc'], time_delay, g, history)
+                grid.step(g, mitosis_prob, k2, dense)
+            if cluster_stride and g % cluster_stride == 0:
+                clusters[g] = grid.count_clusters()
+    return history, clusters
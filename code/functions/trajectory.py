@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+import numpy as np
+from . import instrument
+from .ca_model import to_codes
+
+# File layout: MAGIC, a JSON header padded to HEADER_SIZE bytes, then the packed frames
+MAGIC = b'CATRAJ01'
+HEADER_SIZE = 4096
+CELLS_PER_BYTE = 4  # 2 bits per cell, enough for the four cell codes
+# Lookup table from a packed byte to its four cell codes
+UNPACK_TABLE = ((np.arange(256, dtype=np.uint8)[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3).astype(np.uint8)
+
+
+def pack_grid(M):
+    """
+    Pack a grid of cell codes into 2 bits per cell.
+
+    Args:
+        - M: The grid of cells.
+
+    Returns: A uint8 array of ceil(rows * cols / 4) bytes, cells in raster order.
+    """
+    codes = to_codes(M).ravel()
+    padded = np.zeros(-(-codes.size // CELLS_PER_BYTE) * CELLS_PER_BYTE, dtype=np.uint8)
+    padded[:codes.size] = codes
+    quads = padded.reshape(-1, CELLS_PER_BYTE)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+
+def unpack_grid(packed, rows, cols):
+    """
+    Unpack a grid packed by pack_grid, or a stack of them.
+
+    Args:
+        - packed: The packed bytes of one grid, or an array of grids along its last axis.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+
+    Returns: The grid as a uint8 array of cell codes, of shape packed.shape[:-1] + (rows, cols).
+    """
+    stack = np.shape(packed)[:-1]
+    return UNPACK_TABLE[packed].reshape(stack + (-1,))[..., :rows * cols].reshape(stack + (rows, cols))
+
+
+class TrajectoryWriter:
+    """
+    Write grids to a bit-packed trajectory file, one run of generations after another.
+
+    The header holds the grid shape, the generations per run and any parameters and
+    seed of the simulation; the number of runs is recorded on close. Readers count the
+    frames from the file size instead, so the complete frames of a file that was never
+    closed, e.g. by an interrupted run, can still be read.
+
+    Args:
+        - path: The path of the trajectory file.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - generations: The number of generations per run.
+        - params: Parameters of the simulation to store in the header, e.g. k1 and k2.
+        - seed: The seed of the simulation.
+    """
+
+    def __init__(self, path, rows, cols, generations, params=None, seed=None):
+        self.header = {'rows': rows, 'cols': cols, 'generations': generations, 'runs': 0,
+                       'bits_per_cell': 8 // CELLS_PER_BYTE, 'params': params or {}, 'seed': seed}
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        header = json.dumps(self.header).encode('utf-8')
+        assert len(MAGIC) + len(header) < HEADER_SIZE, "Trajectory header is too large"
+        self.file.seek(0)
+        self.file.write(MAGIC + header.ljust(HEADER_SIZE - len(MAGIC), b' '))
+        self.file.seek(0, os.SEEK_END)
+
+    @instrument.timed('write_trajectory')
+    def write(self, M):
+        """Append one grid; every `generations` grids complete a run."""
+        assert M.shape == (self.header['rows'], self.header['cols']), "Grid shape does not match the trajectory"
+        self.file.write(pack_grid(M).tobytes())
+        self.frames += 1
+
+    def close(self):
+        """Record the number of complete runs in the header and close the file."""
+        self.header['runs'] = self.frames // self.header['generations']
+        self._write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Trajectory:
+    """
+    Memory-mapped, read-only view of a trajectory file.
+
+    Nothing is read until a grid is requested: trajectory[run][generation] or
+    trajectory.grid(run, generation) unpacks that single grid from the mapping, and
+    trajectory[run][start:stop] unpacks a range of generations as one array.
+
+    The frames are counted from the file size, so a file whose writer was interrupted
+    holds its complete frames; the last run then has fewer than `generations` of them.
+
+    Args:
+        - path: The path of the trajectory file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            head = file.read(HEADER_SIZE)
+        assert head.startswith(MAGIC), f"{path} is not a trajectory file"
+        self.header = json.loads(head[len(MAGIC):].decode('utf-8'))
+        self.rows, self.cols = self.header['rows'], self.header['cols']
+        self.generations = self.header['generations']
+        self.params, self.seed = self.header['params'], self.header['seed']
+        frame_bytes = -(-self.rows * self.cols // CELLS_PER_BYTE)
+        # A partly written frame at the end is left out
+        self.frames = max(os.path.getsize(path) - HEADER_SIZE, 0) // frame_bytes
+        self.runs = -(-self.frames // self.generations)
+        # An empty file region cannot be memory-mapped
+        self.frame_data = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE,
+                                    shape=(self.frames, frame_bytes)) \
+            if self.frames else np.zeros((0, frame_bytes), dtype=np.uint8)
+
+    def run_length(self, run):
+        """The number of frames of a run, fewer than generations for an interrupted last run."""
+        return min(self.generations, self.frames - run * self.generations)
+
+    def grid(self, run, generation):
+        """Unpack the grid of one run at one generation."""
+        return unpack_grid(self.frame_data[run * self.generations + generation], self.rows, self.cols)
+
+    def grids(self, run, start=0, stop=None, step=1):
+        """Unpack the grids of one run at generations range(start, stop, step), as one array."""
+        stop = self.run_length(run) if stop is None else stop
+        frames = run * self.generations + np.arange(start, stop, step)
+        return unpack_grid(self.frame_data[frames], self.rows, self.cols)
+
+    def __len__(self):
+        return self.runs
+
+    def __getitem__(self, run):
+        if not -self.runs <= run < self.runs:
+            raise IndexError(run)
+        return RunView(self, run % self.runs)
+
+
+class RunView:
+    """
+    Sequence of the grids of one run in a Trajectory, unpacked on access. A slice of
+    generations gives an array of shape (generations, rows, cols).
+    """
+
+    def __init__(self, trajectory, run):
+        self.trajectory = trajectory
+        self.run = run
+
+    def __len__(self):
+        return self.trajectory.run_length(self.run)
+
+    def __getitem__(self, generation):
+        if isinstance(generation, slice):
+            return self.trajectory.grids(self.run, *generation.indices(len(self)))
+        if not -len(self) <= generation < len(self):
+            raise IndexError(generation)
+        return self.trajectory.grid(self.run, generation % len(self))
+
+
+def is_trajectory(path):
+    """Check whether a file is a trajectory file rather than a CSV file."""
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def convert_matrices_csv(csv_path, trajectory_path, rows, cols, generations, params=None, seed=None):
+    """
+    Convert a matrices CSV file, one flattened grid of characters per row, to a trajectory file.
+
+    The CSV is streamed row by row, so it never has to fit in memory.
+
+    Args:
+        - csv_path: The path of the CSV file.
+        - trajectory_path: The path of the trajectory file to write.
+        - rows: The number of rows in the grid.
+        - cols: The number of columns in the grid.
+        - generations: The number of generations per run.
+        - params: Parameters of the simulation to store in the header.
+        - seed: The seed of the simulation.
+
+    Returns: The Trajectory of the written file.
+    """
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file, \
+            TrajectoryWriter(trajectory_path, rows, cols, generations, params, seed) as writer:
+        for row in csv.reader(file):
+            writer.write(to_codes(np.array(row)).reshape(rows, cols))
+    return Trajectory(trajectory_path)
@@ -0,0 +1,108 @@
+import random
+import numpy as np
+from scipy.signal import find_peaks, savgol_filter
+from code.functions.analyze import (simulate_and_find_metastasis, metastasis_unreachable, find_critical_k1,
+                                    oscillation_analysis, delay_coordinates_reconstruction,
+                                    false_nearest_neighbours, correlation_dimension, largest_lyapunov)
+from code.functions.ca_model import initialize_grid
+
+
+def test_early_stopping_keeps_the_same_trajectory():
+    """
+    Tests that stopping early only truncates the run and finds the same Tm.
+    """
+    for k1 in (0.1, 0.8):
+        random.seed(42)
+        full, full_Tm = simulate_and_find_metastasis(200, 121, 121, k1, 0.3, engine='fast')
+        random.seed(42)
+        early, early_Tm = simulate_and_find_metastasis(200, 121, 121, k1, 0.3, engine='fast', stop_early=True)
+        assert early_Tm == full_Tm
+        assert early == full[:len(early)]
+        assert len(early) < len(full) or full_Tm is None
+
+
+def test_metastasis_unreachable_bounds():
+    """
+    Tests the bound on the number of clusters a run can still reach.
+    """
+    M = initialize_grid(11, 11, [(5, 5), (5, 6)])
+    assert metastasis_unreachable(M, 0.0, 1000)
+    assert metastasis_unreachable(M, 0.5, 4)
+    assert not metastasis_unreachable(M, 0.5, 5)
+    assert metastasis_unreachable(initialize_grid(11, 11, []), 0.9, 1000)
+    # Too few cells within reach, although Nc * 2**remaining is large
+    crowded = initialize_grid(7, 7, [(r, c) for r in range(1, 6) for c in range(1, 6)])
+    assert metastasis_unreachable(crowded, 0.9, 20)
+    assert not metastasis_unreachable(initialize_grid(9, 9, [(4, 4), (4, 5)]), 0.9, 20)
+
+
+def test_find_critical_k1_brackets_transition():
+    """
+    Tests that bisection ends on an interval whose ends do and do not reach metastasis.
+    """
+    result = find_critical_k1(300, 151, 151, 0.3, tol=0.05, repeats=1)
+    lo, hi = result['interval']
+    assert hi - lo <= 0.05 and lo <= result['k1'] <= hi
+    assert result['evaluations'][lo] == 0 and result['evaluations'][hi] == 1
+
+
+def test_find_critical_k1_below_range_and_random_state():
+    """
+    Tests that a range starting above the transition gives its start as an upper bound, and
+    that the search leaves random untouched.
+    """
+    random.seed(3)
+    expected = random.Random(3).random()
+    result = find_critical_k1(300, 151, 151, 0.3, k1_range=(0.8, 1.0), repeats=1, initial_points=2)
+    assert result['k1'] == 0.8 and result['interval'] == (None, 0.8)
+    assert random.random() == expected
+
+
+def test_oscillation_analysis_matches_per_tau_analysis():
+    """
+    Tests that the batched oscillation analysis gives the smoothing and extrema of an
+    analysis one tau at a time, finds the period, and caches its results.
+    """
+    rng = np.random.default_rng(0)
+    generations = np.arange(300)
+    periods = 10 + np.arange(20)
+    Nc = 500 + 300 * np.sin(2 * np.pi * generations / periods[:, None]) * (periods[:, None] > 12)
+    Nc = (Nc + rng.integers(0, 20, Nc.shape)).astype(np.int64)
+
+    result = oscillation_analysis(Nc, window_length=21, polyorder=3, prominence=1)
+    for tau, series in enumerate(Nc):
+        assert np.allclose(result['smoothed'][tau], savgol_filter(series, 21, 3))
+        assert np.array_equal(result['peak_generation'][result['peak_tau'] == tau], find_peaks(series, prominence=1)[0])
+        assert np.array_equal(result['trough_generation'][result['trough_tau'] == tau],
+                              find_peaks(-series, prominence=1)[0])
+    assert oscillation_analysis(Nc, window_length=21, polyorder=3, prominence=1)['smoothed'] is result['smoothed']
+
+    result = oscillation_analysis(Nc, prominence=100)
+    assert np.allclose(result['period'][periods > 12], periods[periods > 12], rtol=0.05)
+    assert np.all(np.isnan(result['period'][periods <= 12])) and np.all(result['amplitude'][periods <= 12] == 0)
+    assert np.allclose(result['amplitude'][periods > 12], 300, rtol=0.1)
+    assert np.array_equal(np.unique(result['bifurcation_tau']), np.arange(len(Nc)))
+
+
+def test_attractor_metrics_of_known_series():
+    """
+    Tests the delay embedding and the attractor metrics on a batch of a chaotic logistic
+    map and a periodic sine, whose Lyapunov exponents are log 2 and 0.
+    """
+    series = np.arange(10.0)
+    embedded = delay_coordinates_reconstruction(series, 2, 3)
+    assert np.shares_memory(series, embedded) and embedded.shape == (6, 3)
+    assert np.array_equal(embedded[1], [1, 3, 5])
+
+    logistic = np.empty(1500)
+    logistic[0] = 0.3
+    for i in range(1, len(logistic)):
+        logistic[i] = 4 * logistic[i - 1] * (1 - logistic[i - 1])
+    batch = np.stack([logistic, np.sin(2 * np.pi * np.arange(1500) / 17.3)])
+    assert delay_coordinates_reconstruction(batch, 1, 2).shape == (2, 1499, 2)
+
+    fractions = false_nearest_neighbours(batch, 1, max_dim=3)
+    assert fractions.shape == (2, 3) and np.all(fractions[:, -1] < 0.01)
+    exponents = largest_lyapunov(batch, 1, 2, horizon=8, theiler=5)
+    assert abs(exponents[0] - np.log(2)) < 0.1 and abs(exponents[1]) < 0.1
+    assert abs(correlation_dimension(logistic, 1, 2, np.logspace(-2.5, -1, 8), theiler=5) - 1) < 0.15
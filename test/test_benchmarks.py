@@ -0,0 +1,19 @@
+import copy
+from code.benchmarks.suite import compare_reports, run_benchmarks
+
+
+def test_benchmark_report_and_comparison():
+    """
+    Tests the benchmark report layout and that a slower run is flagged as a regression.
+    """
+    report = run_benchmarks(['store_history', 'read_history'], sizes=(11, 21), generations=(2,), repeats=1, log=None)
+    assert len(report['results']) == 4
+    assert all(result['throughput'] > 0 for result in report['results'])
+    assert set(report['scaling']) == {'store_history@2', 'read_history@2'}
+
+    baseline = copy.deepcopy(report)
+    for result in baseline['results']:
+        result['seconds'] /= 2
+    comparison = compare_reports(report, baseline)
+    assert len(comparison['regressions']) == 4 and not comparison['improvements']
+    assert not compare_reports(report, report)['regressions']
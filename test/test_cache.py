@@ -0,0 +1,71 @@
+import os
+import random
+from code.functions.analyze import simulate_and_find_metastasis
+from code.functions.ca_model import simulate_tumor_growth
+from code.functions.cache import ResultCache, cached_simulate_and_find_metastasis, cached_simulate_tumor_growth, \
+    run_key
+
+
+def test_cached_runs_match_fresh_runs(tmp_path):
+    """
+    Tests that a cached run returns the result of a fresh run and leaves random in the same
+    state, and that bypassing the cache neither reads nor writes it.
+    """
+    cache = ResultCache(str(tmp_path))
+    random.seed(2)
+    expected = simulate_tumor_growth(3, 40, 0.74, 0.2, engine='fast')
+    after = random.random()
+    for _ in range(2):
+        random.seed(2)
+        history = cached_simulate_tumor_growth(3, 40, 0.74, 0.2, cache=cache, engine='fast')
+        assert history == expected and random.random() == after
+    assert len(cache.entries()) == 1
+
+    random.seed(2)
+    assert cached_simulate_tumor_growth(3, 40, 0.74, 0.2, cache=False, engine='fast') == expected
+    assert cached_simulate_tumor_growth(3, 40, 0.74, 0.2, cache=cache, seed=7) == \
+        simulate_tumor_growth(3, 40, 0.74, 0.2, seed=7)
+    assert len(cache.entries()) == 2
+
+    random.seed(4)
+    expected = simulate_and_find_metastasis(30, 41, 41, 0.9, 0.1)
+    for _ in range(2):
+        random.seed(4)
+        assert cached_simulate_and_find_metastasis(30, 41, 41, 0.9, 0.1, cache=cache) == expected
+
+
+def test_cache_keys_and_eviction(tmp_path):
+    """
+    Tests that the key depends on the parameters, seed and random state, and that the least
+    recently used results are evicted first.
+    """
+    random.seed(0)
+    key = run_key('run', {'k1': 0.5})
+    assert key == run_key('run', {'k1': 0.5})
+    assert key != run_key('run', {'k1': 0.6}) and key != run_key('run', {'k1': 0.5}, seed=1)
+    random.random()
+    assert key != run_key('run', {'k1': 0.5})
+
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 9)
+    for name in 'abc':
+        cache.put(name, {'values': random.Random(name).randbytes(2000)})
+    os.utime(cache.path('a'), (1, 1))
+    os.utime(cache.path('b'), (2, 2))
+    cache.get('a')
+    cache.max_bytes = cache.size() - 1
+    cache.evict()
+    assert not os.path.exists(cache.path('b'))
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_corrupted_entry_is_a_miss(tmp_path):
+    """
+    Tests that a truncated cache file is removed and the run computed again.
+    """
+    cache = ResultCache(str(tmp_path))
+    expected = cached_simulate_tumor_growth(2, 20, 0.74, 0.2, cache=cache, seed=3)
+    (path,) = [path for _, _, path in cache.entries()]
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) // 2)
+    assert cached_simulate_tumor_growth(2, 20, 0.74, 0.2, cache=cache, seed=3) == expected
+    assert len(cache.entries()) == 1 and cache.get(os.path.basename(path)[:-4]) is not None
@@ -0,0 +1,83 @@
+import os
+import random
+import pytest
+import numpy as np
+from code.functions import ca_model
+from code.functions.checkpoint import atomic_write
+from code.functions.sweep import parameter_grid, run_sweep, history_task
+
+calls = []
+
+
+def flaky_task(time_delay, **options):
+    """Sweep task that fails for time_delay 6 while calls is not cleared."""
+    calls.append(time_delay)
+    if time_delay == 6 and len(calls) < 10:
+        raise RuntimeError("preempted")
+    return history_task(time_delay, **options)
+
+
+@pytest.mark.parametrize('engine', ['loop', 'fast'])
+def test_simulation_resumes_bit_identical(engine, tmp_path, monkeypatch):
+    """
+    Tests that a run resumed from its checkpoint gives the same history as an uninterrupted run.
+    """
+    path = str(tmp_path / 'run.ckpt')
+    random.seed(42)
+    expected = ca_model.simulate_tumor_growth(3, 60, 0.74, 0.2, engine=engine)
+
+    step = ca_model.STEP_ENGINES[engine]
+
+    def crashing(M, g, *args):
+        if g == 45:
+            raise RuntimeError("preempted")
+        return step(M, g, *args)
+
+    monkeypatch.setitem(ca_model.STEP_ENGINES, engine, crashing)
+    random.seed(42)
+    with pytest.raises(RuntimeError):
+        ca_model.simulate_tumor_growth(3, 60, 0.74, 0.2, engine=engine, checkpoint_path=path,
+                                       checkpoint_interval=20)
+    monkeypatch.setitem(ca_model.STEP_ENGINES, engine, step)
+    assert os.path.exists(path)
+    with pytest.raises(ValueError):
+        ca_model.simulate_tumor_growth(4, 60, 0.74, 0.2, engine=engine, checkpoint_path=path)
+
+    random.seed(0)  # The random state comes from the checkpoint
+    resumed = ca_model.simulate_tumor_growth(3, 60, 0.74, 0.2, engine=engine, checkpoint_path=path,
+                                             checkpoint_interval=20)
+    assert resumed == expected
+    assert not os.path.exists(path)
+
+
+def test_sweep_resumes_pending_tasks(tmp_path):
+    """
+    Tests that a resumed sweep only runs the missing tasks and matches an uninterrupted sweep.
+    """
+    path = str(tmp_path / 'sweep.ckpt')
+    grid = parameter_grid(time_delay=[0, 3, 6, 9])
+    fixed = {'generations': 20, 'k1': 0.74, 'k2': 0.2, 'engine': 'fast'}
+    expected = run_sweep(history_task, grid, processes=1, fixed=fixed)
+
+    calls.clear()
+    with pytest.raises(RuntimeError):
+        run_sweep(flaky_task, grid, processes=1, fixed=fixed, checkpoint_path=path)
+    calls[:] = range(10)
+    resumed = run_sweep(flaky_task, grid, processes=1, fixed=fixed, checkpoint_path=path)
+    assert calls[10:] == [6, 9]
+    assert np.array_equal(resumed['Nc'], expected['Nc'])
+    assert not os.path.exists(path)
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    """
+    Tests that a failed write leaves the previous file and no temporary files behind.
+    """
+    path = tmp_path / 'data.csv'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path), 'w') as file:
+            file.write('half')
+            raise RuntimeError("crash")
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['data.csv']
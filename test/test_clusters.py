@@ -0,0 +1,73 @@
+import numpy as np
+from code.functions.analyze import find_clusters
+from code.functions import clusters
+from code.functions.clusters import label_boxes, label_clusters, ClusterTracker
+from code.functions.ca_model import CELL_N, CELL_C
+
+
+def test_label_clusters_matches_find_clusters():
+    """
+    Tests that the union-find labelling finds the same clusters as the depth-first search.
+    """
+    rng = np.random.default_rng(42)
+    for density in (0.2, 0.5, 0.7):
+        grid = np.where(rng.random((40, 30)) < density, CELL_C, CELL_N).astype(np.uint8)
+        labels, count = label_clusters(grid)
+        clusters = find_clusters(grid, 40, 30)
+        assert count == len(clusters)
+        for label, cluster in enumerate(clusters, start=1):
+            assert {tuple(cell) for cell in np.argwhere(labels == label)} == cluster
+
+
+def test_cluster_tracker_reports_events_and_counts():
+    """
+    Tests the tracker events on a hand-made sequence and its counts against full relabelling.
+    """
+    grid = np.zeros((5, 7), dtype=np.uint8)
+    grid[1, 1] = grid[1, 3] = grid[3, 5] = CELL_C
+    tracker = ClusterTracker(grid)
+    assert tracker.count == 3
+
+    grid[1, 2] = CELL_C  # joins the two clusters in row 1
+    grid[3, 5] = CELL_N  # removes the lone cell
+    grid[3, 1] = CELL_C  # a new cluster
+    events = tracker.update(grid)
+    assert events['deaths'] == [3]
+    assert len(events['births']) == 1
+    assert list(events['merges'].values()) == [[1, 2]]
+    merged = list(events['merges'])[0]
+
+    grid[1, 2] = CELL_N  # splits it again
+    events = tracker.update(grid)
+    assert list(events['splits']) == [merged]
+    assert tracker.count == label_clusters(grid)[1] == 3
+
+    rng = np.random.default_rng(0)
+    grid = np.where(rng.random((30, 30)) < 0.5, CELL_C, CELL_N).astype(np.uint8)
+    tracker = ClusterTracker(grid)
+    for _ in range(50):
+        flip = rng.random(grid.shape) < 0.03
+        grid = np.where(flip, CELL_C - grid, grid).astype(np.uint8)
+        tracker.update(grid)
+        labels, count = label_clusters(grid)
+        assert tracker.count == count
+        # The same partition of the cells, under other label numbers
+        pairs = np.unique(np.stack([tracker.labels.ravel(), labels.ravel()]), axis=1)
+        assert pairs.shape[1] == count + 1 and len(np.unique(pairs[0])) == count + 1
+        assert tracker.boxes == label_boxes(tracker.labels)
+
+
+def test_cluster_tracker_labels_only_around_changes(monkeypatch):
+    """
+    Tests that a local change is labelled in a window around it rather than over the whole grid.
+    """
+    grid = np.zeros((200, 200), dtype=np.uint8)
+    grid[10:20, 10:20] = grid[150:160, 150:160] = CELL_C
+    tracker = ClusterTracker(grid)
+    shapes = []
+    label_mask = clusters.label_mask
+    monkeypatch.setattr(clusters, 'label_mask', lambda mask: shapes.append(mask.shape) or label_mask(mask))
+    grid[20, 12] = CELL_C
+    events = tracker.update(grid)
+    assert shapes == [(12, 10)] and tracker.count == 2 and events['births'] == []
+    assert tracker.boxes[1] == (10, 21, 10, 20)
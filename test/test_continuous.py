@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from code.functions.continuous import (bifurcation_diagram, fixed_points, hopf_amplitude, hopf_delay,
+                                       limit_cycle_amplitude, solve_dde)
+
+K1, K2 = 0.74, 0.2
+
+
+def test_continuous_model_matches_analytic_results():
+    """
+    Tests that solutions settle on the fixed point below the Hopf delay, and oscillate with
+    the weakly nonlinear amplitude just beyond it.
+    """
+    critical = float(hopf_delay(K1, K2))
+    taus = critical * np.array([0.5, 0.9, 1 + 0.01 / (np.pi / 2)])
+    solution = solve_dde(taus, K1, K2, 2500)
+    assert solution.Nc.shape == (3, 2500) and np.array_equal(solution.generation, np.arange(2500))
+    equilibrium = fixed_points(K1, K2)
+    for field in ('Nc', 'Ne', 'Nd'):
+        assert np.allclose(solution[field][:2, -1], equilibrium[field], rtol=1e-3)
+    amplitude = limit_cycle_amplitude(solution.Nc, tail=0.2)
+    assert amplitude[0] < 1e-3 and amplitude[1] < 1e-3
+    assert amplitude[2] == pytest.approx(hopf_amplitude(taus[2], K1, K2), rel=0.03)
+
+
+def test_vectorized_solution_matches_single_points():
+    """Tests that parameter points solved together match solving each alone, with either method."""
+    taus, k1s = np.meshgrid([0.5, 2.0, 4.0], [0.6, 0.9], indexing='ij')
+    together = solve_dde(taus, k1s, K2, 100, method='fixed')
+    assert together.Nc.shape == (3, 2, 100)
+    for index in np.ndindex(taus.shape):
+        alone = solve_dde(taus[index], k1s[index], K2, 100, method='fixed')
+        assert np.allclose(alone.Nc, together.Nc[index], rtol=1e-6)
+    adaptive = solve_dde(taus, k1s, K2, 100, rtol=1e-6, atol=1e-3)
+    assert np.allclose(adaptive.Nc, solve_dde(taus, k1s, K2, 100, method='fixed', step=0.02).Nc, rtol=2e-3)
+    diagram = bifurcation_diagram([0.5, 4.0], K1, K2, 300)
+    assert diagram['amplitude'][0] < 1e-3 < diagram['amplitude'][1]
+    assert np.all(diagram['min'] <= diagram['max'])
@@ -0,0 +1,89 @@
+import random
+import numpy as np
+from code.functions.ca_model import initialize_grid, simulate_tumor_growth, vectorized_transitions
+from code.functions.clusters import count_clusters
+from code.functions.ensemble import batch_cluster_counts, simulate_ensemble
+
+
+def test_batch_matches_single_grids():
+    """
+    Tests that stepping and counting a batch gives the same result as every grid on its own.
+    """
+    rng = np.random.default_rng(1)
+    M = np.repeat(initialize_grid(41, 41, [(20, 20), (21, 20), (19, 20), (20, 19), (20, 21)])[None], 4, axis=0)
+    for _ in range(15):
+        uniforms = rng.random((2,) + M.shape)
+        mitosis_prob, dense = rng.random(4), rng.random(4) < 0.5
+        batch = vectorized_transitions(M, mitosis_prob, 0.2, dense, uniforms, (20, 20))
+        for i in range(4):
+            single = vectorized_transitions(M[i], mitosis_prob[i], 0.2, dense[i], uniforms[:, i], (20, 20))
+            assert np.array_equal(batch[i], single)
+        M = batch
+    assert np.array_equal(batch_cluster_counts(M), [count_clusters(grid) for grid in M])
+
+
+def test_single_replica_matches_fast_engine():
+    """
+    Tests that a one-replica growth ensemble follows the fast engine draw for draw.
+    """
+    random.seed(42)
+    history = simulate_tumor_growth(3, 40, 0.74, 0.2, engine='fast')
+    random.seed(42)
+    stats = simulate_ensemble(1, 40, 0.74, 0.2, time_delay=3, clusters=False)
+    assert np.array_equal(stats.mean['Nc'], [history[g]['Nc'] for g in range(40)])
+    assert np.allclose(stats.mean['R'], [history[g]['R'] for g in range(40)])
+    assert not stats.var['Nc'].any()
+
+
+def test_ensemble_statistics():
+    """
+    Tests the shapes and ordering of the ensemble statistics for every model.
+    """
+    for model in ('growth', 'metastasis', 'mean_field'):
+        stats = simulate_ensemble(8, 20, 0.74, 0.2, time_delay=2, model=model, rng=np.random.default_rng(0))
+        assert stats.mean['clusters'].shape == (20,) and stats.quantiles['Nc'].shape == (3, 20)
+        assert np.all(stats.quantile('Nc', 0.05) <= stats.quantile('Nc', 0.95))
+        assert np.all(stats.stderr('Nc') >= 0) and stats.mean['Nc'][0] == 5
+
+
+def test_draws_are_bounded_by_batch():
+    """
+    Tests that every draw covers at most batch replicas, and that a batch covering every replica is a single draw.
+    """
+    class RecordingRNG:
+        def __init__(self, seed):
+            self.rng, self.shapes = np.random.default_rng(seed), []
+
+        def random(self, shape):
+            self.shapes.append(shape)
+            return self.rng.random(shape)
+
+    for model in ('growth', 'mean_field'):
+        rng = RecordingRNG(0)
+        stats = simulate_ensemble(5, 10, 0.74, 0.2, model=model, rng=rng, batch=2, clusters=False)
+        assert [shape[1] for shape in rng.shapes] == [2, 2, 1] * 10
+        assert stats.mean['Nc'][0] == 5 and np.all(stats.mean['Nc'] > 0)
+    rng = RecordingRNG(0)
+    batched = simulate_ensemble(5, 10, 0.74, 0.2, rng=rng, batch=8, clusters=False)
+    assert rng.shapes == [(2, 5, 101, 101)] * 10
+    whole = simulate_ensemble(5, 10, 0.74, 0.2, rng=np.random.default_rng(0), batch=5, clusters=False)
+    assert np.array_equal(batched.mean['Nc'], whole.mean['Nc'])
+
+
+def test_non_square_grid_matches_fast_engine():
+    """
+    Tests that on a non-square grid the ensemble is centred like the engines and follows the fast engine.
+    """
+    from code.functions.ca_model import get_engine
+    from code.functions.geometry import grid_origin
+    origin = grid_origin(61, 41)
+    M = initialize_grid(61, 41, [origin, (origin[0] + 1, origin[1]), (origin[0] - 1, origin[1]),
+                                 (origin[0], origin[1] - 1), (origin[0], origin[1] + 1)])
+    random.seed(5)
+    history, state = {}, {}
+    for g in range(30):
+        M = get_engine('fast')(M, g, 2, history, 0.9, 0.1, state)
+    random.seed(5)
+    stats = simulate_ensemble(1, 30, 0.9, 0.1, time_delay=2, rows=61, cols=41, clusters=False)
+    assert np.array_equal(stats.mean['Nc'], [history[g]['Nc'] for g in range(30)])
+    assert np.allclose(stats.mean['R'], [history[g]['R'] for g in range(30)])
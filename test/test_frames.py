@@ -0,0 +1,78 @@
+import struct
+import zlib
+import numpy as np
+import pytest
+from code.functions.analyze import animate_simulate_tumor_growth
+from code.functions.ca_model import to_chars
+from code.functions.frames import PALETTE, AnimationWriter, FrameSequenceWriter, write_png
+
+
+def read_chunks(path):
+    """Split a PNG file into its (type, data) chunks, checking every CRC."""
+    with open(path, 'rb') as file:
+        content = file.read()
+    assert content[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, position = [], 8
+    while position < len(content):
+        length, = struct.unpack('>I', content[position:position + 4])
+        kind, data = content[position + 4:position + 8], content[position + 8:position + 8 + length]
+        crc, = struct.unpack('>I', content[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(kind + data)
+        chunks.append((kind, data))
+        position += 12 + length
+    return chunks
+
+
+def decode(data, width, height):
+    """Decode the 2-bit palette indices of one frame."""
+    rows = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(height, -1)
+    assert np.all(rows[:, 0] == 0)
+    pixels = (rows[:, 1:, None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3
+    return pixels.reshape(height, -1)[:, :width]
+
+
+def test_png_frames_hold_the_grid(tmp_path):
+    """Tests that single images, frame sequences and animations decode to the grid codes."""
+    rng = np.random.default_rng(0)
+    grids = rng.integers(0, 4, (3, 9, 11)).astype(np.uint8)
+
+    write_png(tmp_path / 'grid.png', to_chars(grids[0]), crop=(1, 8, 2, 11), scale=2)
+    chunks = dict(read_chunks(tmp_path / 'grid.png'))
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    assert (width, height) == (18, 14) and chunks[b'PLTE'] == bytes(np.ravel(PALETTE).tolist())
+    assert np.array_equal(decode(chunks[b'IDAT'], width, height)[::2, ::2], grids[0, 1:8, 2:11])
+
+    sequence = FrameSequenceWriter(tmp_path / 'frames', stride=2)
+    with AnimationWriter(tmp_path / 'run.png', stride=2) as animation:
+        for generation, grid in enumerate(grids):
+            sequence({'generation': generation, 'grid': grid})
+            animation({'generation': generation, 'grid': grid})
+    assert [path.rsplit('_', 1)[1] for path in map(str, sequence.paths)] == ['00000.png', '00002.png']
+    chunks = read_chunks(tmp_path / 'run.png')
+    assert struct.unpack('>II', dict(chunks)[b'acTL']) == (2, 0)
+    frames = [data for kind, data in chunks if kind == b'IDAT'] + \
+             [data[4:] for kind, data in chunks if kind == b'fdAT']
+    sequence_numbers = [struct.unpack('>I', data[:4])[0] for kind, data in chunks if kind in (b'fcTL', b'fdAT')]
+    assert sequence_numbers == list(range(3)) and chunks[-1][0] == b'IEND'
+    for frame, grid in zip(frames, grids[::2]):
+        assert np.array_equal(decode(frame, 11, 9), grid)
+
+
+def test_animate_simulation(tmp_path):
+    """Tests that a simulation streams one frame per stride generations into an animation."""
+    history = animate_simulate_tumor_growth(1, 10, 0.74, 0.2, tmp_path / 'run.png', stride=5, scale=2)
+    assert len(history) == 10
+    assert struct.unpack('>II', dict(read_chunks(tmp_path / 'run.png'))[b'acTL']) == (2, 0)
+
+
+def test_animation_without_frames_leaves_no_file(tmp_path):
+    """Tests that closing an animation without frames removes the file and raises a ValueError."""
+    path = tmp_path / 'empty.png'
+    with pytest.raises(ValueError):
+        with AnimationWriter(path):
+            pass
+    assert not path.exists()
+    with pytest.raises(KeyError):
+        with AnimationWriter(path):
+            raise KeyError('interrupted')
+    assert not path.exists()
@@ -0,0 +1,51 @@
+import json
+import random
+from code.functions import instrument
+from code.functions.ca_model import simulate_tumor_growth
+from code.functions.instrument import Observer, instrumented
+
+
+def test_exact_engines_report_the_same_counts():
+    """
+    Tests that engines with the same trajectory report the same draws and mitosis counts.
+    """
+    totals = {}
+    for engine in ('loop', 'active', 'compiled'):
+        random.seed(1)
+        with instrumented(memory=False) as recorder:
+            simulate_tumor_growth(3, 20, 0.74, 0.2, engine=engine)
+        totals[engine] = recorder.totals()
+        assert len(recorder.table()) == 20
+    for key in ('rng_draws', 'mitosis_attempts', 'mitosis_successes'):
+        assert totals['loop'][key] == totals['active'][key] == totals['compiled'][key]
+    assert totals['active']['cells_visited'] < totals['loop']['cells_visited']
+    assert not instrument.OBSERVERS
+
+
+def test_recorder_exports(tmp_path):
+    """
+    Tests the per-generation table, the trace file and the observer hooks.
+    """
+    phases = []
+
+    class PhaseNames(Observer):
+        def on_phase(self, name, start, duration):
+            phases.append(name)
+
+    observer = PhaseNames()
+    instrument.add_observer(observer)
+    try:
+        with instrumented() as recorder:
+            simulate_tumor_growth(2, 5, 0.74, 0.2, engine='fast')
+    finally:
+        instrument.remove_observer(observer)
+    assert phases.count('step') == phases.count('store_history') == 5
+
+    row = recorder.table()[0]
+    assert row['generation'] == 0 and row['step_seconds'] >= row['store_history_seconds'] > 0
+    assert row['peak_memory'] > 0 and row['cells_visited'] == 101 * 101
+    recorder.to_csv(tmp_path / 'table.csv')
+    assert (tmp_path / 'table.csv').read_text().startswith('generation,')
+    recorder.to_chrome_trace(tmp_path / 'trace.json')
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert {event['ph'] for event in events} == {'X', 'C'}
@@ -93,3 +93,267 @@ def test_simulate_tumor_growth_with_clusters():
         comparison_result, message = compare_outputs(actual_output, expected_output)
 
         assert comparison_result, message
+
+
+def test_fast_engine_matches_loop_divisions():
+    """
+    Tests that the vectorized engine places daughters exactly like the loop engine.
+
+    With a mitosis probability above one every cancer cell divides whatever the
+    random draws, so the resulting cancer cells must agree cell for cell.
+    """
+    from code.functions.ca_model import (simulate_tumor_growth_one_step,
+                                         simulate_tumor_growth_one_step_fast, ROWS, COLS,
+                                         CELL_N, CELL_C, CELL_E)
+    rng = np.random.default_rng(0)
+    M = rng.choice(np.array([CELL_N, CELL_C, CELL_E], dtype=np.uint8), size=(ROWS, COLS), p=[0.8, 0.1, 0.1])
+    for _ in range(3):
+        loop_M = simulate_tumor_growth_one_step(M, 0, 1, {}, 100, 0)
+        fast_M = simulate_tumor_growth_one_step_fast(M, 0, 1, {}, 100, 0)
+        assert np.array_equal(loop_M == CELL_C, fast_M == CELL_C)
+        M = loop_M
+
+
+def test_fast_engine_is_reproducible():
+    """
+    Tests that the fast engine gives the same history for the same random seed.
+    """
+    random.seed(42)
+    first = simulate_tumor_growth(2, 30, 0.7, 0.2, engine='fast')
+    random.seed(42)
+    second = simulate_tumor_growth(2, 30, 0.7, 0.2, engine='fast')
+    assert compare_outputs(first, second)[0]
+    assert first[29]['Nc'] > 0
+
+
+def test_character_grids_are_converted_to_codes():
+    """
+    Tests the compatibility layer between character grids and uint8 cell codes.
+    """
+    from code.functions.ca_model import to_codes, to_chars, sum_cell_type, initialize_grid
+    chars = np.array([['N', 'C', 'E'], ['D', 'C', 'N']])
+    codes = to_codes(chars)
+    assert codes.dtype == np.uint8
+    assert np.array_equal(to_chars(codes), chars)
+    assert sum_cell_type(chars, 'C') == sum_cell_type(codes, 'C') == 2
+    assert initialize_grid().dtype == np.uint8
+
+
+@pytest.mark.parametrize('engine', ['loop', 'fast', 'active', 'compiled'])
+def test_incremental_counters_match_recount(engine, monkeypatch):
+    """
+    Tests that the incremental counters agree with a full recount every generation.
+    """
+    from code.functions import ca_model
+    monkeypatch.setattr(ca_model, 'DEBUG_COUNTERS', True)
+    random.seed(42)
+    incremental = simulate_tumor_growth(3, 40, 0.74, 0.2, engine=engine, incremental=True)
+    random.seed(42)
+    rescanned = simulate_tumor_growth(3, 40, 0.74, 0.2, engine=engine)
+    for g, entry in rescanned.items():
+        assert incremental[g]['Nc'] == entry['Nc'] and incremental[g]['dense'] == entry['dense']
+        assert np.isclose(incremental[g]['R'], entry['R'])
+
+
+@pytest.mark.parametrize('backend', ['array', 'ring'])
+def test_history_backends_match_dictionary(backend):
+    """
+    Tests that the array and ring history backends record the same values as the dictionary.
+    """
+    from code.functions.history import history_columns
+    random.seed(42)
+    expected = simulate_tumor_growth(4, 30, 0.74, 0.2)
+    random.seed(42)
+    history = simulate_tumor_growth(4, 30, 0.74, 0.2, history_backend=backend)
+    assert list(history) == (list(range(30)) if backend == 'array' else list(range(25, 30)))
+    for g in history:
+        comparison_result, message = compare_outputs(history[g], expected[g])
+        assert comparison_result, message
+    assert -1 not in history and 30 not in history
+    assert (24 in history) == (backend == 'array')
+    columns = history_columns(history)
+    assert np.array_equal(columns['Nc'], [expected[g]['Nc'] for g in history])
+    assert columns['dense'].dtype == bool
+
+
+@pytest.mark.parametrize('engine', ['active', 'compiled'])
+def test_exact_engine_matches_stored_data(engine):
+    """
+    Tests that the active and compiled engines reproduce the stored loop engine data exactly.
+    """
+    data_file_path = "test/data/simulate_tumor_growth_data.json"
+    if not os.path.exists(data_file_path):
+        data_file_path = "data/simulate_tumor_growth_data.json"
+    with open(data_file_path, 'r') as file:
+        data = json.load(file)
+
+    for item in data:
+        input_data = item['input']
+        expected_output = {int(k): v for k, v in item['output'].items()}
+        sig = inspect.signature(simulate_tumor_growth)
+        relevant_args = {k: v for k, v in input_data.items() if k in sig.parameters}
+        random.seed(42)
+        actual_output = simulate_tumor_growth(**relevant_args, engine=engine)
+        comparison_result, message = compare_outputs(actual_output, expected_output)
+        assert comparison_result, message
+
+
+def test_active_engine_matches_loop_variants():
+    """
+    Tests that the active metastasis and mean field engines match their loop engines.
+    """
+    from code.functions import mean_field
+    from code.functions.ca_model import METASTASIS_STEP_ENGINES, initialize_grid
+    grids = {}
+    for engine in ('loop', 'active'):
+        random.seed(7)
+        M, state = initialize_grid(), {}
+        for _ in range(25):
+            M = METASTASIS_STEP_ENGINES[engine](M, 0.9, 0.1, 101, 101, (50, 50), state)
+        grids[engine] = M
+    assert np.array_equal(grids['loop'], grids['active'])
+
+    random.seed(7)
+    expected = mean_field.simulate_tumor_growth(2, 15)
+    random.seed(7)
+    assert mean_field.simulate_tumor_growth(2, 15, engine='active') == expected
+    with pytest.raises(ValueError):
+        mean_field.simulate_tumor_growth(2, 15, engine='fast')
+
+
+def test_mean_field_active_engine_counts_once_per_step(monkeypatch):
+    """
+    Tests that the active mean field engine counts the grid once per step rather than once per cancer cell.
+    """
+    from code.functions import ca_model, mean_field
+    scans = []
+    for name in ('count_cells', 'sum_cell_type', 'calculate_n_prime'):
+        full_scan = getattr(ca_model, name)
+        monkeypatch.setattr(ca_model, name, lambda *args, full_scan=full_scan, **kwargs:
+                            scans.append(1) or full_scan(*args, **kwargs))
+    history = mean_field.simulate_tumor_growth(2, 15, engine='active')
+    assert history[0]['Nc'] == 5 and history[1]['Nc'] > 0
+    assert len(scans) == 15
+
+
+@pytest.mark.parametrize('interpreted', [False, True])
+def test_compiled_engine_matches_loop(interpreted, monkeypatch):
+    """
+    Tests that the compiled metastasis engine, and its pure Python fallback, match the loop engine
+    and leave random in the same state.
+    """
+    from code.functions import kernels
+    from code.functions.ca_model import get_engine, initialize_grid
+    if interpreted:
+        monkeypatch.setattr(kernels, 'step_cells', getattr(kernels.step_cells, 'py_func', kernels.step_cells))
+    grids, after = {}, {}
+    for engine in ('loop', 'compiled'):
+        random.seed(3)
+        M = initialize_grid()
+        for _ in range(20):
+            M = get_engine(engine, metastasis=True)(M, 0.9, 0.1, 101, 101, (50, 50))
+        grids[engine], after[engine] = M, random.random()
+    assert np.array_equal(grids['loop'], grids['compiled'])
+    assert after['loop'] == after['compiled']
+    with pytest.raises(ValueError):
+        get_engine('missing')
+
+
+def test_compiled_engine_falls_back_when_numba_fails_to_import(monkeypatch):
+    """
+    Tests that a numba which is installed but fails to import leaves the compiled engine interpreted.
+    """
+    import sys
+    from code.functions import kernels
+    from code.functions.ca_model import get_engine, initialize_grid
+    monkeypatch.setitem(sys.modules, 'numba', None)  # Importing it then raises ImportError
+    monkeypatch.delattr(kernels, 'step_cells', raising=False)
+    monkeypatch.setattr(kernels, 'COMPILED', True)
+    grids = {}
+    for engine in ('loop', 'compiled'):
+        random.seed(3)
+        M = initialize_grid()
+        for _ in range(5):
+            M = get_engine(engine, metastasis=True)(M, 0.9, 0.1, 101, 101, (50, 50))
+        grids[engine] = M
+    assert kernels.step_cells is kernels._step_cells and not kernels.COMPILED
+    assert np.array_equal(grids['loop'], grids['compiled'])
+
+def test_engines_match_on_other_grid_sizes():
+    """
+    Tests that the exact growth engines agree on a grid other than 101 x 101, and that the
+    geometry tables are shared between runs and measured from the given origin.
+    """
+    from code.functions.ca_model import get_engine, initialize_grid, quadrant_map
+    from code.functions.geometry import get_geometry
+    assert get_geometry(61, 41) is get_geometry(61, 41, (30, 20))
+    assert quadrant_map(61, 41)[30, 20] == 1 and quadrant_map(61, 41)[31, 20] == 2
+    assert get_geometry(61, 41, (10, 10)).quadrants[10, 11] == 0
+
+    start = initialize_grid(61, 41, [(30, 20), (31, 20), (29, 20), (30, 19), (30, 21)])
+    grids, after = {}, {}
+    for engine in ('loop', 'active', 'compiled'):
+        random.seed(5)
+        M, history, state = start, {}, {}
+        for g in range(30):
+            M = get_engine(engine)(M, g, 2, history, 0.9, 0.1, state)
+        grids[engine], after[engine] = M, random.random()
+    assert np.array_equal(grids['loop'], grids['active'])
+    assert np.array_equal(grids['loop'], grids['compiled'])
+    assert after['loop'] == after['active'] == after['compiled']
+
+
+@pytest.mark.parametrize('interpreted', [False, True])
+def test_counter_based_stream_matches_across_engines(interpreted, monkeypatch):
+    """
+    Tests that with a seed every engine gives the same trajectory, that random is left alone,
+    and that the draws of a tile or a list of cells are those of the whole grid.
+    """
+    from code.functions import kernels
+    from code.functions.ca_model import get_engine, initial_state, initialize_grid
+    from code.functions.counter_rng import CounterRNG
+    if interpreted:
+        monkeypatch.setattr(kernels, 'step_cells', getattr(kernels.step_cells, 'py_func', kernels.step_cells))
+    histories, grids = {}, {}
+    for engine in ('loop', 'fast', 'active', 'compiled'):
+        random.seed(1)
+        history = simulate_tumor_growth(2, 30, 0.9, 0.1, engine=engine, incremental=True, seed=11)
+        histories[engine] = [(history[g]['Nc'], history[g]['Ne'], history[g]['Nd']) for g in range(30)]
+        assert random.random() == random.Random(1).random()
+        M = initialize_grid()
+        state = initial_state(M, seed=4)
+        for _ in range(25):
+            M = get_engine(engine, metastasis=True)(M, 0.9, 0.1, 101, 101, (50, 50), state)
+        grids[engine] = M
+    for engine in ('fast', 'active', 'compiled'):
+        assert histories[engine] == histories['loop']
+        assert np.array_equal(grids[engine], grids['loop'])
+    other = simulate_tumor_growth(2, 30, 0.9, 0.1, seed=12)
+    assert histories['loop'] != [(other[g]['Nc'], other[g]['Ne'], other[g]['Nd']) for g in range(30)]
+
+    rng = CounterRNG(4, replica=2)
+    whole = rng.uniforms(7, 101, 101)
+    assert np.array_equal(rng.uniforms(7, 101, 101, (10, 40, 60, 101)), whole[:, 10:40, 60:])
+    assert np.array_equal(rng.cell_draws(7, 101, [3, 50], [9, 1]), whole[:, [3, 50], [9, 1]])
+    assert not np.array_equal(CounterRNG(4, replica=3).uniforms(7, 101, 101), whole)
+    assert 0 <= whole.min() and whole.max() < 1
+
+
+def test_package_import_is_lazy():
+    """
+    Tests that importing the model and analysis code runs no simulation and loads neither the
+    plotting stack, numba nor the process pool, and that the self-checks run on demand without touching random.
+    """
+    import subprocess
+    import sys
+    code = ("import random, sys\n"
+            "import code.functions as functions\n"
+            "assert 'code.functions.ca_model' not in sys.modules\n"
+            "import code.functions.analyze\n"
+            "assert random.getstate() == random.Random(42).getstate()\n"
+            "assert not {'matplotlib', 'scipy', 'numba', 'concurrent.futures', 'multiprocessing'} & set(sys.modules)\n"
+            "assert not {'code.functions.frames', 'code.functions.stream', 'code.functions.sweep'} & set(sys.modules)\n"
+            "assert functions.simulate_tumor_growth is sys.modules['code.functions.ca_model'].simulate_tumor_growth\n"
+            "functions.self_check()\n"
+            "assert random.getstate() == random.Random(42).getstate()\n")
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)) or '.')
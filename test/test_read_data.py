@@ -0,0 +1,76 @@
+import csv
+import numpy as np
+from code.functions.read_data import read_matrix
+from code.functions.trajectory import Trajectory, TrajectoryWriter, convert_matrices_csv, pack_grid, unpack_grid
+from code.functions.ca_model import CELL_TYPES
+
+
+def test_trajectory_file_matches_csv(tmp_path):
+    """
+    Tests that read_matrix gives the same grids from a CSV file and its trajectory file.
+    """
+    rows, cols, generations, taus = 7, 9, 4, 3
+    rng = np.random.default_rng(42)
+    grids = rng.integers(0, 4, size=(taus, generations, rows, cols)).astype(np.uint8)
+    csv_path = tmp_path / 'matrices_data.csv'
+    with open(csv_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for M in grids.reshape(-1, rows, cols):
+            writer.writerow(CELL_TYPES[M].flatten().tolist())
+
+    trajectory = convert_matrices_csv(csv_path, tmp_path / 'matrices_data.traj', rows, cols, generations,
+                                      params={'k1': 0.74}, seed=42)
+    assert trajectory.params == {'k1': 0.74} and trajectory.seed == 42
+    from_csv = read_matrix(rows, cols, generations, csv_path)
+    from_trajectory = read_matrix(rows, cols, generations, tmp_path / 'matrices_data.traj')
+    assert len(from_trajectory) == len(from_csv) == taus
+    for tau in range(taus):
+        for g in range(generations):
+            assert np.array_equal(from_trajectory[tau][g], grids[tau, g])
+            assert np.array_equal(from_csv[tau][g], grids[tau, g])
+    assert np.array_equal(unpack_grid(pack_grid(grids[0, 0]), rows, cols), grids[0, 0])
+
+
+def test_trajectory_slices_and_interrupted_runs(tmp_path):
+    """
+    Tests that a range of generations reads as one array and that an unclosed file holds its complete frames.
+    """
+    rows, cols, generations = 5, 6, 4
+    grids = np.random.default_rng(1).integers(0, 4, size=(7, rows, cols)).astype(np.uint8)
+    path = tmp_path / 'interrupted.traj'
+    writer = TrajectoryWriter(path, rows, cols, generations)
+    for M in grids:
+        writer.write(M)
+    writer.file.flush()
+    with open(path, 'ab') as file:
+        file.write(b'\x00')  # A partly written frame
+
+    trajectory = Trajectory(path)  # The writer was never closed
+    assert trajectory.frames == 7 and len(trajectory) == 2
+    assert len(trajectory[0]) == 4 and len(trajectory[1]) == 3
+    assert np.array_equal(trajectory[0][1:3], grids[1:3])
+    assert np.array_equal(trajectory[1][::-1], grids[6:3:-1])
+    assert np.array_equal(trajectory[1][-1], grids[6])
+    assert np.array_equal(trajectory.grids(0, 0, 4, 2), grids[0:4:2])
+    assert np.array_equal(unpack_grid(np.stack([pack_grid(M) for M in grids]), rows, cols), grids)
+    writer.file.close()
+
+def test_load_history_infers_runs_and_caches(tmp_path):
+    """
+    Tests that load_history shapes the CSV by run and reuses its binary cache until the CSV changes.
+    """
+    from code.functions.read_data import load_history
+    csv_path = tmp_path / 'history_data.csv'
+    lines = ['Nc,Ne,Nd,R,dense']
+    for tau in range(3):
+        lines += ['5,0,0,0.8,True', f'{9 + tau},0,0,1.2,True', f'{12 + tau},1,0,1.5,False']
+    csv_path.write_text('\n'.join(lines) + '\n')
+
+    history = load_history(csv_path)
+    assert history['Nc'].shape == (3, 3)
+    assert history['Nc'][2].tolist() == [5, 11, 14]
+    assert history['dense'].dtype == bool and history['dense'][1].tolist() == [True, True, False]
+    assert isinstance(load_history(csv_path)['Nc'], np.memmap)
+
+    csv_path.write_text('\n'.join(lines[:7]) + '\n')
+    assert load_history(csv_path)['Nc'].shape == (2, 3)
@@ -0,0 +1,59 @@
+import io
+import random
+import numpy as np
+from code.functions import instrument
+from code.functions.ca_model import iter_simulation, simulate_tumor_growth, simulate_tumor_growth_with_clusters
+from code.functions.clusters import count_clusters
+from code.functions.read_data import read_matrix
+from code.functions.stream import ClusterCounter, Collector, HistoryCSVWriter, MatrixCSVWriter, run_stream
+
+
+def test_stream_matches_drivers():
+    """
+    Tests that the snapshots hold the history counts and the grids of the drivers.
+    """
+    random.seed(42)
+    history, grids = simulate_tumor_growth_with_clusters(2, 30, 0.74, 0.2, engine='fast')
+    random.seed(42)
+    snapshots = list(iter_simulation(2, 30, 0.74, 0.2, engine='fast', stride=7, detail='grid'))
+    assert [snapshot['generation'] for snapshot in snapshots] == [0, 7, 14, 21, 28]
+    for snapshot in snapshots:
+        g = snapshot['generation']
+        assert snapshot['Nc'] == history[g]['Nc'] and np.array_equal(snapshot['grid'], grids[g])
+
+    random.seed(42)
+    expected = simulate_tumor_growth(2, 30, 0.74, 0.2, engine='fast')
+    random.seed(42)
+    collector, counter = run_stream(iter_simulation(2, 30, 0.74, 0.2, engine='fast', detail='labels'),
+                                    Collector('Nc', 'R'), ClusterCounter())
+    assert np.array_equal(collector['Nc'], [expected[g]['Nc'] for g in range(30)])
+    assert counter.clusters == [count_clusters(grid) for grid in grids]
+
+
+def test_stream_consumers_write_csv(tmp_path):
+    """
+    Tests that the CSV consumers write files the readers load back, timed as the write_csv phase.
+    """
+    phases = []
+
+    class PhaseNames(instrument.Observer):
+        def on_phase(self, name, start, duration):
+            phases.append(name)
+
+    path = tmp_path / 'matrices.csv'
+    history_file = io.StringIO()
+    random.seed(3)
+    observer = PhaseNames()
+    instrument.add_observer(observer)
+    try:
+        with open(path, mode='w', newline='', encoding='utf-8') as file:
+            clusters = ClusterCounter()
+            run_stream(iter_simulation(1, 6, 0.74, 0.2, engine='fast', detail='grid'),
+                       MatrixCSVWriter(file), HistoryCSVWriter(history_file, header=True), clusters)
+    finally:
+        instrument.remove_observer(observer)
+    assert phases.count('write_csv') == 12
+    all_M = read_matrix(101, 101, 6, str(path))
+    assert len(all_M) == 1 and [count_clusters(M) for M in all_M[0]] == clusters.clusters
+    lines = history_file.getvalue().splitlines()
+    assert lines[0] == 'Nc,Ne,Nd,R,dense' and len(lines) == 7 and lines[1].startswith('5,0,0,')
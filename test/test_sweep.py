@@ -0,0 +1,44 @@
+import numpy as np
+from code.functions.sweep import parameter_grid, run_sweep, history_task, metastasis_task, trajectory_task
+
+
+def test_sweep_results_do_not_depend_on_process_count():
+    """
+    Tests that a sweep gives identical numbers serially and on a process pool.
+    """
+    grid = parameter_grid(time_delay=[0, 3, 6])
+    fixed = {'generations': 20, 'k1': 0.74, 'k2': 0.2, 'engine': 'fast'}
+    serial = run_sweep(history_task, grid, processes=1, fixed=fixed)
+    parallel = run_sweep(history_task, grid, processes=2, fixed=fixed)
+    assert serial['Nc'].shape == (3, 20)
+    for field in ('Nc', 'Ne', 'Nd', 'R', 'dense'):
+        assert np.array_equal(serial[field], parallel[field])
+    # Tasks are seeded independently, so different delays do not share one trajectory
+    assert not np.array_equal(serial['Nc'][0], serial['Nc'][1])
+
+
+def test_metastasis_sweep_has_grid_shape():
+    """
+    Tests that a k1 x k2 sweep is stored with one Tm per grid point.
+    """
+    grid = parameter_grid(k1=[0.3, 0.6], k2=[0.2, 0.3, 0.4])
+    result = run_sweep(metastasis_task, grid, processes=1,
+                       fixed={'generations': 5, 'rows': 21, 'cols': 21, 'engine': 'fast'})
+    assert result['Tm'].shape == (2, 3)
+    assert result['clusters'].shape == (2, 3, 5)
+
+
+def test_trajectory_task_keeps_every_grid():
+    """
+    Tests that the trajectory task records the history and packed grids of the same run.
+    """
+    from code.functions.ca_model import CELL_C
+    from code.functions.trajectory import unpack_grid
+    fixed = {'generations': 15, 'k1': 0.74, 'k2': 0.2}
+    result = run_sweep(trajectory_task, parameter_grid(time_delay=[0, 4]), processes=1, fixed=fixed)
+    assert np.array_equal(result['Nc'], run_sweep(history_task, parameter_grid(time_delay=[0, 4]), processes=1,
+                                                  fixed=fixed)['Nc'])
+    assert result['grids'].shape[:2] == (2, 15)
+    # The grid of generation g is the result of its step, so it holds the cancer cells of g + 1
+    last = unpack_grid(result['grids'][1, 13], 101, 101)
+    assert np.count_nonzero(last == CELL_C) == result['Nc'][1, 14]
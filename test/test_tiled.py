@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from code.functions.ca_model import iter_simulation
+from code.functions.clusters import count_clusters
+from code.functions.tiled import stitch_clusters, label_tile, simulate_tiled, tile_bounds
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_tiled_run_matches_fast_engine(processes):
+    """
+    Tests that a tiled run, in this process or in workers, follows the fast engine with the
+    same seed, and that the stitched cluster counts are those of the whole grid.
+    """
+    expected = list(iter_simulation(1, 50, 0.9, 0.3, engine='fast', detail='labels', stride=5, seed=5,
+                                    history_backend='dict'))
+    history, clusters = simulate_tiled(1, 50, 0.9, 0.3, 5, 101, 101, tiles=(4, 3), processes=processes,
+                                       cluster_stride=5, history_backend='dict')
+    for snapshot in expected:
+        g = snapshot['generation']
+        assert (history[g]['Nc'], history[g]['Ne'], history[g]['Nd']) == (snapshot['Nc'], snapshot['Ne'], snapshot['Nd'])
+        assert np.isclose(history[g]['R'], snapshot['R'])
+        assert clusters[g] == snapshot['clusters']
+    assert max(clusters.values()) > 10
+
+
+def test_clusters_are_stitched_across_tiles():
+    """
+    Tests that clusters crossing tile edges, or wrapping around a tile corner, are counted once.
+    """
+    rng = np.random.default_rng(0)
+    grid = (rng.random((40, 30)) < 0.55).astype(np.uint8)
+    bounds = tile_bounds(40, 30, (3, 4))
+    grids, labels = np.stack([grid, grid]), np.zeros(grid.shape, dtype=np.int32)
+    counts = [label_tile(grids, labels, 0, tile) for tile in bounds]
+    assert sum(counts) > count_clusters(grid)
+    assert stitch_clusters(labels, bounds, counts) == count_clusters(grid)